@@ -1,58 +1,203 @@
 # encoding: utf-8
 
+import asyncio
+import functools
+import logging
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 
-from kaspy.kaspa_clients import RPCClient
+from emission import EMISSION
 
-from constants import DEFLATIONARY_TABLE, TOTAL_COIN_SUPPLY
+_logger = logging.getLogger(__name__)
+
+DEFAULT_KASPAD_PORT = 16110
 
 
 class KaspaInterfaceException(Exception): pass
 
 
-@contextmanager
-def kaspa_connection():
+def rpc_client():
     """
+    :rtype: kaspy.kaspa_clients.RPCClient
+    """
+    # imported here, so the bot runs without kaspy if no kaspad is used
+    from kaspy.kaspa_clients import RPCClient
+    return RPCClient()
 
-    :return:
-    :rtype: RPCClient
+
+def kaspad_hosts():
+    """
+    Parses KASPAD_HOST, which may list several nodes for failover: "node1:16110,node2"
+    :return: list of (host, port)
     """
-    cli = RPCClient()
-    cli.connect(os.environ["KASPAD_HOST"], os.environ["KASPAD_PORT"])
+    hosts = []
+    for entry in os.getenv("KASPAD_HOST", "").split(","):
+        if entry := entry.strip():
+            host, _, port = entry.partition(":")
+            hosts.append((host, int(port or os.getenv("KASPAD_PORT", DEFAULT_KASPAD_PORT))))
+    return hosts
 
-    yield cli
-    cli.close()
 
+class KaspadConnectionPool(object):
+    """
+    Pool of persistent RPC connections to kaspad.
 
-def get_stats():
-    with kaspa_connection() as cli:
-        stats = dict()
-        blockdag_info = cli.request('getBlockDagInfoRequest', timeout=4)['getBlockDagInfoResponse']
-        stats['block_count'] = blockdag_info['blockCount']
-        stats['header_count'] = blockdag_info['headerCount']
-        stats['pruning_point'] = blockdag_info['pruningPointHash']
-        stats['parent_hashes'] = blockdag_info['virtualParentHashes']
-        stats['tip_hashes'] = blockdag_info['tipHashes']
-        stats['timestamp'] = blockdag_info['pastMedianTime']
-        stats['difficulty'] = blockdag_info['difficulty']
-        stats['hashrate'] = stats['difficulty'] * 2
-        stats['daa_score'] = blockdag_info['virtualDaaScore']
+    New connections go to the first node that answers, starting with the last working one, so a
+    failing node is skipped. Broken connections are dropped and replaced on the next checkout.
+    """
 
-    return stats
+    def __init__(self, hosts, size=4, timeout=4, client_factory=rpc_client):
+        self._hosts = hosts
+        self._size = size
+        self._timeout = timeout
+        self._client_factory = client_factory
 
+        self._idle = []
+        self._lock = threading.Lock()
+        self._host_index = 0
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="kaspad")
 
-def get_balance(address):
+    def _check(self, cli):
+        cli.request("getInfoRequest", timeout=self._timeout)["getInfoResponse"]
+
+    def _connect(self):
+        if not self._hosts:
+            raise KaspaInterfaceException("No kaspad host configured (KASPAD_HOST).")
+
+        for i in range(len(self._hosts)):
+            index = (self._host_index + i) % len(self._hosts)
+            host, port = self._hosts[index]
+            cli = None
+            try:
+                cli = self._client_factory()
+                cli.connect(host, port)
+                self._check(cli)
+                self._host_index = index
+                return cli
+            except Exception:
+                _logger.warning(f'kaspad {host}:{port} not available, trying next node.')
+                if cli is not None:
+                    self._close(cli)
+
+        raise KaspaInterfaceException("No kaspad node available.")
+
+    @staticmethod
+    def _close(cli):
+        try:
+            cli.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def connection(self):
+        """
+        Checks out a connection, it is returned to the pool unless the request failed
+        """
+        with self._lock:
+            cli = self._idle.pop() if self._idle else None
+
+        if cli is None:
+            cli = self._connect()
+
+        try:
+            yield cli
+        except Exception:
+            self._close(cli)
+            raise
+
+        with self._lock:
+            if len(self._idle) < self._size:
+                self._idle.append(cli)
+                cli = None
+
+        if cli is not None:
+            self._close(cli)
+
+    def request(self, command, payload=None, timeout=None):
+        with self.connection() as cli:
+            return cli.request(command, payload, timeout=timeout or self._timeout)
+
+    def batch(self, requests, timeout=None):
+        """
+        Sends several requests over one connection
+        :param requests: list of (command, payload)
+        :return: list of responses
+        """
+        with self.connection() as cli:
+            return [cli.request(command, payload, timeout=timeout or self._timeout) for command, payload in requests]
+
+    async def request_async(self, command, payload=None, timeout=None):
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, functools.partial(self.request, command, payload, timeout))
+
+    async def batch_async(self, requests, timeout=None):
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, functools.partial(self.batch, requests, timeout))
+
+    def check_health(self):
+        """
+        Drops idle connections which don't answer anymore
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+
+        for cli in idle:
+            try:
+                self._check(cli)
+            except Exception:
+                _logger.warning('Dropping broken kaspad connection.')
+                self._close(cli)
+                continue
+
+            with self._lock:
+                self._idle.append(cli)
+
+    async def run(self, interval=30):
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.get_running_loop().run_in_executor(self._executor, self.check_health)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+
+        for cli in idle:
+            self._close(cli)
+
+        self._executor.shutdown(wait=False)
+
+
+POOL = KaspadConnectionPool(kaspad_hosts())
+
+
+@contextmanager
+def kaspa_connection():
     """
-    Gets balance of a wallet
-    :param address: kaspa address
-    :return: balance in KAS
+
+    :return:
+    :rtype: RPCClient
     """
-    with kaspa_connection() as cli:  # type: RPCClient
-        balance = cli.request("getBalanceByAddressRequest",
-                              {'address': address},
-                              timeout=4)
+    with POOL.connection() as cli:
+        yield cli
+
 
+def _stats_from_blockdag_info(blockdag_info):
+    stats = dict()
+    stats['block_count'] = blockdag_info['blockCount']
+    stats['header_count'] = blockdag_info['headerCount']
+    stats['pruning_point'] = blockdag_info['pruningPointHash']
+    stats['parent_hashes'] = blockdag_info['virtualParentHashes']
+    stats['tip_hashes'] = blockdag_info['tipHashes']
+    stats['timestamp'] = blockdag_info['pastMedianTime']
+    stats['difficulty'] = blockdag_info['difficulty']
+    stats['hashrate'] = stats['difficulty'] * 2
+    stats['daa_score'] = blockdag_info['virtualDaaScore']
+    return stats
+
+
+def _balance_from_response(balance):
     try:
         response = balance["getBalanceByAddressResponse"]
         if "balance" in response:
@@ -66,6 +211,44 @@ def get_balance(address):
         raise KaspaInterfaceException(balance)
 
 
+def get_stats():
+    return _stats_from_blockdag_info(POOL.request('getBlockDagInfoRequest')['getBlockDagInfoResponse'])
+
+
+def get_balance(address):
+    """
+    Gets balance of a wallet
+    :param address: kaspa address
+    :return: balance in KAS
+    """
+    return _balance_from_response(POOL.request("getBalanceByAddressRequest", {'address': address}))
+
+
+async def get_blockdag_info_async():
+    return (await POOL.request_async('getBlockDagInfoRequest'))['getBlockDagInfoResponse']
+
+
+async def get_stats_async():
+    return _stats_from_blockdag_info(await get_blockdag_info_async())
+
+
+async def get_balance_async(address):
+    return _balance_from_response(await POOL.request_async("getBalanceByAddressRequest", {'address': address}))
+
+
+async def get_stats_and_balances_async(addresses):
+    """
+    Blockdag stats and balances of several addresses over one connection
+    :return: stats, list of balances in KAS
+    """
+    responses = await POOL.batch_async([('getBlockDagInfoRequest', None)] +
+                                       [("getBalanceByAddressRequest", {'address': address})
+                                        for address in addresses])
+
+    return (_stats_from_blockdag_info(responses[0]['getBlockDagInfoResponse']),
+            [_balance_from_response(response) for response in responses[1:]])
+
+
 def get_circulating_supply():
     stats = get_stats()
     coin_supply = _calc_circ_supply_from_daascore(int(stats["daa_score"]))
@@ -78,17 +261,11 @@ def _calc_circ_supply_from_daascore(target_daa_score):
     :param target_daa_score:
     :return:
     """
-    if target_daa_score >= list(DEFLATIONARY_TABLE.values())[-1]['daa_range'].start:
-        return TOTAL_COIN_SUPPLY
-    coin_supply = 0
-    for def_phase in DEFLATIONARY_TABLE.values():
-        if target_daa_score in def_phase['daa_range']:
-            coin_supply += def_phase['reward_per_daa'] * (target_daa_score - def_phase['daa_range'].start)
-            break
-        else:
-            coin_supply += def_phase['reward_per_daa'] * (
-                    def_phase['daa_range'].stop - def_phase['daa_range'].start - 1)
-    return round(coin_supply)
+    # after the last phase the whole supply is mined
+    if target_daa_score >= EMISSION.starts[-1]:
+        return EMISSION.max_supply
+
+    return round(EMISSION.supply_at(target_daa_score))
 
 
 if __name__ == '__main__':
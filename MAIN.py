@@ -1,33 +1,47 @@
 # encoding: utf-8
 import asyncio.exceptions
+import functools
+import html
 import logging
 import math
 import os
 import re
-import threading
+import secrets
+import signal
 import time
 from datetime import datetime
 
-import aiohttp
-import qrcode
-import requests
-from PIL import Image
-from aiocache import cached
-from qrcode.image.styledpil import StyledPilImage
-from qrcode.image.styles.colormasks import HorizontalGradiantColorMask
-from qrcode.image.styles.moduledrawers import RoundedModuleDrawer
 from telebot.apihelper import ApiTelegramException
 from telebot.async_telebot import AsyncTeleBot
-from telebot import TeleBot
-from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton, InputMedia
+from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
 
+import KaspaInterface
+import http_client
 import kaspa_api
-import tipping
+from broadcast import Broadcaster
+from charts import CHARTS
+from chat_admins import ChatAdminCache
+from chat_registry import ChatRegistry
 from constants import TOTAL_COIN_SUPPLY, DEV_MINING_ADDR, DEV_DONATION_ADDR, DEBOUNCE_SECS_PRICE
-from helper import hashrate_to_int, percent_of_network, get_mining_rewards, MINING_CALC
+from delete_scheduler import DeleteScheduler
+from emission import EMISSION
+from helper import hashrate_to_int, percent_of_network, get_mining_rewards, MINING_CALC, parse_hashrates, \
+    mining_rewards_matrix, mining_table, REWARD_HORIZONS
+from ingress import ShardedIngress, WebhookServer, consume_updates
+from kaspad_notifications import KaspadNotifier
+from market_snapshot import SnapshotService
+from media_cache import MediaCache
 from plot import get_image_stream, get_coin_info_from_ticker
-from tipping import create_new_wallet, WalletCreationError, get_wallet, WalletNotFoundError, username_to_uuid, \
-    get_wallet_pw, create_tx, WalletInsufficientBalanceError
+from qr_service import QR_CODES
+from rain import ActivityTracker, RainSummaries, recipient_line, tx_link, CONFIRMED, NOT_FOUND, PENDING
+from send_queue import SendQueue, GLOBAL_RATE
+from state_backend import create_backend, MemoryBackend
+from tipping import create_new_wallet, WalletCreationError, WalletNotFoundError, username_to_uuid, get_wallet_pw, \
+    create_tx, WalletInsufficientBalanceError, WalletTransactionError
+from tip_queue import TipQueue
+from tx_scanner import TxConfirmationScanner
+from upstream_cache import cached
+from wallet_index import WalletIndex
 
 logging.basicConfig(format="%(asctime)s::%(name)s::%(module)s::%(levelname)s::%(message)s",
                     level=logging.DEBUG)
@@ -36,56 +50,29 @@ logging.getLogger("urllib3").setLevel(logging.WARNING)
 
 logging.info('Starting TGBOT')
 
-DEBOUNCE_CACHE = {}
-
-TX_CHECKER = {}
-DELETE_MESSAGES_CACHE = []
-
 STARTED = datetime.now()
 
 bot = AsyncTeleBot(os.environ["TELEBOT_TOKEN"])
-syncbot = TeleBot(os.environ["TELEBOT_TOKEN"])
-
-assert os.environ.get('DONATION_ADDRESS') is not None
 
+# number of processes handling updates, more than one needs a shared state backend (REDIS_URL)
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", 1))
 
-def create_qr_code_img(text, fast, result):
-    # taking image which user wants
-    # in the QR code center
-    logo = Image.open("./res/kaspa-icon.png")
+# updates are received via webhook if WEBHOOK_URL (public url of WEBHOOK_PATH) is set, else by polling
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8000))
+# generated at start if not set, the workers inherit it
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or secrets.token_urlsafe(32)
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", 1000))
+HANDLER_CONCURRENCY = int(os.getenv("HANDLER_CONCURRENCY", 64))
+STATE = create_backend()
 
-    # taking base width
-    basewidth = 100
+CHAT_ADMINS = ChatAdminCache(bot)
+OUTBOX = SendQueue(bot, global_rate=GLOBAL_RATE / BOT_WORKERS)
+DELETE_SCHEDULER = DeleteScheduler(bot)
+MEDIA_CACHE = MediaCache(os.getenv("MEDIA_CACHE_FILE", "./media_cache.json"))
 
-    # adjust image size
-    wpercent = (basewidth / float(logo.size[0]))
-    hsize = int((float(logo.size[1]) * float(wpercent)))
-    logo = logo.resize((basewidth, hsize), Image.ANTIALIAS)
-    QRcode = qrcode.QRCode(
-        error_correction=qrcode.constants.ERROR_CORRECT_H,
-        border=7
-    )
-
-    # adding URL or text to QRcode
-    QRcode.add_data(text)
-
-    # generating QR code
-    QRcode.make()
-    # adding color to QR code
-    if fast:
-        QRimg = QRcode.make_image(image_factory=StyledPilImage).convert("RGB")
-    else:
-        QRimg = QRcode.make_image(image_factory=StyledPilImage,
-                                  module_drawer=RoundedModuleDrawer(),
-                                  color_mask=HorizontalGradiantColorMask(right_color=(3, 38, 33),
-                                                                         left_color=(12, 110, 96))).convert('RGB')
-    # set size of QR code
-    if not fast:
-        pos = ((QRimg.size[0] - logo.size[0]) // 2,
-               (QRimg.size[1] - logo.size[1]) // 2)
-        QRimg.paste(logo, pos)
-    # save the QR code generated
-    result["stream"] = QRimg
+assert os.environ.get('DONATION_ADDRESS') is not None
 
 
 def chef_only(*args, **kwargs):
@@ -95,33 +82,25 @@ def chef_only(*args, **kwargs):
         return False
 
 
-def check_debounce(seconds=60 * 60):
-    def wrapper(*args, **kwargs):
-        cmd_id = f'{args[0].chat.id}{args[0].text.split("@")[0]}'
-
-        requester_status = syncbot.get_chat_member(args[0].chat.id, args[0].from_user.id).status
-
+def check_debounce(seconds=60 * 60, burst=1):
+    async def wrapper(*args, **kwargs):
         try:
             is_rob = (args[0].from_user.id == 1922783296)
         except AttributeError:
             is_rob = False
 
         try:
-            is_admin = requester_status in ['administrator', 'creator']
+            is_admin = CHAT_ADMINS.is_admin(args[0].chat.id, args[0].from_user.id)
         except:
             is_admin = False
 
-        if time_passed := (time.time() - DEBOUNCE_CACHE.get(cmd_id, 0)) > seconds \
-                          or args[0].chat.id == -1001208691907 or is_rob or is_admin:
-            DEBOUNCE_CACHE[cmd_id] = time.time()
-        else:
-            try:
-                asyncio.gather(bot.delete_message(args[0].chat.id, args[0].id))
-            except ApiTelegramException as e:
-                if "message can't be deleted for everyone" not in str(e):
-                    raise
+        allowed = await STATE.allow(args[0].chat.id, args[0].text, seconds, burst,
+                                    force=args[0].chat.id == -1001208691907 or is_rob or is_admin)
+
+        if not allowed:
+            DELETE_SCHEDULER.schedule(0, args[0].chat.id, args[0].id)
 
-        return time_passed  # True, if timedelta > seconds
+        return allowed
 
     return wrapper
 
@@ -196,7 +175,7 @@ async def callback_query_price_update(call):
         try:
             message = await get_price_message(days)
         except Exception:
-            await bot.send_message(call.message.chat.id, "Problems occured while requesting CoinGecko. Sorry.")
+            OUTBOX.send_message(call.message.chat.id, "Problems occured while requesting CoinGecko. Sorry.")
             logging.exception('Exception at price update')
             return
 
@@ -213,14 +192,14 @@ async def callback_query_price_update(call):
                                             reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("Update",
                                                                                                      callback_data="cb_update")]]))
             else:
-                await bot.edit_message_media(InputMedia(type='photo',
-                                                        media=await get_image_stream(days),
-                                                        caption=message,
-                                                        parse_mode="markdown"),
-                                             call.message.chat.id,
-                                             call.message.id,
-                                             reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("Update",
-                                                                                                      callback_data="cb_update")]]))
+                await MEDIA_CACHE.edit_message_photo(bot,
+                                                     await get_image_stream(days),
+                                                     call.message.chat.id,
+                                                     call.message.id,
+                                                     caption=message,
+                                                     parse_mode="markdown",
+                                                     reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("Update",
+                                                                                                              callback_data="cb_update")]]))
 
         except ApiTelegramException as e:
             if "message is not modified" not in str(e):
@@ -235,7 +214,7 @@ async def callback_query_price_update(call):
 async def callback_query_hashrate_update(call):
     try:
         try:
-            hashrate = (await kaspa_api.get_hashrate())["hashrate"]
+            hashrate = (await MARKET.get("hashrate"))["hashrate"]
 
             if hashrate < 1000:
                 hashrate_str = f"{hashrate:.2f} TH/s"
@@ -271,8 +250,8 @@ async def mcapof(e):
         other_currency = e.text.split(" ")[1]
         data = await get_coin_info_from_ticker(other_currency)
 
-        other_price = data["market_data"]["current_price"]["usd"]
-        other_mcap = data["market_data"]["market_cap"]["usd"]
+        other_price = data["current_price"]
+        other_mcap = data["market_cap"]
 
         kaspa_info = await get_coin_info()
         kas_price = kaspa_info["current_price"]["usd"]
@@ -281,16 +260,16 @@ async def mcapof(e):
         multiplicator = other_mcap / kas_mcap
         multiplicated_price = kas_price * multiplicator
 
-        await bot.send_message(e.chat.id,
-                               f"*KAS - Kaspa*\n"
-                               f"  price: {kas_price:0.3f}$\n"
-                               f"  MCAP: $ {kas_mcap / 1_000_000:0,.2f}M\n\nwith the *MCAP of*\n\n"
-                               f"*{data['symbol'].upper()} - {data['name']}*\n"
-                               f"  price: {other_price}$\n"
-                               f"  MCAP: $ {other_mcap / 1_000_000:0,.2f}M\n\n"
-                               f"*Determined KAS price\n  {multiplicated_price:0.3f}$ ({multiplicator:.2f} x)*",
-                               parse_mode="Markdown",
-                               message_thread_id=e.chat.is_forum and e.message_thread_id)
+        OUTBOX.send_message(e.chat.id,
+                            f"*KAS - Kaspa*\n"
+                            f"  price: {kas_price:0.3f}$\n"
+                            f"  MCAP: $ {kas_mcap / 1_000_000:0,.2f}M\n\nwith the *MCAP of*\n\n"
+                            f"*{data['symbol'].upper()} - {data['name']}*\n"
+                            f"  price: {other_price}$\n"
+                            f"  MCAP: $ {other_mcap / 1_000_000:0,.2f}M\n\n"
+                            f"*Determined KAS price\n  {multiplicated_price:0.3f}$ ({multiplicator:.2f} x)*",
+                            parse_mode="Markdown",
+                            message_thread_id=e.chat.is_forum and e.message_thread_id)
 
     except Exception:
         logging.exception('Something went wrong....')
@@ -298,74 +277,93 @@ async def mcapof(e):
 
 @bot.message_handler(commands=["fgi"])
 async def fgi(e):
-    fgindex = requests.get("https://api.alternative.me/fng/").json()
-    resp = requests.get("https://alternative.me/crypto/fear-and-greed-index.png")
+    fgindex = await http_client.get_json("https://api.alternative.me/fng/")
+    async with http_client.get("https://alternative.me/crypto/fear-and-greed-index.png") as resp:
+        fgimage = await resp.read()
 
-    await bot.send_photo(e.chat.id,
-                         resp.content,
-                         f'Fear & Greed Index:\n   {fgindex["data"][0]["value"]} '
-                         f'= {fgindex["data"][0]["value_classification"]}',
-                         message_thread_id=e.chat.is_forum and e.message_thread_id)
+    OUTBOX.send_photo(e.chat.id,
+                      fgimage,
+                      f'Fear & Greed Index:\n   {fgindex["data"][0]["value"]} '
+                      f'= {fgindex["data"][0]["value_classification"]}',
+                      message_thread_id=e.chat.is_forum and e.message_thread_id)
 
 
 @bot.message_handler(commands=["donate"], func=check_debounce(DEBOUNCE_SECS_PRICE))
 async def donate(e):
     if e.chat.type != "private":
-        add_donation_channel(e.chat.id)
-    with open("./res/donate.png", "rb") as f:
-        await bot.send_photo(e.chat.id,
-                             f,
-                             f"Please consider a donation for my *free work* on:\n"
-                             f"🤖 Kaspa TelegramBot\n"
-                             f"🔎 Block explorer https://explorer.kaspa.org\n"
-                             f"💻 REST-API https://api.kaspa.org\n"
-                             f"🕹 Kaspacity https://kaspagames.org\n"
-                             f"🏋🏼‍♀️ My support for users\n\n"
-                             f"Either here `{os.environ['DONATION_ADDRESS']}`"
-                             f"\n or you can tip the bot directly via TG-wallet\n\n"
-                             f"*Thank you, this helps me a lot!* 💚",
-                             parse_mode="Markdown",
-                             message_thread_id=e.chat.is_forum and e.message_thread_id)
+        register_chat(e.chat)
+    await MEDIA_CACHE.send_photo(OUTBOX,
+                                 e.chat.id,
+                                 "./res/donate.png",
+                                 caption=f"Please consider a donation for my *free work* on:\n"
+                                         f"🤖 Kaspa TelegramBot\n"
+                                         f"🔎 Block explorer https://explorer.kaspa.org\n"
+                                         f"💻 REST-API https://api.kaspa.org\n"
+                                         f"🕹 Kaspacity https://kaspagames.org\n"
+                                         f"🏋🏼‍♀️ My support for users\n\n"
+                                         f"Either here `{os.environ['DONATION_ADDRESS']}`"
+                                         f"\n or you can tip the bot directly via TG-wallet\n\n"
+                                         f"*Thank you, this helps me a lot!* 💚",
+                                 parse_mode="Markdown",
+                                 message_thread_id=e.chat.is_forum and e.message_thread_id)
 
 
 @bot.message_handler(commands=["announce"], func=chef_only)
 async def announce(e):
     if text := e.text[10:]:
-        for c_id in DONATION_CHANNELS:
-            await bot.send_message(c_id,
-                                   f"🚨 *Bot Announcement* 🚨\n"
-                                   f"{text}",
-                                   parse_mode="Markdown",
-                                   message_thread_id=e.chat.is_forum and e.message_thread_id)
+        # started by the leader worker, which runs all broadcasts
+        await STATE.push_broadcast({"text": f"🚨 *Bot Announcement* 🚨\n"
+                                            f"{text}",
+                                    "kwargs": {"parse_mode": "Markdown"},
+                                    "reply_to": [e.chat.id, e.chat.is_forum and e.message_thread_id]})
+
+
+@bot.message_handler(commands=["broadcasts"], func=chef_only)
+async def broadcasts(e):
+    jobs = await BROADCASTER.recent_jobs()
+    OUTBOX.send_message(e.chat.id,
+                        "\n\n".join(job.summary() for job in jobs) or "No broadcasts yet.",
+                        message_thread_id=e.chat.is_forum and e.message_thread_id)
+
+
+@bot.message_handler(commands=["ratelimit"], func=chef_only)
+async def ratelimit_stats(e):
+    stats = await STATE.rate_limit_stats()
+    by_command = stats.pop("suppressed_by_command")
+    OUTBOX.send_message(e.chat.id,
+                        "Rate limiter\n" +
+                        "".join(f"  {key}: {value:,}\n" for key, value in stats.items()) + "\n" +
+                        "\n".join(f"  {command}: {count:,}" for command, count in by_command.items()),
+                        message_thread_id=e.chat.is_forum and e.message_thread_id)
 
 
 @bot.message_handler(commands=["balance"], func=check_debounce(DEBOUNCE_SECS_PRICE))
 async def balance(e):
     if e.chat.type != "private":
-        add_donation_channel(e.chat.id)
+        register_chat(e.chat)
 
     try:
         try:
             address = e.text.split(" ")[1]
         except IndexError:
-            await bot.send_message(e.chat.id,
-                                   "Command needs kaspa wallet as parameter.",
-                                   message_thread_id=e.chat.is_forum and e.message_thread_id)
+            OUTBOX.send_message(e.chat.id,
+                                "Command needs kaspa wallet as parameter.",
+                                message_thread_id=e.chat.is_forum and e.message_thread_id)
             return
 
         if re.match(r"kaspa:[a-zA-Z0-9]{51}", address) is None:
-            await bot.send_message(e.chat.id, "kaspa wallet not valid.",
-                                   message_thread_id=e.chat.is_forum and e.message_thread_id)
+            OUTBOX.send_message(e.chat.id, "kaspa wallet not valid.",
+                                message_thread_id=e.chat.is_forum and e.message_thread_id)
             return
 
         balance = (await kaspa_api.get_balance(address))["balance"] / 100000000
 
-        await bot.send_message(e.chat.id,
-                               f"\nBalance for\n"
-                               f"  {address}\n"
-                               f"{10 * '-'}\n"
-                               f"{balance:,} KAS", parse_mode="Markdown",
-                               message_thread_id=e.chat.is_forum and e.message_thread_id)
+        OUTBOX.send_message(e.chat.id,
+                            f"\nBalance for\n"
+                            f"  {address}\n"
+                            f"{10 * '-'}\n"
+                            f"{balance:,} KAS", parse_mode="Markdown",
+                            message_thread_id=e.chat.is_forum and e.message_thread_id)
     except Exception as e:
         print(str(e))
 
@@ -373,7 +371,7 @@ async def balance(e):
 @bot.message_handler(commands=["devfund"], func=check_debounce(DEBOUNCE_SECS_PRICE))
 async def devfund(e):
     if e.chat.type != "private":
-        add_donation_channel(e.chat.id)
+        register_chat(e.chat)
 
     try:
         try:
@@ -383,15 +381,15 @@ async def devfund(e):
             print(f'Exception raised: {e}')
             return
 
-        await bot.send_message(e.chat.id, f"*Balance for devfund*\n\n"
-                                          f"```\nMINING\n"
-                                          f"    {round(balance_mining, 2):,} KAS\n"
-                                          f"DONATION\n"
-                                          f"    {round(balance_donation, 2):,} KAS\n"
-                                          f"{30 * '-'}\n"
-                                          f"{round(balance_mining, 2) + round(balance_donation, 2):,} KAS\n```",
-                               parse_mode="Markdown",
-                               message_thread_id=e.chat.is_forum and e.message_thread_id)
+        OUTBOX.send_message(e.chat.id, f"*Balance for devfund*\n\n"
+                                       f"```\nMINING\n"
+                                       f"    {round(balance_mining, 2):,} KAS\n"
+                                       f"DONATION\n"
+                                       f"    {round(balance_donation, 2):,} KAS\n"
+                                       f"{30 * '-'}\n"
+                                       f"{round(balance_mining, 2) + round(balance_donation, 2):,} KAS\n```",
+                            parse_mode="Markdown",
+                            message_thread_id=e.chat.is_forum and e.message_thread_id)
     except Exception as e:
         print(str(e))
 
@@ -399,10 +397,10 @@ async def devfund(e):
 @bot.message_handler(commands=["coin_supply"], func=check_debounce(60 * 10))
 async def coin_supply(e):
     if e.chat.type != "private":
-        add_donation_channel(e.chat.id)
+        register_chat(e.chat)
 
     try:
-        coin_supply = await kaspa_api.get_coin_supply()
+        coin_supply = await MARKET.get("coin_supply")
 
         if coin_supply is None:
             return
@@ -410,16 +408,16 @@ async def coin_supply(e):
         circulating_supply = float(coin_supply["circulatingSupply"]) / 100000000
         total_supply = float(TOTAL_COIN_SUPPLY)
 
-        await bot.send_message(e.chat.id,
-                               f"```"
-                               f"\n"
-                               f"Total supply  : {circulating_supply:,.0f} KAS\n"
-                               f"Unmined supply : {total_supply - circulating_supply:,.0f} KAS\n\n"
-                               f"{'=' * 15}\n"
-                               f"Max supply ~      : {total_supply:,.0f} KAS\n"
-                               f"Percent mined       : {round(circulating_supply / total_supply * 100, 2)}%\n"
-                               f"```", parse_mode="Markdown",
-                               message_thread_id=e.chat.is_forum and e.message_thread_id)
+        OUTBOX.send_message(e.chat.id,
+                            f"```"
+                            f"\n"
+                            f"Total supply  : {circulating_supply:,.0f} KAS\n"
+                            f"Unmined supply : {total_supply - circulating_supply:,.0f} KAS\n\n"
+                            f"{'=' * 15}\n"
+                            f"Max supply ~      : {total_supply:,.0f} KAS\n"
+                            f"Percent mined       : {round(circulating_supply / total_supply * 100, 2)}%\n"
+                            f"```", parse_mode="Markdown",
+                            message_thread_id=e.chat.is_forum and e.message_thread_id)
     except Exception as e:
         print(str(e))
 
@@ -433,24 +431,24 @@ def strfdelta(tdelta, fmt):
 
 @bot.message_handler(commands=["uptime"], func=check_debounce(10))
 async def uptime(e):
-    await bot.send_message(e.chat.id,
-                           f'🕐 *Bot uptime* 🕐\n'
-                           f'  {strfdelta(datetime.now() - STARTED, "{days} days {hours} hours {minutes} minute")}s',
-                           parse_mode="Markdown",
-                           message_thread_id=e.chat.is_forum and e.message_thread_id)
+    OUTBOX.send_message(e.chat.id,
+                        f'🕐 *Bot uptime* 🕐\n'
+                        f'  {strfdelta(datetime.now() - STARTED, "{days} days {hours} hours {minutes} minute")}s',
+                        parse_mode="Markdown",
+                        message_thread_id=e.chat.is_forum and e.message_thread_id)
 
 
 @bot.message_handler(commands=["price"], func=check_debounce(DEBOUNCE_SECS_PRICE))
 async def price(e):
     if e.chat.type != "private":
-        add_donation_channel(e.chat.id)
+        register_chat(e.chat)
 
     try:
         if e.chat.id == -1001589070884:
-            await bot.send_message(e.chat.id,
-                                   f'💰 For price talks please use the price channel 💰\n\n'
-                                   f'https://t.me/Kaspa_SFW_PriceGroup',
-                                   message_thread_id=e.chat.is_forum and e.message_thread_id)
+            OUTBOX.send_message(e.chat.id,
+                                f'💰 For price talks please use the price channel 💰\n\n'
+                                f'https://t.me/Kaspa_SFW_PriceGroup',
+                                message_thread_id=e.chat.is_forum and e.message_thread_id)
         else:
             try:
                 try:
@@ -462,35 +460,38 @@ async def price(e):
                     msg = await get_price_message(days)
 
                     try:
-                        await bot.send_photo(e.chat.id,
-                                             await get_image_stream(days),
-                                             caption=msg,
-                                             parse_mode="Markdown",
-                                             message_thread_id=e.chat.is_forum and e.message_thread_id,
-                                             reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("Update",
-                                                                                                      callback_data="cb_update")]]))
+                        await MEDIA_CACHE.send_photo(OUTBOX,
+                                                     e.chat.id,
+                                                     await get_image_stream(days),
+                                                     caption=msg,
+                                                     parse_mode="Markdown",
+                                                     message_thread_id=e.chat.is_forum and e.message_thread_id,
+                                                     reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("Update",
+                                                                                                              callback_data="cb_update")]]))
                     except Exception:
                         logging.exception("Error generating image.")
-                        await bot.send_message(e.chat.id,
-                                               msg,
-                                               parse_mode="Markdown",
-                                               message_thread_id=e.chat.is_forum and e.message_thread_id,
-                                               reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("Update",
-                                                                                                        callback_data="cb_update")]]))
+                        OUTBOX.send_message(e.chat.id,
+                                            msg,
+                                            parse_mode="Markdown",
+                                            message_thread_id=e.chat.is_forum and e.message_thread_id,
+                                            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("Update",
+                                                                                                     callback_data="cb_update")]]))
                 except asyncio.exceptions.TimeoutError:
-                    await bot.send_message(e.chat.id, "Problems occured while requesting CoinGecko. Sorry.",
-                                           message_thread_id=e.chat.is_forum and e.message_thread_id)
+                    OUTBOX.send_message(e.chat.id, "Problems occured while requesting CoinGecko. Sorry.",
+                                        message_thread_id=e.chat.is_forum and e.message_thread_id)
             except Exception:
                 logging.exception(f'Raised exception')
     except Exception as e:
         logging.exception(str(e))
 
 
-@cached(ttl=20)
+@cached(ttl=20, stale_ttl=5 * 60)
+async def _request_coin_info():
+    return await http_client.get_json(f"https://api.kaspa.org/info/market-data")
+
+
 async def get_coin_info():
-    async with aiohttp.ClientSession() as session:
-        async with session.get(f"https://api.kaspa.org/info/market-data") as resp:
-            return await resp.json()
+    return await MARKET.get("coin_info")
 
 
 async def get_ath_message(name):
@@ -529,23 +530,23 @@ async def get_ath_message(name):
 @bot.message_handler(commands=["ath"], func=check_debounce(DEBOUNCE_SECS_PRICE))
 async def ath(e):
     if e.chat.type != "private":
-        add_donation_channel(e.chat.id)
+        register_chat(e.chat)
 
     try:
         if e.chat.id == -1001589070884:
-            await bot.send_message(e.chat.id,
-                                   f'💰 For price talks please use the price channel 💰\n\n'
-                                   f'https://t.me/Kaspa_SFW_PriceGroup',
-                                   message_thread_id=e.chat.is_forum and e.message_thread_id)
+            OUTBOX.send_message(e.chat.id,
+                                f'💰 For price talks please use the price channel 💰\n\n'
+                                f'https://t.me/Kaspa_SFW_PriceGroup',
+                                message_thread_id=e.chat.is_forum and e.message_thread_id)
         else:
             try:
                 message = await get_ath_message("kas")
             except Exception as e:
                 return
             if message:
-                await bot.send_message(e.chat.id, message,
-                                       message_thread_id=e.chat.is_forum and e.message_thread_id,
-                                       parse_mode="Markdown")
+                OUTBOX.send_message(e.chat.id, message,
+                                    message_thread_id=e.chat.is_forum and e.message_thread_id,
+                                    parse_mode="Markdown")
     except Exception as e:
         print(str(e))
 
@@ -553,43 +554,53 @@ async def ath(e):
 @bot.message_handler(commands=["wallet"], func=check_debounce(DEBOUNCE_SECS_PRICE))
 async def wallet(e):
     if e.chat.type != "private":
-        add_donation_channel(e.chat.id)
+        register_chat(e.chat)
 
     try:
-        await bot.send_message(e.chat.id, f'<b>For a Kaspa-wallet you can use one of these applications</b>\n\n'
-                                          '<b>Web wallet</b>:\n'
-                                          '  https://wallet.kaspanet.io/\n'
-                                          f'<b>Kaspad (command line wallet)</b>:\n'
-                                          f'  <a href="tinyurl.com/ym8sbas7">go to github</a>\n'
-                                          '<b>Kaspa for desktop (KDX)</b>:\n'
-                                          '  <a href="https://kdx.app/">https://kdx.app/</a>\n'
-                                          '<b>Zelcore</b>:\n'
-                                          '  https://zelcore.io/\n'
-                                          '<b>Chainge</b>:\n'
-                                          '  https://www.chainge.finance/\n'
-                                          '<b>Tangem</b>:\n'
-                                          '  https://tangem.com/\n'
-                                          '<b>OneKey 🆕</b>:\n'
-                                          '  https://onekey.so/\n'
-                                          '<b>Paper wallet</b>\n'
-                                          '  <a href="https://github.com/svarogg/kaspaper/releases/tag/v0.0.3">github release</a>\n'
-                                          '<b>Telegram wallet</b>:\n'
-                                          '  Talk to @kaspanet_bot with <code>/create_wallet</code> command\n'
-                                          '  This wallet is just for fun / demonstration.',
-                               parse_mode="html",
-                               message_thread_id=e.chat.is_forum and e.message_thread_id,
-                               disable_web_page_preview=True)
+        OUTBOX.send_message(e.chat.id, f'<b>For a Kaspa-wallet you can use one of these applications</b>\n\n'
+                                       '<b>Web wallet</b>:\n'
+                                       '  https://wallet.kaspanet.io/\n'
+                                       f'<b>Kaspad (command line wallet)</b>:\n'
+                                       f'  <a href="tinyurl.com/ym8sbas7">go to github</a>\n'
+                                       '<b>Kaspa for desktop (KDX)</b>:\n'
+                                       '  <a href="https://kdx.app/">https://kdx.app/</a>\n'
+                                       '<b>Zelcore</b>:\n'
+                                       '  https://zelcore.io/\n'
+                                       '<b>Chainge</b>:\n'
+                                       '  https://www.chainge.finance/\n'
+                                       '<b>Tangem</b>:\n'
+                                       '  https://tangem.com/\n'
+                                       '<b>OneKey 🆕</b>:\n'
+                                       '  https://onekey.so/\n'
+                                       '<b>Paper wallet</b>\n'
+                                       '  <a href="https://github.com/svarogg/kaspaper/releases/tag/v0.0.3">github release</a>\n'
+                                       '<b>Telegram wallet</b>:\n'
+                                       '  Talk to @kaspanet_bot with <code>/create_wallet</code> command\n'
+                                       '  This wallet is just for fun / demonstration.',
+                            parse_mode="html",
+                            message_thread_id=e.chat.is_forum and e.message_thread_id,
+                            disable_web_page_preview=True)
     except Exception as e:
         print(str(e))
 
 
+# tables of many hashrates are limited per chat, single values aren't
+MR_TABLE_DEBOUNCE = check_debounce(10, burst=3)
+
+
 @bot.message_handler(commands=["mining_reward", "mr"], func=ignore_channels(["-1001589070884", "-1001493667078"]))
 async def mining_reward(e):
     if e.chat.type != "private":
-        add_donation_channel(e.chat.id)
+        register_chat(e.chat)
 
     try:
         params = " ".join(e.text.split(" ")[1:])
+
+        if "," in params or "-" in params:
+            if await MR_TABLE_DEBOUNCE(e):
+                await mining_reward_table(e, params)
+            return
+
         match = re.match(r"(?P<dec>[\d\.]+) *(?P<suffix>[^\d ]+)", params)
 
         if match is None:
@@ -598,78 +609,136 @@ async def mining_reward(e):
         suffix = match["suffix"]
         own_hashrate = match["dec"]
 
-        network_hashrate = (await kaspa_api.get_hashrate())["hashrate"] * 1_000_000_000_000
+        network_hashrate = (await MARKET.get("hashrate"))["hashrate"] * 1_000_000_000_000
         own_hashrate = own_hashrate + suffix if suffix else own_hashrate
         own_hashrate = hashrate_to_int(own_hashrate)
 
-        stats = await kaspa_api.get_blockdag_info()
-
         if own_hashrate:
             hash_percent_of_network = percent_of_network(own_hashrate, network_hashrate)
-            rewards = get_mining_rewards(int(stats['virtualDaaScore']), hash_percent_of_network)
-            await bot.send_message(e.chat.id,
-                                   f"*Mining rewards for {match['dec']} {suffix[:2].upper()}/s*\n" + MINING_CALC(
-                                       rewards),
-                                   parse_mode="Markdown",
-                                   message_thread_id=e.chat.is_forum and e.message_thread_id)
+            rewards = get_mining_rewards(await get_daa_score(), hash_percent_of_network)
+            OUTBOX.send_message(e.chat.id,
+                                f"*Mining rewards for {match['dec']} {suffix[:2].upper()}/s*\n" + MINING_CALC(
+                                    rewards),
+                                parse_mode="Markdown",
+                                message_thread_id=e.chat.is_forum and e.message_thread_id)
     except Exception:
         logging.exception('Exception at /mr')
 
 
+async def mining_reward_table(e, params):
+    hashrates = parse_hashrates(params)
+
+    if not hashrates:
+        OUTBOX.send_message(e.chat.id,
+                            "Use /mr 1TH,10TH,100TH or /mr 1-50TH step 5",
+                            message_thread_id=e.chat.is_forum and e.message_thread_id)
+        return
+
+    network_hashrate = (await MARKET.get("hashrate"))["hashrate"] * 1_000_000_000_000
+
+    rewards = mining_rewards_matrix(await get_daa_score(),
+                                    hashrates,
+                                    network_hashrate,
+                                    [REWARD_HORIZONS['day'], REWARD_HORIZONS['week'], REWARD_HORIZONS['month']])
+
+    OUTBOX.send_message(e.chat.id,
+                        f"*Mining rewards*\n```\n{mining_table(hashrates, rewards)}\n```",
+                        parse_mode="Markdown",
+                        message_thread_id=e.chat.is_forum and e.message_thread_id)
+
+
+@bot.message_handler(commands=["mined"], func=check_debounce(60 * 10))
+async def mined(e):
+    if e.chat.type != "private":
+        register_chat(e.chat)
+
+    try:
+        if not (match := re.search(r"(?P<value>\d+(?:\.\d+)?) *(?P<percent>%)?", e.text.replace(",", ""))):
+            OUTBOX.send_message(e.chat.id,
+                                "Use /mined <amount> KAS or /mined <percent>%",
+                                message_thread_id=e.chat.is_forum and e.message_thread_id)
+            return
+
+        value = float(match["value"])
+        target_supply = EMISSION.max_supply * value / 100 if match["percent"] else value
+        target_daa_score = EMISSION.daa_score_for_supply(target_supply)
+
+        if target_daa_score is None:
+            OUTBOX.send_message(e.chat.id,
+                                f"Max supply is {EMISSION.max_supply:,.0f} KAS. This amount will never be mined.",
+                                message_thread_id=e.chat.is_forum and e.message_thread_id)
+            return
+
+        current_daa_score = await get_daa_score()
+        date = EMISSION.estimate_date(target_daa_score, current_daa_score)
+
+        OUTBOX.send_message(e.chat.id,
+                            f"*{target_supply:,.0f} KAS* ({target_supply / EMISSION.max_supply * 100:.2f}%)\n"
+                            f"{'are' if target_daa_score <= current_daa_score else 'will be'} mined at\n"
+                            f"```\n"
+                            f"DAA score : {target_daa_score:,}\n"
+                            f"Date      : ~ {date:%Y-%m-%d}\n"
+                            f"```",
+                            parse_mode="Markdown",
+                            message_thread_id=e.chat.is_forum and e.message_thread_id)
+    except Exception:
+        logging.exception('Exception at /mined')
+
+
 @bot.message_handler(commands=["id"])
 async def id(e):
-    await bot.send_message(e.chat.id,
-                           f"Chat-Id: {e.chat.id}",
-                           message_thread_id=e.chat.is_forum and e.message_thread_id)
+    OUTBOX.send_message(e.chat.id,
+                        f"Chat-Id: {e.chat.id}",
+                        message_thread_id=e.chat.is_forum and e.message_thread_id)
 
 
 @bot.message_handler(commands=["chart"])
 async def chart(e):
     if e.chat.type != "private":
-        add_donation_channel(e.chat.id)
+        register_chat(e.chat)
 
-    await bot.send_message(e.chat.id, f"See *KAS/USDT* chart on *MEXC*:\n"
-                                      f"    https://www.tradingview.com/chart/?symbol=MEXC%3AKASUSDT\n",
-                           parse_mode="Markdown",
-                           message_thread_id=e.chat.is_forum and e.message_thread_id,
-                           disable_web_page_preview=True)
+    OUTBOX.send_message(e.chat.id, f"See *KAS/USDT* chart on *MEXC*:\n"
+                                   f"    https://www.tradingview.com/chart/?symbol=MEXC%3AKASUSDT\n",
+                        parse_mode="Markdown",
+                        message_thread_id=e.chat.is_forum and e.message_thread_id,
+                        disable_web_page_preview=True)
 
 
 @bot.message_handler(commands=["mcap"], func=check_debounce(60 * 60))
 async def mcap(e):
     if e.chat.type != "private":
-        add_donation_channel(e.chat.id)
+        register_chat(e.chat)
 
     try:
         kaspa_info = await get_coin_info()
         price_usd = kaspa_info["current_price"]["usd"]
         rank = kaspa_info["market_cap_rank"]
 
-        circ_supply = float((await kaspa_api.get_coin_supply())["circulatingSupply"]) / 100000000
-
-        await bot.send_message(e.chat.id,
-                               f"*$KAS MARKET CAP*\n"
-                               f"{'-' * 25}\n"
-                               f"```\n"
-                               f"Coingecko Market cap rank : {rank}\n"
-                               f"Current Market Capitalization : {circ_supply * price_usd:>11,.0f} USD\n"
-                               f"Fully Diluted Valuation (FDV) : {TOTAL_COIN_SUPPLY * price_usd:>11,.0f} USD"
-                               f"\n```",
-                               message_thread_id=e.chat.is_forum and e.message_thread_id,
-                               parse_mode="Markdown")
+        circ_supply = float((await MARKET.get("coin_supply"))["circulatingSupply"]) / 100000000
+
+        OUTBOX.send_message(e.chat.id,
+                            f"*$KAS MARKET CAP*\n"
+                            f"{'-' * 25}\n"
+                            f"```\n"
+                            f"Coingecko Market cap rank : {rank}\n"
+                            f"Current Market Capitalization : {circ_supply * price_usd:>11,.0f} USD\n"
+                            f"Fully Diluted Valuation (FDV) : {TOTAL_COIN_SUPPLY * price_usd:>11,.0f} USD"
+                            f"\n```",
+                            message_thread_id=e.chat.is_forum and e.message_thread_id,
+                            parse_mode="Markdown")
     except Exception:
         logging.exception(f'Raised exception in mcap')
 
 
 @bot.message_handler(commands=["wkas", "ca"], func=check_debounce(60 * 60))
 async def wkas(e):
-    await bot.send_message(e.chat.id,
-                           f"The Ethereum *contract* for *wKAS* is:\n"
-                           f"  `0x112b08621e27e10773ec95d250604a041f36c582`\n"
-                           f"See [etherscan.io](https://etherscan.io/address/0x112b08621e27e10773ec95d250604a041f36c582)",
-                           disable_web_page_preview=True,
-                           message_thread_id=e.chat.is_forum and e.message_thread_id,
-                           parse_mode="Markdown")
+    OUTBOX.send_message(e.chat.id,
+                        f"The Ethereum *contract* for *wKAS* is:\n"
+                        f"  `0x112b08621e27e10773ec95d250604a041f36c582`\n"
+                        f"See [etherscan.io](https://etherscan.io/address/0x112b08621e27e10773ec95d250604a041f36c582)",
+                        disable_web_page_preview=True,
+                        message_thread_id=e.chat.is_forum and e.message_thread_id,
+                        parse_mode="Markdown")
 
 
 @bot.message_handler(commands=["value"], func=ignore_channels(["-1001589070884", "-1001493667078"]))
@@ -680,17 +749,17 @@ async def value(e):
         value = float(value[0])
         price = await _get_kas_price()
 
-        await bot.send_message(e.chat.id,
-                               f"{value:0,.2f} {'USD' if usd_to_kas else 'KAS'} ≈ "
-                               f"*{value / price if usd_to_kas else (value * price):0,.2f} {'USD' if not usd_to_kas else 'KAS'}*\n",
-                               message_thread_id=e.chat.is_forum and e.message_thread_id,
-                               parse_mode="Markdown")
+        OUTBOX.send_message(e.chat.id,
+                            f"{value:0,.2f} {'USD' if usd_to_kas else 'KAS'} ≈ "
+                            f"*{value / price if usd_to_kas else (value * price):0,.2f} {'USD' if not usd_to_kas else 'KAS'}*\n",
+                            message_thread_id=e.chat.is_forum and e.message_thread_id,
+                            parse_mode="Markdown")
 
 
 @bot.message_handler(commands=["maxhash"], func=check_debounce(60 * 60))
 async def max_hashrate(e):
     if e.chat.type != "private":
-        add_donation_channel(e.chat.id)
+        register_chat(e.chat)
 
     try:
         max_hashrate = await kaspa_api.get_max_hashrate()
@@ -700,42 +769,42 @@ async def max_hashrate(e):
         else:
             hashrate_str = f"{max_hashrate['hashrate'] / 1000:.2f} PH/s"
 
-        await bot.send_message(e.chat.id,
-                               f"Max Kaspa Hashrate\n"
-                               f"  *{hashrate_str}*\n\n"
-                               f"  Date {datetime.fromisoformat(max_hashrate['blockheader']['timestamp']):%Y-%m-%d %H:%M}\n"
-                               f"  Block {max_hashrate['blockheader']['hash'][:8]}",
-                               message_thread_id=e.chat.is_forum and e.message_thread_id,
-                               parse_mode="Markdown")
+        OUTBOX.send_message(e.chat.id,
+                            f"Max Kaspa Hashrate\n"
+                            f"  *{hashrate_str}*\n\n"
+                            f"  Date {datetime.fromisoformat(max_hashrate['blockheader']['timestamp']):%Y-%m-%d %H:%M}\n"
+                            f"  Block {max_hashrate['blockheader']['hash'][:8]}",
+                            message_thread_id=e.chat.is_forum and e.message_thread_id,
+                            parse_mode="Markdown")
     except Exception:
         logging.exception(f'Raised exception in maxhash')
 
 
 @bot.message_handler(commands=["id"], func=check_only_private)
 async def id(e):
-    await bot.send_message(e.chat.id, f"Chat-Id: {e.chat.id}",
-                           message_thread_id=e.chat.is_forum and e.message_thread_id)
+    OUTBOX.send_message(e.chat.id, f"Chat-Id: {e.chat.id}",
+                        message_thread_id=e.chat.is_forum and e.message_thread_id)
 
 
 @bot.message_handler(commands=["hashrate"], func=check_debounce(60 * 60))
 async def hashrate(e):
     if e.chat.type != "private":
-        add_donation_channel(e.chat.id)
+        register_chat(e.chat)
 
     try:
-        hashrate = (await kaspa_api.get_hashrate())["hashrate"]
+        hashrate = (await MARKET.get("hashrate"))["hashrate"]
 
         if hashrate < 1000:
             hashrate_str = f"{hashrate:.2f} TH/s"
         else:
             hashrate_str = f"{hashrate / 1000:.2f} PH/s"
 
-        await bot.send_message(e.chat.id,
-                               f"Current Hashrate: *{hashrate_str}*",
-                               message_thread_id=e.chat.is_forum and e.message_thread_id,
-                               parse_mode="Markdown",
-                               reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("Update",
-                                                                                        callback_data="cb_update_hashrate")]]))
+        OUTBOX.send_message(e.chat.id,
+                            f"Current Hashrate: *{hashrate_str}*",
+                            message_thread_id=e.chat.is_forum and e.message_thread_id,
+                            parse_mode="Markdown",
+                            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("Update",
+                                                                                     callback_data="cb_update_hashrate")]]))
     except Exception as e:
         print(str(e))
 
@@ -743,134 +812,134 @@ async def hashrate(e):
 @bot.message_handler(commands=["buy", "exchanges"], func=check_debounce(60 * 10))
 async def buy(e):
     if e.chat.type != "private":
-        add_donation_channel(e.chat.id)
-
-    await bot.send_message(e.chat.id,
-                           f"    💰   *Exchanges*   💰\n"
-                           f"----------------------------------\n"
-                           f" *KuCoin* [https://kucoin.com/](https://www.kucoin.com/de/trade/KAS-USDT)\n"
-                           f" *Gate* [https://www.gate.io/](https://www.gate.io/de/trade/KAS_USDT)\n"
-                           f" *Bybit* [https://www.bybit.com/](https://www.bybit.com/trade/usdt/KASUSDT)\n"
-                           f" *Bitget* [https://www.bitget.com/](https://www.bitget.com/en/spot/KASUSDT_SPBL)\n"
-                           f" *Uphold* [https://uphold.com/](https://uphold.com/prices/crypto/kaspa)\n"
-                           f" *LBank* [https://lbank.com](https://www.lbank.com/trade/kas_usdt/)\n"
-                           f" *MEXC* [https://mexc.com/](https://www.mexc.com/exchange/KAS_USDT)\n"
-                           f" *CoinEx* [https://www.coinex.com/](https://www.coinex.com/exchange/kas-usdt)\n"
-                           f" *Bitmart* [https://www.bitmart.com/](https://www.bitmart.com/trade/en-US?symbol=KAS_USDT)\n"
-                           f" *Bitpanda* [https://www.bitpanda.com/](https://www.bitpanda.com/en/prices/kaspa-kas)\n"
-                           f" *EXMO.me* [https://www.exmo.me/](https://exmo.me/en/trade/KAS_USDT)\n"
-                           f" *Tapbit* [https://www.tapbit.com/](https://www.tapbit.com/spot/exchange/KAS_USDT)\n"
-                           f" *BingX* [https://bingx.com/](https://bingx.com/en-us/spot/KASUSDT/)\n"
-                           f" *changeNOW* [https://www.changenow.io/](https://changenow.io/?from=btc&to=kas)\n"
-                           f" *CoinStash* [https://www.coinstash.com.au/](https://coinstash.com.au/kas/buy)\n"
-                           f" *Chainge (DEX)* [https://www.chainge.finance/](https://www.chainge.finance/info/currencies/KAS)\n"
-                           # f" *Exibitron* [https://www.exbitron.com/]\n"
-                           f" *TradeOgre* [https://www.tradeogre.com](https://tradeogre.com/exchange/USDT-KAS)",
-                           parse_mode="Markdown",
-                           disable_web_page_preview=True,
-                           message_thread_id=e.chat.is_forum and e.message_thread_id)
+        register_chat(e.chat)
+
+    OUTBOX.send_message(e.chat.id,
+                        f"    💰   *Exchanges*   💰\n"
+                        f"----------------------------------\n"
+                        f" *KuCoin* [https://kucoin.com/](https://www.kucoin.com/de/trade/KAS-USDT)\n"
+                        f" *Gate* [https://www.gate.io/](https://www.gate.io/de/trade/KAS_USDT)\n"
+                        f" *Bybit* [https://www.bybit.com/](https://www.bybit.com/trade/usdt/KASUSDT)\n"
+                        f" *Bitget* [https://www.bitget.com/](https://www.bitget.com/en/spot/KASUSDT_SPBL)\n"
+                        f" *Uphold* [https://uphold.com/](https://uphold.com/prices/crypto/kaspa)\n"
+                        f" *LBank* [https://lbank.com](https://www.lbank.com/trade/kas_usdt/)\n"
+                        f" *MEXC* [https://mexc.com/](https://www.mexc.com/exchange/KAS_USDT)\n"
+                        f" *CoinEx* [https://www.coinex.com/](https://www.coinex.com/exchange/kas-usdt)\n"
+                        f" *Bitmart* [https://www.bitmart.com/](https://www.bitmart.com/trade/en-US?symbol=KAS_USDT)\n"
+                        f" *Bitpanda* [https://www.bitpanda.com/](https://www.bitpanda.com/en/prices/kaspa-kas)\n"
+                        f" *EXMO.me* [https://www.exmo.me/](https://exmo.me/en/trade/KAS_USDT)\n"
+                        f" *Tapbit* [https://www.tapbit.com/](https://www.tapbit.com/spot/exchange/KAS_USDT)\n"
+                        f" *BingX* [https://bingx.com/](https://bingx.com/en-us/spot/KASUSDT/)\n"
+                        f" *changeNOW* [https://www.changenow.io/](https://changenow.io/?from=btc&to=kas)\n"
+                        f" *CoinStash* [https://www.coinstash.com.au/](https://coinstash.com.au/kas/buy)\n"
+                        f" *Chainge (DEX)* [https://www.chainge.finance/](https://www.chainge.finance/info/currencies/KAS)\n"
+                        # f" *Exibitron* [https://www.exbitron.com/]\n"
+                        f" *TradeOgre* [https://www.tradeogre.com](https://tradeogre.com/exchange/USDT-KAS)",
+                        parse_mode="Markdown",
+                        disable_web_page_preview=True,
+                        message_thread_id=e.chat.is_forum and e.message_thread_id)
 
 
 @bot.message_handler(commands=["languages", "international"], func=check_debounce(60 * 10))
 async def buy(e):
     if e.chat.type != "private":
-        add_donation_channel(e.chat.id)
-
-    await bot.send_message(e.chat.id,
-                           f"----------------------------------\n"
-                           f" *Kaspa in your language*\n"
-                           f" ⚠️Please keep in mind:\n"
-                           f"These are *unofficial* groups.\n"
-                           f"Use with caution! ⚠️ \n"
-                           f"----------------------------------\n"
-                           f"🇦🇪 [https://t.me/kaspa_arabic](https://t.me/kaspa_arabic)\n"
-                           f"🇧🇩 [https://t.me/kaspa_bangladesh](https://t.me/kaspa_bangladesh)\n"
-                           f"🇧🇪 [https://t.me/KaspaBelgium](https://t.me/KaspaBelgium)\n"
-                           f"🇨🇳 [https://t.me/kaspa_chinese](https://t.me/kaspa_chinese)\n"
-                           f"🇨🇳 [https://t.me/kaspa_chinese_group](https://t.me/kaspa_chinese_group)\n"
-                           f"🇸🇰🇨🇿 [https://t.me/KaspaSKCZ](https://t.me/KaspaSKCZ)\n"
-                           f"🇩🇪 [https://t.me/KaspaGerman](https://t.me/KaspaGerman)\n"
-                           f"🇪🇸 [https://t.me/kaspaesp](https://t.me/kaspaesp)\n"
-                           f"🇫🇮 [https://t.me/kaspa_finland](https://t.me/kaspa_finland)\n"
-                           f"🇫🇷 [https://t.me/kasfrench](https://t.me/kasfrench)\n"
-                           f"🇮🇳 [https://t.me/kaspaindia](https://t.me/kaspaindia)\n"
-                           f"🇮🇩 [https://t.me/Kaspa_Indonesian](https://t.me/Kaspa_Indonesian)\n"
-                           f"🇮🇱 [https://t.me/kaspaisrael](https://t.me/kaspaisrael)\n"
-                           f"🇮🇹 [https://t.me/kaspaitalia](https://t.me/kaspaitalia)\n"
-                           f"🇯🇵 [https://t.me/Kaspa_Japan](https://t.me/Kaspa_Japan)\n"
-                           f"🇰🇷 [https://t.me/kaspa_korea](https://t.me/kaspa_korea)\n"
-                           f"🇱🇹 [https://t.me/kaspalietuva](https://t.me/kaspalietuva)\n"
-                           f"🇮🇷 [https://t.me/Kaspa_persian](https://t.me/Kaspa_persian)\n"
-                           f"🇮🇷 [https://t.me/kaspapersianchannel](https://t.me/kaspapersianchannel)\n"
-                           f"🇵🇭 [http://t.me/kaspa_ph](http://t.me/kaspa_ph)\n"
-                           f"🇵🇱 [https://t.me/Kaspa_Poland](https://t.me/Kaspa_Poland)\n"
-                           f"🇵🇹🇧🇷 [https://t.me/kaspa_portugues](https://t.me/kaspa_portugues)\n"
-                           f"🇳🇱 [https://t.me/Kaspa_Dutch](https://t.me/Kaspa_Dutch)\n"
-                           f"🇷🇴 [https://t.me/kaspa_ro](https://t.me/kaspa_ro)\n"
-                           f"🇷🇺 [https://t.me/kaspa_rus](https://t.me/kaspa_rus)\n"
-                           f"🇹🇷 [https://t.me/KaspaTurk](https://t.me/KaspaTurk)\n"
-                           f"🇹🇷 [https://t.me/KaspaTr](https://t.me/KaspaTr)\n"
-                           f"🇻🇳 [https://t.me/Kaspa_VN](https://t.me/Kaspa_VN)\n"
-                           f"🇷🇸 [https://t.me/kaspa_balkan](https://t.me/kaspa_balkan)",
-                           parse_mode="Markdown",
-                           message_thread_id=e.chat.is_forum and e.message_thread_id,
-                           disable_web_page_preview=True)
+        register_chat(e.chat)
+
+    OUTBOX.send_message(e.chat.id,
+                        f"----------------------------------\n"
+                        f" *Kaspa in your language*\n"
+                        f" ⚠️Please keep in mind:\n"
+                        f"These are *unofficial* groups.\n"
+                        f"Use with caution! ⚠️ \n"
+                        f"----------------------------------\n"
+                        f"🇦🇪 [https://t.me/kaspa_arabic](https://t.me/kaspa_arabic)\n"
+                        f"🇧🇩 [https://t.me/kaspa_bangladesh](https://t.me/kaspa_bangladesh)\n"
+                        f"🇧🇪 [https://t.me/KaspaBelgium](https://t.me/KaspaBelgium)\n"
+                        f"🇨🇳 [https://t.me/kaspa_chinese](https://t.me/kaspa_chinese)\n"
+                        f"🇨🇳 [https://t.me/kaspa_chinese_group](https://t.me/kaspa_chinese_group)\n"
+                        f"🇸🇰🇨🇿 [https://t.me/KaspaSKCZ](https://t.me/KaspaSKCZ)\n"
+                        f"🇩🇪 [https://t.me/KaspaGerman](https://t.me/KaspaGerman)\n"
+                        f"🇪🇸 [https://t.me/kaspaesp](https://t.me/kaspaesp)\n"
+                        f"🇫🇮 [https://t.me/kaspa_finland](https://t.me/kaspa_finland)\n"
+                        f"🇫🇷 [https://t.me/kasfrench](https://t.me/kasfrench)\n"
+                        f"🇮🇳 [https://t.me/kaspaindia](https://t.me/kaspaindia)\n"
+                        f"🇮🇩 [https://t.me/Kaspa_Indonesian](https://t.me/Kaspa_Indonesian)\n"
+                        f"🇮🇱 [https://t.me/kaspaisrael](https://t.me/kaspaisrael)\n"
+                        f"🇮🇹 [https://t.me/kaspaitalia](https://t.me/kaspaitalia)\n"
+                        f"🇯🇵 [https://t.me/Kaspa_Japan](https://t.me/Kaspa_Japan)\n"
+                        f"🇰🇷 [https://t.me/kaspa_korea](https://t.me/kaspa_korea)\n"
+                        f"🇱🇹 [https://t.me/kaspalietuva](https://t.me/kaspalietuva)\n"
+                        f"🇮🇷 [https://t.me/Kaspa_persian](https://t.me/Kaspa_persian)\n"
+                        f"🇮🇷 [https://t.me/kaspapersianchannel](https://t.me/kaspapersianchannel)\n"
+                        f"🇵🇭 [http://t.me/kaspa_ph](http://t.me/kaspa_ph)\n"
+                        f"🇵🇱 [https://t.me/Kaspa_Poland](https://t.me/Kaspa_Poland)\n"
+                        f"🇵🇹🇧🇷 [https://t.me/kaspa_portugues](https://t.me/kaspa_portugues)\n"
+                        f"🇳🇱 [https://t.me/Kaspa_Dutch](https://t.me/Kaspa_Dutch)\n"
+                        f"🇷🇴 [https://t.me/kaspa_ro](https://t.me/kaspa_ro)\n"
+                        f"🇷🇺 [https://t.me/kaspa_rus](https://t.me/kaspa_rus)\n"
+                        f"🇹🇷 [https://t.me/KaspaTurk](https://t.me/KaspaTurk)\n"
+                        f"🇹🇷 [https://t.me/KaspaTr](https://t.me/KaspaTr)\n"
+                        f"🇻🇳 [https://t.me/Kaspa_VN](https://t.me/Kaspa_VN)\n"
+                        f"🇷🇸 [https://t.me/kaspa_balkan](https://t.me/kaspa_balkan)",
+                        parse_mode="Markdown",
+                        message_thread_id=e.chat.is_forum and e.message_thread_id,
+                        disable_web_page_preview=True)
 
 
 @bot.message_handler(commands=["miningpools", "mining", "mp"], func=check_debounce(60 * 10))
 async def miningpools(e):
     if e.chat.type != "private":
-        add_donation_channel(e.chat.id)
-
-    await bot.send_message(e.chat.id,
-                           f"----------------------\n"
-                           f" *Kaspa mining pools*\n"
-                           f"----------------------\n"
-                           f"[F2POOL](https://www.f2pool.com/coin/kaspa)\n"
-                           f"[ACC-POOL](https://kaspa.acc-pool.pw/)\n"
-                           f"[KASPA-POOL](https://kaspa-pool.org/)\n"
-                           f"[HEROMINERS](https://kaspa.herominers.com/)\n"
-                           f"[2MINERS](https://kas.2miners.com/)\n"
-                           f"[KYIV KASPA POOL](https://kaspa.ixbase.info/)\n"
-                           f"[WOOLYPOOLY](https://woolypooly.com/en/coin/kas)\n"
-                           f"[P1 POOL](https://p1pool.com/)\n"
-                           f"[KRYPTEX](https://pool.kryptex.com/en/kas)\n"
-                           f"[MAXGOR](https://kaspa.maxgor.info/)\n"
-                           f"[HASHPOOL](https://hashpool.com/coins/KAS)\n\n"
-                           f"[More](https://miningpoolstats.stream/kaspa)",
-                           parse_mode="Markdown",
-                           message_thread_id=e.chat.is_forum and e.message_thread_id,
-                           disable_web_page_preview=True)
+        register_chat(e.chat)
+
+    OUTBOX.send_message(e.chat.id,
+                        f"----------------------\n"
+                        f" *Kaspa mining pools*\n"
+                        f"----------------------\n"
+                        f"[F2POOL](https://www.f2pool.com/coin/kaspa)\n"
+                        f"[ACC-POOL](https://kaspa.acc-pool.pw/)\n"
+                        f"[KASPA-POOL](https://kaspa-pool.org/)\n"
+                        f"[HEROMINERS](https://kaspa.herominers.com/)\n"
+                        f"[2MINERS](https://kas.2miners.com/)\n"
+                        f"[KYIV KASPA POOL](https://kaspa.ixbase.info/)\n"
+                        f"[WOOLYPOOLY](https://woolypooly.com/en/coin/kas)\n"
+                        f"[P1 POOL](https://p1pool.com/)\n"
+                        f"[KRYPTEX](https://pool.kryptex.com/en/kas)\n"
+                        f"[MAXGOR](https://kaspa.maxgor.info/)\n"
+                        f"[HASHPOOL](https://hashpool.com/coins/KAS)\n\n"
+                        f"[More](https://miningpoolstats.stream/kaspa)",
+                        parse_mode="Markdown",
+                        message_thread_id=e.chat.is_forum and e.message_thread_id,
+                        disable_web_page_preview=True)
 
 
 @bot.message_handler(commands=["links"], func=check_debounce(60 * 10))
 async def links(e):
     if e.chat.type != "private":
-        add_donation_channel(e.chat.id)
-
-    await bot.send_message(e.chat.id,
-                           f"----------------------\n"
-                           f" *Most important links*\n"
-                           f"----------------------\n"
-                           f"[Website](https://kaspa.org/)\n"
-                           f"[Discord](https://discord.gg/kaspa)\n"
-                           f"[KGI BlockDAG visualizer](https://kgi.kaspad.net/)\n"
-                           f"[Kaspa Wiki](https://kaspawiki.net/index.php/Main_Page)\n"
-                           f"[Kaspa Faucet](https://faucet.kaspanet.io/)",
-                           parse_mode="Markdown",
-                           message_thread_id=e.chat.is_forum and e.message_thread_id,
-                           disable_web_page_preview=True)
+        register_chat(e.chat)
+
+    OUTBOX.send_message(e.chat.id,
+                        f"----------------------\n"
+                        f" *Most important links*\n"
+                        f"----------------------\n"
+                        f"[Website](https://kaspa.org/)\n"
+                        f"[Discord](https://discord.gg/kaspa)\n"
+                        f"[KGI BlockDAG visualizer](https://kgi.kaspad.net/)\n"
+                        f"[Kaspa Wiki](https://kaspawiki.net/index.php/Main_Page)\n"
+                        f"[Kaspa Faucet](https://faucet.kaspanet.io/)",
+                        parse_mode="Markdown",
+                        message_thread_id=e.chat.is_forum and e.message_thread_id,
+                        disable_web_page_preview=True)
 
 @bot.message_handler(commands=["website"], func=check_debounce(60 * 10))
 async def website(e):
-    await bot.send_message(e.chat.id,
-                           f"----------------------\n"
-                           f" *Kaspa website*\n"
-                           f"----------------------\n"
-                           f"https://kaspa.org/\n",
-                           parse_mode="Markdown",
-                           message_thread_id=e.chat.is_forum and e.message_thread_id,
-                           disable_web_page_preview=True)
+    OUTBOX.send_message(e.chat.id,
+                        f"----------------------\n"
+                        f" *Kaspa website*\n"
+                        f"----------------------\n"
+                        f"https://kaspa.org/\n",
+                        parse_mode="Markdown",
+                        message_thread_id=e.chat.is_forum and e.message_thread_id,
+                        disable_web_page_preview=True)
 
     # telegram bot features
 
@@ -878,124 +947,107 @@ async def website(e):
 @bot.message_handler(commands=["explorers"], func=check_debounce(60 * 10))
 async def explorers(e):
     if e.chat.type != "private":
-        add_donation_channel(e.chat.id)
-
-    await bot.send_message(e.chat.id,
-                           f"----------------------\n"
-                           f" *Kaspa explorers*\n"
-                           f"----------------------\n"
-                           f"[Katnip Explorer](https://katnip.kaspad.net/)\n"
-                           f"[Kaspa Block Explorer](https://explorer.kaspa.org/)\n"
-                           f"[kas fyi](https://kas.fyi/)\n",
-                           parse_mode="Markdown",
-                           message_thread_id=e.chat.is_forum and e.message_thread_id,
-                           disable_web_page_preview=True)
+        register_chat(e.chat)
+
+    OUTBOX.send_message(e.chat.id,
+                        f"----------------------\n"
+                        f" *Kaspa explorers*\n"
+                        f"----------------------\n"
+                        f"[Katnip Explorer](https://katnip.kaspad.net/)\n"
+                        f"[Kaspa Block Explorer](https://explorer.kaspa.org/)\n"
+                        f"[kas fyi](https://kas.fyi/)\n",
+                        parse_mode="Markdown",
+                        message_thread_id=e.chat.is_forum and e.message_thread_id,
+                        disable_web_page_preview=True)
 
     # telegram bot features
 
 
 @bot.message_handler(commands=["kaspa_qrcode"])
 async def kaspa_qrcode(e):
-    result = {}
     text = e.text[14:]
-    t1 = threading.Thread(target=create_qr_code_img, args=[text, False, result])
-    t1.start()
-    while True:
-        await asyncio.sleep(0.3)
-        if not t1.is_alive():
-            break
-
-    img_bytes = result["stream"]
-    msg = await bot.send_photo(e.chat.id, photo=img_bytes,
-                               caption=f'<b>{text}</b>',
-                               message_thread_id=e.chat.is_forum and e.message_thread_id,
-                               parse_mode="html")
+    img_bytes = await QR_CODES.render(text)
+    OUTBOX.send_photo(e.chat.id, photo=img_bytes,
+                      caption=f'<b>{text}</b>',
+                      message_thread_id=e.chat.is_forum and e.message_thread_id,
+                      parse_mode="html")
 
 
 @bot.message_handler(commands=["withdraw"])
 async def withdraw(e):
     if e.chat.type != "private":
-        add_donation_channel(e.chat.id)
+        register_chat(e.chat)
 
     try:
         # sender = e.from_user.username
         sender = f"{e.from_user.id}"
-        await get_wallet(username_to_uuid(sender))
+        await WALLETS.lookup(sender)
     except Exception as ex:
         print(ex)
-        msg = await bot.send_message(e.chat.id, f"You do not have a wallet yet. "
-                                                f"DM @kaspanet_bot with `/create_wallet` to create a new wallet.",
-                                     message_thread_id=e.chat.is_forum and e.message_thread_id,
-                                     parse_mode="Markdown")
-        DELETE_MESSAGES_CACHE.append((time.time() + 3, e.chat.id, msg.id))
-        DELETE_MESSAGES_CACHE.append((time.time() + 3, e.chat.id, e.message_id))
+        msg = await OUTBOX.send_message(e.chat.id, f"You do not have a wallet yet. "
+                                                   f"DM @kaspanet_bot with `/create_wallet` to create a new wallet.",
+                                        message_thread_id=e.chat.is_forum and e.message_thread_id,
+                                        parse_mode="Markdown")
+        DELETE_SCHEDULER.schedule(3, e.chat.id, msg.id, e.message_id)
         return
 
     if not (to_address := re.search(r"kaspa\:[a-zA-Z0-9]{61,63}", e.text)):
-        msg = await bot.send_message(e.chat.id,
-                                     "No valid *kaspa:* address found.\nUse /withdraw <kaspa:addr> <amount>",
-                                     message_thread_id=e.chat.is_forum and e.message_thread_id,
-                                     parse_mode="Markdown")
-        DELETE_MESSAGES_CACHE.append((time.time() + 3, e.chat.id, msg.id))
-        DELETE_MESSAGES_CACHE.append((time.time() + 3, e.chat.id, e.message_id))
+        msg = await OUTBOX.send_message(e.chat.id,
+                                        "No valid *kaspa:* address found.\nUse /withdraw <kaspa:addr> <amount>",
+                                        message_thread_id=e.chat.is_forum and e.message_thread_id,
+                                        parse_mode="Markdown")
+        DELETE_SCHEDULER.schedule(3, e.chat.id, msg.id, e.message_id)
         return
 
     if not (amount := re.search(" (\d+([.,]\d+)?)( |$)(KAS)?", e.text, re.IGNORECASE)):
-        await bot.send_message(e.chat.id, "Valid amount (with unit) missing. Use syntax x.xx KAS",
-                               message_thread_id=e.chat.is_forum and e.message_thread_id)
+        OUTBOX.send_message(e.chat.id, "Valid amount (with unit) missing. Use syntax x.xx KAS",
+                            message_thread_id=e.chat.is_forum and e.message_thread_id)
         return
     else:
         amount = float(amount[1].replace(",", "."))
 
     inclusive_fee_match = re.search("inclusivefee", e.text, re.IGNORECASE)
 
-    try:
-        await send_kas_and_log(sender,
-                               to_address[0],
-                               round(amount * 100000000),
-                               e.chat.id,
-                               inclusiveFee=inclusive_fee_match is not None,
-                               thread_id=e.chat.is_forum and e.message_thread_id)
-    except tipping.WalletInsufficientBalanceError as ex:
-        await bot.send_message(e.chat.id, f"{ex}", message_thread_id=e.chat.is_forum and e.message_thread_id)
+    await queue_tx(e, sender, to_address[0], round(amount * 100000000),
+                   inclusiveFee=inclusive_fee_match is not None)
 
 
 @bot.message_handler(commands=["telegram_wallet"])
 async def tgwallet(e):
     if e.chat.type != "private":
-        add_donation_channel(e.chat.id)
+        register_chat(e.chat)
 
-    await bot.send_message(e.chat.id,
-                           """<b>To create a wallet DM @kaspanet_bot with the command <code>/create_wallet</code>.</b>
+    OUTBOX.send_message(e.chat.id,
+                        """<b>To create a wallet DM @kaspanet_bot with the command <code>/create_wallet</code>.</b>
       
-      Then you can use:
-      <b>  /wallet_info</b> - Shows either your or the replied user's wallet information.
-      <b>  /tip 1.23 KAS</b> - reply to someone's message and send him/her a tip.
-      <b>  /withdraw kaspa:... 1.23 KAS</b> - Withdraw KAS from your Telegram wallet to another address
-      """
-                           "\n\n♥ Please consider a donation for my free work to <code>kaspa:qqkqkzjvr7zwxxmjxjkmxxdwju9kjs6e9u82uh59z07vgaks6gg62v8707g73</code>. Thank you - Rob aka lAmeR",
-                           message_thread_id=e.chat.is_forum and e.message_thread_id,
-                           parse_mode="html")
+   Then you can use:
+   <b>  /wallet_info</b> - Shows either your or the replied user's wallet information.
+   <b>  /tip 1.23 KAS</b> - reply to someone's message and send him/her a tip.
+   <b>  /withdraw kaspa:... 1.23 KAS</b> - Withdraw KAS from your Telegram wallet to another address
+   <b>  /rain 10 KAS 5</b> - Share 10 KAS among the 5 most recently active members of a group
+   """
+                        "\n\n♥ Please consider a donation for my free work to <code>kaspa:qqkqkzjvr7zwxxmjxjkmxxdwju9kjs6e9u82uh59z07vgaks6gg62v8707g73</code>. Thank you - Rob aka lAmeR",
+                        message_thread_id=e.chat.is_forum and e.message_thread_id,
+                        parse_mode="html")
 
 
 @bot.message_handler(commands=["tip"])
 async def send_kas(e):
     if e.chat.type != "private":
-        add_donation_channel(e.chat.id)
+        register_chat(e.chat)
 
     recipient_username = ""
-    sender_name = e.from_user.full_name or ""
+    sender_name = html.escape(e.from_user.full_name or "")
     try:
         # sender = e.from_user.username
         sender = f"{e.from_user.id}"
     except Exception:
-        msg = await bot.send_message(e.chat.id, f"You do not have a wallet yet. "
-                                                f"DM @kaspanet_bot with `/create_wallet` to create a new wallet.",
-                                     message_thread_id=e.chat.is_forum and e.message_thread_id,
-                                     parse_mode="Markdown")
+        msg = await OUTBOX.send_message(e.chat.id, f"You do not have a wallet yet. "
+                                                   f"DM @kaspanet_bot with `/create_wallet` to create a new wallet.",
+                                        message_thread_id=e.chat.is_forum and e.message_thread_id,
+                                        parse_mode="Markdown")
 
-        DELETE_MESSAGES_CACHE.append((time.time() + 3, e.chat.id, msg.id))
-        DELETE_MESSAGES_CACHE.append((time.time() + 3, e.chat.id, e.message_id))
+        DELETE_SCHEDULER.schedule(3, e.chat.id, msg.id, e.message_id)
 
         return
 
@@ -1010,12 +1062,11 @@ async def send_kas(e):
         #     recipient = re.search("@[^ ]+", e.text)[0]
         #     recipient_username = recipient.lstrip("@")
         # except:
-        msg = await bot.send_message(e.chat.id, "Could not determine a recipient!\n"
-                                                "Reply to someone's message and write:\n `/tip X.XX KAS`.",
-                                     message_thread_id=e.chat.is_forum and e.message_thread_id,
-                                     parse_mode="Markdown")
-        DELETE_MESSAGES_CACHE.append((time.time() + 3, e.chat.id, msg.id))
-        DELETE_MESSAGES_CACHE.append((time.time() + 3, e.chat.id, e.message_id))
+        msg = await OUTBOX.send_message(e.chat.id, "Could not determine a recipient!\n"
+                                                   "Reply to someone's message and write:\n `/tip X.XX KAS`.",
+                                        message_thread_id=e.chat.is_forum and e.message_thread_id,
+                                        parse_mode="Markdown")
+        DELETE_SCHEDULER.schedule(3, e.chat.id, msg.id, e.message_id)
         return
 
     try:
@@ -1023,61 +1074,107 @@ async def send_kas(e):
         if recipient == '5464545065':
             recipient = "kaspa:qqkqkzjvr7zwxxmjxjkmxxdwju9kjs6e9u82uh59z07vgaks6gg62v8707g73"
         else:
-            recipient = (await get_wallet(username_to_uuid(recipient.lstrip("@"))))["publicAddress"]
+            recipient = await WALLETS.address(recipient.lstrip("@"))
     except Exception:
-        msg = await bot.send_message(e.chat.id,
-                                     f"Recipient <b>{recipient_username or recipient}</b> does not have a wallet yet.\n"
-                                     f"DM @kaspanet_bot with /create_wallet to create a new wallet.",
-                                     message_thread_id=e.chat.is_forum and e.message_thread_id,
-                                     parse_mode="html")
-        DELETE_MESSAGES_CACHE.append((time.time() + 5, e.chat.id, msg.id))
-        DELETE_MESSAGES_CACHE.append((time.time() + 5, e.chat.id, e.message_id))
+        msg = await OUTBOX.send_message(e.chat.id,
+                                        f"Recipient <b>{recipient_username or recipient}</b> does not have a wallet yet.\n"
+                                        f"DM @kaspanet_bot with /create_wallet to create a new wallet.",
+                                        message_thread_id=e.chat.is_forum and e.message_thread_id,
+                                        parse_mode="html")
+        DELETE_SCHEDULER.schedule(5, e.chat.id, msg.id, e.message_id)
         return
 
     try:
         amount = float(re.search(" (\d+([.,]\d+)?)( |$)(KAS)?", e.text, re.IGNORECASE)[1].replace(",", "."))
     except Exception:
-        msg = await bot.send_message(e.chat.id, "Can't parse the amount.\n"
-                                                "Reply to someone's message and write:\n `/tip X.XX KAS`.",
-                                     message_thread_id=e.chat.is_forum and e.message_thread_id,
-                                     parse_mode="Markdown")
-        DELETE_MESSAGES_CACHE.append((time.time() + 5, e.chat.id, msg.id))
-        DELETE_MESSAGES_CACHE.append((time.time() + 5, e.chat.id, e.message_id))
+        msg = await OUTBOX.send_message(e.chat.id, "Can't parse the amount.\n"
+                                                   "Reply to someone's message and write:\n `/tip X.XX KAS`.",
+                                        message_thread_id=e.chat.is_forum and e.message_thread_id,
+                                        parse_mode="Markdown")
+        DELETE_SCHEDULER.schedule(5, e.chat.id, msg.id, e.message_id)
         return
 
     if amount < 0.00001:
-        msg = await bot.send_message(e.chat.id, "Minimum amount is 0.00001 KAS",
-                                     message_thread_id=e.chat.is_forum and e.message_thread_id,
-                                     parse_mode="Markdown")
-        DELETE_MESSAGES_CACHE.append((time.time() + 5, e.chat.id, msg.id))
-        DELETE_MESSAGES_CACHE.append((time.time() + 5, e.chat.id, e.message_id))
+        msg = await OUTBOX.send_message(e.chat.id, "Minimum amount is 0.00001 KAS",
+                                        message_thread_id=e.chat.is_forum and e.message_thread_id,
+                                        parse_mode="Markdown")
+        DELETE_SCHEDULER.schedule(5, e.chat.id, msg.id, e.message_id)
         return
 
+    await queue_tx(e, sender, recipient, round(amount * 100000000),
+                   recipient_username=recipient_username,
+                   sender_name=sender_name)
+
+
+@bot.message_handler(commands=["rain"])
+async def rain(e):
+    if e.chat.type not in ("group", "supergroup"):
+        OUTBOX.send_message(e.chat.id, "Rain is only possible in groups.",
+                            message_thread_id=e.chat.is_forum and e.message_thread_id)
+        return
+
+    register_chat(e.chat)
+    sender = f"{e.from_user.id}"
+
     try:
-        await send_kas_and_log(sender,
-                               recipient,
-                               round(amount * 100000000),
-                               e.chat.id,
-                               recipient_username=recipient_username,
-                               sender_name=sender_name,
-                               thread_id=e.chat.is_forum and e.message_thread_id)
-    except WalletInsufficientBalanceError:
-        await bot.send_message(e.chat.id, f"You don't have enough KAS to finish this transaction.",
-                               message_thread_id=e.chat.is_forum and e.message_thread_id)
+        await WALLETS.lookup(sender)
+    except WalletNotFoundError:
+        msg = await OUTBOX.send_message(e.chat.id, f"You do not have a wallet yet. "
+                                                   f"DM @kaspanet_bot with `/create_wallet` to create a new wallet.",
+                                        message_thread_id=e.chat.is_forum and e.message_thread_id,
+                                        parse_mode="Markdown")
+        DELETE_SCHEDULER.schedule(3, e.chat.id, msg.id, e.message_id)
+        return
+
+    if not (params := re.search(r" (\d+([.,]\d+)?) ?(KAS)? (\d+)\s*$", e.text, re.IGNORECASE)) \
+            or not 0 < int(params[4]) <= RAIN_MAX_RECIPIENTS:
+        msg = await OUTBOX.send_message(e.chat.id, f"Use `/rain X.XX KAS N` to share X.XX KAS among the N "
+                                                   f"(max. {RAIN_MAX_RECIPIENTS}) most recently active members.",
+                                        message_thread_id=e.chat.is_forum and e.message_thread_id,
+                                        parse_mode="Markdown")
+        DELETE_SCHEDULER.schedule(5, e.chat.id, msg.id, e.message_id)
+        return
+
+    total = round(float(params[1].replace(",", ".")) * 100000000)
+    count = int(params[4])
+
+    # most recently active first, resolved in chunks until enough of them have a wallet
+    candidates = ACTIVITY.recent(e.chat.id, exclude={e.from_user.id})
+    recipients = []
+    for i in range(0, len(candidates), count * 2):
+        chunk = candidates[i:i + count * 2]
+        addresses = await WALLETS.addresses(user_id for user_id, _ in chunk)
+        recipients += [(name, addresses[str(user_id)]) for user_id, name in chunk if str(user_id) in addresses]
+        if len(recipients) >= count:
+            break
+
+    if not (recipients := recipients[:count]):
+        msg = await OUTBOX.send_message(e.chat.id, "No recently active members with a wallet found.",
+                                        message_thread_id=e.chat.is_forum and e.message_thread_id)
+        DELETE_SCHEDULER.schedule(5, e.chat.id, msg.id, e.message_id)
+        return
+
+    if total // len(recipients) < 1000:
+        msg = await OUTBOX.send_message(e.chat.id, "Minimum amount is 0.00001 KAS per member",
+                                        message_thread_id=e.chat.is_forum and e.message_thread_id)
+        DELETE_SCHEDULER.schedule(5, e.chat.id, msg.id, e.message_id)
+        return
+
+    await queue_rain(e, sender, recipients, total // len(recipients),
+                     sender_name=html.escape(e.from_user.full_name or ""))
 
 
 @bot.message_handler(commands=["create_wallet"])
 async def create_wallet(e):
     if e.chat.type != "private":
-        add_donation_channel(e.chat.id)
+        register_chat(e.chat)
 
     if e.chat.type != "private":
-        msg = await bot.send_message(e.chat.id,
-                                     "Please use a direct message (DM) to @kaspanet_bot to create a new wallet.",
-                                     message_thread_id=e.chat.is_forum and e.message_thread_id)
+        msg = await OUTBOX.send_message(e.chat.id,
+                                        "Please use a direct message (DM) to @kaspanet_bot to create a new wallet.",
+                                        message_thread_id=e.chat.is_forum and e.message_thread_id)
 
-        DELETE_MESSAGES_CACHE.append((time.time() + 3, e.chat.id, msg.id))
-        DELETE_MESSAGES_CACHE.append((time.time() + 3, e.chat.id, e.message_id))
+        DELETE_SCHEDULER.schedule(3, e.chat.id, msg.id, e.message_id)
         return
 
     try:
@@ -1085,43 +1182,46 @@ async def create_wallet(e):
         wallet = await create_new_wallet(get_wallet_pw(f"{user_id}"),
                                          username_to_uuid(f"{user_id}"))
         seed = wallet["mnemonic"]
-        await bot.send_message(e.chat.id, f"<b>Welcome to Kaspa Telegram wallet!</b>\n"
-                                          f"Wallet creation was successful. Your kaspa address is:"
-                                          f"\n<code>{wallet['publicAddress']}</code>"
-                                          f"\n\nYour seed phrase is:\n"
-                                          f"<code>{seed}</code>\n\n"
-                                          f"To use your wallet or get information, use the following commands:\n"
-                                          "  /wallet_info - Shows either your or the replied user's wallet information.\n"
-                                          "  /tip 1.23 KAS - reply to someone's message and send him/her a tip.\n"
-                                          "  /withdraw kaspa:... 1.23 KAS - Withdraw KAS from your Telegram wallet to another address"
-                                          f"\n\nPlease be advised that neither the dev nor any of the kaspa community is"
-                                          f" responsible for any issues or losses that may occur with the use of this wallet."
-                                          f" Use at your own risk.",
-                               message_thread_id=e.chat.is_forum and e.message_thread_id,
-                               parse_mode="html")
-
-        try:
+        OUTBOX.send_message(e.chat.id, f"<b>Welcome to Kaspa Telegram wallet!</b>\n"
+                                       f"Wallet creation was successful. Your kaspa address is:"
+                                       f"\n<code>{wallet['publicAddress']}</code>"
+                                       f"\n\nYour seed phrase is:\n"
+                                       f"<code>{seed}</code>\n\n"
+                                       f"To use your wallet or get information, use the following commands:\n"
+                                       "  /wallet_info - Shows either your or the replied user's wallet information.\n"
+                                       "  /tip 1.23 KAS - reply to someone's message and send him/her a tip.\n"
+                                       "  /withdraw kaspa:... 1.23 KAS - Withdraw KAS from your Telegram wallet to another address"
+                                       f"\n\nPlease be advised that neither the dev nor any of the kaspa community is"
+                                       f" responsible for any issues or losses that may occur with the use of this wallet."
+                                       f" Use at your own risk.",
+                            message_thread_id=e.chat.is_forum and e.message_thread_id,
+                            parse_mode="html")
+
+        await WALLETS.remember(user_id, wallet["publicAddress"])
+
+        async def start_tip():
             await send_kas_and_log("xemofaucet", wallet["publicAddress"], 100000000, e.chat.id)
-            await bot.send_message(e.chat.id, "One Kaspa member gifted you 1 KAS for demo issues.",
-                                   message_thread_id=e.chat.is_forum and e.message_thread_id)
-        except:
-            logging.exception("Kaspa start tip didn't work.")
+            OUTBOX.send_message(e.chat.id, "One Kaspa member gifted you 1 KAS for demo issues.",
+                                message_thread_id=e.chat.is_forum and e.message_thread_id)
+
+        # the faucet's txs are serialized like any sender's, failures are logged by the queue
+        await TX_QUEUE.submit(f"faucet:{user_id}", "xemofaucet", start_tip)
 
 
     except WalletCreationError:
-        await bot.send_message(e.chat.id, "Wallet already created. Use /wallet_info",
-                               message_thread_id=e.chat.is_forum and e.message_thread_id)
+        OUTBOX.send_message(e.chat.id, "Wallet already created. Use /wallet_info",
+                            message_thread_id=e.chat.is_forum and e.message_thread_id)
 
 
 @bot.message_handler(commands=["kaspacity"])
 async def kaspacity(e):
     if e.chat.type != "private":
-        add_donation_channel(e.chat.id)
+        register_chat(e.chat)
 
-    with open("./res/kaspacity.jpg", "rb") as f:
-        await bot.send_photo(e.chat.id,
-                             f,
-                             f'''Do you want to play around with live KASPA transactions or just show it to a friend?
+    await MEDIA_CACHE.send_photo(OUTBOX,
+                                 e.chat.id,
+                                 "./res/kaspacity.jpg",
+                                 caption=f'''Do you want to play around with live KASPA transactions or just show it to a friend?
 
 Try out this demonstrator! Head to the office, enter the building and get a FREE $KAS! After that, you can spend it in the restaurant or the shopping mall..
 
@@ -1134,30 +1234,28 @@ Thanks to everyone who helped with the game.
 Have fun! 
 Rob 🚀 lAmeR
 ''',
-                             message_thread_id=e.chat.is_forum and e.message_thread_id)
+                                 message_thread_id=e.chat.is_forum and e.message_thread_id)
 
 
 @bot.message_handler(commands=["wallet_info", "wi"])
 async def check_wallet(e):
     if e.chat.type != "private":
-        add_donation_channel(e.chat.id)
+        register_chat(e.chat)
 
     user_id = f"{e.reply_to_message.from_user.id}" if "reply_to_message" in e.json and not e.reply_to_message.content_type.startswith(
         "forum") else f"{e.from_user.id}"
     username = f"{e.reply_to_message.from_user.username}" if "reply_to_message" in e.json and not e.reply_to_message.content_type.startswith(
         "forum") else f"{e.from_user.username}"
 
-    wallet = await get_wallet(username_to_uuid(f"{user_id}")
-                              # ,get_wallet_pw(username)
-                              )
     try:
+        address = await WALLETS.address(user_id)
         show_button = InlineKeyboardMarkup([[InlineKeyboardButton("Show in explorer",
-                                                                  url=f"https://explorer.kaspa.org/addresses/{wallet['publicAddress']}")],
+                                                                  url=f"https://explorer.kaspa.org/addresses/{address}")],
                                             [InlineKeyboardButton("Remove message",
                                                                   callback_data=f"cb_remove_message;{e.message_id};{e.from_user.id}")]
                                             ])
 
-        wallet_balance = (await kaspa_api.get_balance(wallet["publicAddress"]))["balance"] / 100000000
+        wallet_balance = (await kaspa_api.get_balance(address))["balance"] / 100000000
 
         wallet_balance = f"{wallet_balance:.8f}"
 
@@ -1165,35 +1263,24 @@ async def check_wallet(e):
             wallet_balance = wallet_balance.rstrip("0")
             wallet_balance = wallet_balance.rstrip(".")
 
-        # print("Starting")
-        # result = {}
-        # t1 = threading.Thread(target=create_qr_code_img, args=[wallet["publicAddress"], False, result])
-        # t1.start()
-        # while True:
-        #     await asyncio.sleep(0.3)
-        #     if not t1.is_alive():
-        #         break
-
-        # img_bytes = result["stream"]
+        img_bytes, price = await asyncio.gather(QR_CODES.render(address), _get_kas_price())
 
-        price = await _get_kas_price()
-
-        msg = await bot.send_message(e.chat.id,
-                                   f'@{username} telegram wallet is:\n'
-                                           f'<code>{wallet["publicAddress"]}</code>\n'
-                                           f'Balance:\n  <b>{wallet_balance} KAS</b>\n\n'
-                                           f'Value:\n  <b>{float(wallet_balance or 0) * float(price):.02f} $</b>',
-                                   parse_mode="html",
-                                   message_thread_id=e.chat.is_forum and e.message_thread_id,
-                                   reply_markup=show_button)
+        OUTBOX.send_photo(e.chat.id,
+                          img_bytes,
+                          caption=f'@{username} telegram wallet is:\n'
+                                  f'<code>{address}</code>\n'
+                                  f'Balance:\n  <b>{wallet_balance} KAS</b>\n\n'
+                                  f'Value:\n  <b>{float(wallet_balance or 0) * float(price):.02f} $</b>',
+                          parse_mode="html",
+                          message_thread_id=e.chat.is_forum and e.message_thread_id,
+                          reply_markup=show_button)
 
     except WalletNotFoundError:
-        msg = await bot.send_message(e.chat.id,
-                                     f'No KAS wallet found. Use <code>/create_wallet</code> via DM to to @kaspanet_bot to create a wallet.',
-                                     message_thread_id=e.chat.is_forum and e.message_thread_id,
-                                     parse_mode="html")
-        DELETE_MESSAGES_CACHE.append((time.time() + 180, e.chat.id, msg.id))
-        DELETE_MESSAGES_CACHE.append((time.time() + 180, e.chat.id, e.message_id))
+        msg = await OUTBOX.send_message(e.chat.id,
+                                        f'No KAS wallet found. Use <code>/create_wallet</code> via DM to to @kaspanet_bot to create a wallet.',
+                                        message_thread_id=e.chat.is_forum and e.message_thread_id,
+                                        parse_mode="html")
+        DELETE_SCHEDULER.schedule(180, e.chat.id, msg.id, e.message_id)
 
 
 # @bot.message_handler(commands=["pool", "listingpool"], func=check_debounce(60 * 10))
@@ -1229,38 +1316,248 @@ def progress_bar(perc):
     return green_boxes * "🟩" + "⬜" * (8 - green_boxes)
 
 
+def format_kas(amount):
+    """
+    :param amount: amount in sompi
+    """
+    msg_amount = f"{amount / 100000000:.8f}"
+
+    if "." in msg_amount:
+        msg_amount = msg_amount.rstrip("0")
+        msg_amount = msg_amount.rstrip(".")
+
+    return msg_amount
+
+
 async def send_kas_and_log(sender_username, to_address, amount, chat_id,
                            recipient_username=None,
                            inclusiveFee=False,
                            thread_id=None,
-                           sender_name=""):
+                           sender_name="",
+                           queued_message=None):
+    """
+    Sends the tx and posts its progress, into `queued_message` if given. Raises only if the tx
+    wasn't sent, once it is the KAS left the wallet and it's never reported as failed.
+    """
     tx_id = await create_tx(username_to_uuid(sender_username),
                             get_wallet_pw(sender_username),
                             to_address,
                             amount,
                             inclusiveFee=inclusiveFee)
 
-    msg_amount = f"{amount / 100000000:.8f}"
+    if not tx_id:
+        # unexpected answer of the wallet API, the tx may have been sent or not
+        raise WalletTransactionError()
+
+    async def post(text):
+        if queued_message:
+            await bot.edit_message_text(text,
+                                        chat_id=chat_id,
+                                        message_id=queued_message.message_id,
+                                        parse_mode="html",
+                                        disable_web_page_preview=True)
+            return queued_message.message_id
+
+        return (await OUTBOX.send_message(chat_id,
+                                          text,
+                                          parse_mode="html",
+                                          reply_to_message_id=thread_id,
+                                          disable_web_page_preview=True)).message_id
 
-    if "." in msg_amount:
-        msg_amount = msg_amount.rstrip("0")
-        msg_amount = msg_amount.rstrip(".")
+    try:
+        tx_html = (f"{sender_name} sending <b>{format_kas(amount)} KAS</b> to \n"
+                   f"{f'@{recipient_username}' if recipient_username else ''}"
+                   f"\n   <a href='https://explorer.kaspa.org/addresses/{to_address}'>{to_address[:16]}...{to_address[-10:]}</a>\n\n"
+                   f"Value\n"
+                   f"  <b>{amount / 100000000 * (await _get_kas_price()):.02f} USD</b>\n"
+                   f"TX-ID\n"
+                   f"   <a href='https://explorer.kaspa.org/txs/{tx_id}'>{tx_id[:6]}...{tx_id[-6:]}</a> ✅\n"
+                   f"Block-ID\n"
+                   f"   ⏳ in progress")
+        message_id = await post(tx_html)
+    except Exception:
+        logging.exception(f'Could not post TX {tx_id}, posting a plain message')
+        tx_html = (f"Sent <b>{format_kas(amount)} KAS</b>, confirmation pending\n"
+                   f"TX-ID\n"
+                   f"   {tx_link(tx_id)} ✅\n"
+                   f"Block-ID\n"
+                   f"   ⏳ in progress")
+        try:
+            message_id = await post(tx_html)
+        except Exception:
+            logging.exception(f'Could not post plain message of TX {tx_id}')
+            return
 
-    message = await bot.send_message(chat_id,
-                                     f"{sender_name} sending <b>{msg_amount} KAS</b> to \n"
-                                     f"{f'@{recipient_username}' if recipient_username else ''}"
-                                     f"\n   <a href='https://explorer.kaspa.org/addresses/{to_address}'>{to_address[:16]}...{to_address[-10:]}</a>\n\n"
-                                     f"Value\n"
-                                     f"  <b>{amount / 100000000 * (await _get_kas_price()):.02f} USD</b>\n"
-                                     f"TX-ID\n"
-                                     f"   <a href='https://explorer.kaspa.org/txs/{tx_id}'>{tx_id[:6]}...{tx_id[-6:]}</a> ✅\n"
-                                     f"Block-ID\n"
-                                     f"   ⏳ in progress",
-                                     parse_mode="html",
-                                     reply_to_message_id=thread_id,
-                                     disable_web_page_preview=True)
+    try:
+        await STATE.push_pending_tx(tx_id, {"chat_id": chat_id,
+                                            "message_id": message_id,
+                                            "html": tx_html})
+    except Exception:
+        logging.exception(f'Could not queue TX {tx_id} for confirmation')
 
-    TX_CHECKER[tx_id] = (time.time(), message)
+
+async def _run_queued_tx(queued_message, *args, **kwargs):
+    # send_kas_and_log only raises if the tx wasn't sent or its result is unknown
+    try:
+        await send_kas_and_log(*args, queued_message=queued_message, **kwargs)
+    except WalletInsufficientBalanceError as ex:
+        await bot.edit_message_text(f"❌ {ex or 'You do not have enough KAS to finish this transaction.'}",
+                                    chat_id=queued_message.chat.id,
+                                    message_id=queued_message.message_id)
+    except (asyncio.TimeoutError, WalletTransactionError):
+        logging.exception('Unknown result of queued TX')
+        await bot.edit_message_text("⚠ The wallet didn't answer, the transaction may have been sent or not. "
+                                    "Please check /wallet_info before trying again.",
+                                    chat_id=queued_message.chat.id,
+                                    message_id=queued_message.message_id)
+    except Exception:
+        logging.exception('Error sending queued TX')
+        await bot.edit_message_text("❌ The transaction failed, please try again later.",
+                                    chat_id=queued_message.chat.id,
+                                    message_id=queued_message.message_id)
+
+
+async def submit_tx_job(e, key, sender, job, text):
+    """
+    Queues the job behind the sender's other txs and acks the command with a "queued" message
+    at once, which the job edits in place
+    :param key: idempotency key, a redelivered update doesn't send twice
+    :param job: async function(queued_message), `queued_message` is a future of the message
+    :param text: html of the "queued" message
+    """
+    queued_message = asyncio.get_running_loop().create_future()
+
+    if await TX_QUEUE.submit(key, sender, functools.partial(job, queued_message)) is None:
+        return
+
+    try:
+        message = await OUTBOX.send_message(e.chat.id,
+                                             text,
+                                             parse_mode="html",
+                                             reply_to_message_id=e.chat.is_forum and e.message_thread_id)
+        queued_message.set_result(message)
+    except Exception as ex:
+        # the job fails without sending
+        queued_message.set_exception(ex)
+        raise
+
+
+async def queue_tx(e, sender, to_address, amount, recipient_username=None, **kwargs):
+    """
+    Queues the tx behind the sender's other txs, see submit_tx_job. The "queued" message is
+    edited in place when the tx is sent.
+    :param amount: amount in sompi
+    """
+    async def job(queued_message):
+        await _run_queued_tx(await queued_message, sender, to_address, amount, e.chat.id,
+                             recipient_username=recipient_username,
+                             thread_id=e.chat.is_forum and e.message_thread_id,
+                             **kwargs)
+
+    # the command message identifies the tx
+    await submit_tx_job(e, f"tx:{e.chat.id}:{e.message_id}", sender, job,
+                        f"⏳ Sending <b>{format_kas(amount)} KAS</b>"
+                        f"{f' to @{recipient_username}' if recipient_username else ''}"
+                        f" is queued...")
+
+
+async def send_rain(queued_message, sender_username, recipients, amount, sender_name=""):
+    """
+    Sends the txs of a rain one after another from the sender's wallet and posts one summary,
+    whose lines are marked as the txs are confirmed
+    :param recipients: list of (name, address)
+    :param amount: amount per recipient in sompi
+    :raise WalletInsufficientBalanceError: if the balance doesn't cover the first tx
+    """
+    lines = []
+    for i, (name, address) in enumerate(recipients):
+        try:
+            tx_id = await create_tx(username_to_uuid(sender_username),
+                                    get_wallet_pw(sender_username),
+                                    address,
+                                    amount)
+        except WalletInsufficientBalanceError:
+            if not any(tx_id for _, tx_id in lines):
+                # nothing sent, reported by the caller
+                raise
+
+            # the following txs would fail as well
+            lines += [(name, None) for name, _ in recipients[i:]]
+            break
+        except Exception:
+            logging.exception('Error sending rain TX')
+            tx_id = None
+
+        lines.append((name, tx_id))
+
+    sent = [tx_id for _, tx_id in lines if tx_id]
+    chat_id, message_id = queued_message.chat.id, queued_message.message_id
+
+    if not sent:
+        await bot.edit_message_text("❌ None of the rain's transfers went through. "
+                                    "Please check /wallet_info before trying again.",
+                                    chat_id=chat_id,
+                                    message_id=message_id)
+        return
+
+    # from here on the txs are sent, the rain must never be reported as failed
+    try:
+        summary = (f"🌧 {sender_name} made it rain <b>{format_kas(amount * len(sent))} KAS</b> "
+                   f"on {len(sent)} members\n"
+                   f"Value\n"
+                   f"  <b>{amount * len(sent) / 100000000 * (await _get_kas_price()):.02f} USD</b>\n\n" +
+                   "\n".join(recipient_line(name, format_kas(amount), tx_id) for name, tx_id in lines))
+
+        await bot.edit_message_text(summary,
+                                    chat_id=chat_id,
+                                    message_id=message_id,
+                                    parse_mode="html",
+                                    disable_web_page_preview=True)
+    except Exception:
+        logging.exception('Could not post rain summary, sending a plain one')
+        summary = (f"🌧 Rain of <b>{format_kas(amount * len(sent))} KAS</b> sent to {len(sent)} members\n\n" +
+                   "\n".join(f"{tx_link(tx_id)} {PENDING}" for tx_id in sent))
+        try:
+            message_id = (await OUTBOX.send_message(chat_id,
+                                                    summary,
+                                                    parse_mode="html",
+                                                    disable_web_page_preview=True)).message_id
+        except Exception:
+            logging.exception('Could not send plain rain summary')
+
+    for tx_id in sent:
+        try:
+            await STATE.push_pending_tx(tx_id, {"chat_id": chat_id,
+                                                "message_id": message_id,
+                                                "html": summary,
+                                                "rain": True})
+        except Exception:
+            logging.exception(f'Could not queue rain TX {tx_id} for confirmation')
+
+
+async def queue_rain(e, sender, recipients, amount, sender_name=""):
+    """
+    Queues the rain as one job behind the sender's other txs, see submit_tx_job
+    :param amount: amount per recipient in sompi
+    """
+    async def job(queued_message):
+        message = await queued_message
+        try:
+            await send_rain(message, sender, recipients, amount, sender_name=sender_name)
+        except WalletInsufficientBalanceError as ex:
+            await bot.edit_message_text(f"❌ {ex or 'You do not have enough KAS to make it rain.'}",
+                                        chat_id=message.chat.id,
+                                        message_id=message.message_id)
+        except Exception:
+            # send_rain doesn't raise once a tx is sent
+            logging.exception('Error sending rain')
+            await bot.edit_message_text("❌ The rain failed, please try again later.",
+                                        chat_id=message.chat.id,
+                                        message_id=message.message_id)
+
+    await submit_tx_job(e, f"rain:{e.chat.id}:{e.message_id}", sender, job,
+                        f"⏳ Rain of <b>{format_kas(amount * len(recipients))} KAS</b> "
+                        f"on {len(recipients)} members is queued...")
 
 
 async def get_price_message(days):
@@ -1294,33 +1591,112 @@ async def get_price_message(days):
     return message
 
 
-@cached(ttl=600)
+@cached(ttl=120, stale_ttl=10 * 60, error_ttl=10)
+async def _request_kas_price():
+    print("checking new price")
+    async with http_client.get("https://api.kaspa.org/info/price") as resp:
+        resp.raise_for_status()
+        return (await resp.json())["price"]
+
+
 async def _get_kas_price():
     try:
-        print("checking new price")
-        async with aiohttp.ClientSession() as session:
-            async with session.get("https://api.kaspa.org/info/price") as resp:
-                if resp.status == 200:
-                    return (await resp.json())["price"]
-                else:
-                    return 0
-
+        return await MARKET.get("kas_price")
     except Exception as e:
         logging.exception(str(e))
         return 0
 
 
-DONATION_CHANNELS = [-1001589070884, -1001205240510, -1001778657727, -1001208691907, -1001695274086, -1001831752155,
-                     -1001707714192, -1001629453639, -1001593411704, -1001493667078, -1001602068748, -1001663502725,
-                     -1001539492361, -1001670476757, -1001804214136, -1001877039289, -1001688255696]
+async def _request_blockdag_info():
+    # prefer the own node, if there is one
+    if KaspaInterface.kaspad_hosts():
+        try:
+            return await KaspaInterface.get_blockdag_info_async()
+        except Exception:
+            logging.exception('Error requesting blockdag info from kaspad, using REST-API')
+
+    return await kaspa_api.get_blockdag_info()
+
+
+MARKET = SnapshotService({
+    "coin_info": (_request_coin_info, 20),
+    "coin_supply": (kaspa_api.get_coin_supply, 60),
+    "hashrate": (kaspa_api.get_hashrate, 15),
+    "blockdag_info": (_request_blockdag_info, 5),
+    "kas_price": (_request_kas_price, 60),
+})
+
+
+INITIAL_CHANNELS = [-1001589070884, -1001205240510, -1001778657727, -1001208691907, -1001695274086, -1001831752155,
+                    -1001707714192, -1001629453639, -1001593411704, -1001493667078, -1001602068748, -1001663502725,
+                    -1001539492361, -1001670476757, -1001804214136, -1001877039289, -1001688255696]
 
 IGNORE_CHANNELS = [-1001516174742]
 
 
-def add_donation_channel(chat_id):
-    global DONATION_CHANNELS
-    if chat_id not in DONATION_CHANNELS:
-        DONATION_CHANNELS.append(chat_id)
+CHATS = ChatRegistry(os.getenv("BOT_DB_PATH", "./bot.db"), seed=INITIAL_CHANNELS)
+WALLETS = WalletIndex(os.getenv("BOT_DB_PATH", "./bot.db"))
+TX_QUEUE = TipQueue(STATE.claim, concurrency=int(os.getenv("TIP_CONCURRENCY", 8)))
+
+RAIN_MAX_RECIPIENTS = int(os.getenv("RAIN_MAX_RECIPIENTS", 25))
+# updates are sharded by chat, so the worker handling a chat sees all of its members' messages
+ACTIVITY = ActivityTracker()
+
+
+async def track_activity(messages):
+    for message in messages:
+        ACTIVITY.see(message)
+
+
+bot.set_update_listener(track_activity)
+
+
+async def update_member_count(chat_id):
+    try:
+        CHATS.set_member_count(chat_id, await bot.get_chat_member_count(chat_id))
+    except Exception:
+        logging.exception(f'Could not get member count of {chat_id}')
+
+
+def register_chat(chat):
+    if CHATS.see(chat):
+        asyncio.ensure_future(update_member_count(chat.id))
+
+
+BROADCASTER = Broadcaster(OUTBOX,
+                          os.getenv("BROADCAST_JOBS_FILE", "./broadcast_jobs.json"),
+                          concurrency=int(os.getenv("BROADCAST_CONCURRENCY", 100)),
+                          on_prune=CHATS.remove,
+                          on_failure=CHATS.record_failure)
+
+
+def start_broadcast(payload):
+    """
+    Starts a broadcast queued by /announce, in the leader
+    """
+    job = BROADCASTER.start(CHATS.active_chats(exclude=payload.get("exclude", ())),
+                            payload["text"],
+                            **payload["kwargs"])
+
+    if reply_to := payload.get("reply_to"):
+        OUTBOX.send_message(reply_to[0],
+                            f"Broadcast {job.id} started for {len(job.status)} chats. See /broadcasts",
+                            message_thread_id=reply_to[1])
+
+
+async def run_broadcasts():
+    """
+    Runs the broadcasts of all workers: resumes the unfinished ones and starts the queued ones
+    """
+    asyncio.ensure_future(BROADCASTER.resume())
+
+    while True:
+        try:
+            if payload := await STATE.pop_broadcast(timeout=5):
+                start_broadcast(payload)
+        except Exception:
+            logging.exception('Error starting broadcast')
+            await asyncio.sleep(1)
 
 
 async def check_donations():
@@ -1336,24 +1712,16 @@ async def check_donations():
                 continue
 
             if donation_balance != donation_announced:
-                if donation_announced:
-                    for c_id in DONATION_CHANNELS:
-                        if c_id in IGNORE_CHANNELS:
-                            continue
-
-                        try:
-                            if (donation_balance - donation_announced) >= 1000:
-                                await bot.send_message(c_id,
-                                                       f"<b>Donation received for</b>\n"
-                                                       f"* Telegram bot\n"
-                                                       f"* REST-API\n"
-                                                       f"* Blockexplorer\n"
-                                                       f"* Telegram wallet feature\n\n"
-                                                       f"Did you see the super fast speed?\n\nThank you for <b>{donation_balance - donation_announced:,.0f} KAS</b> donated to \n"
-                                                       f"<code>kaspa:qqkqkzjvr7zwxxmjxjkmxxdwju9kjs6e9u82uh59z07vgaks6gg62v8707g73</code>\nI appreciate ♥♥♥",
-                                                       parse_mode="html")
-                        except Exception:
-                            pass
+                if donation_announced and (donation_balance - donation_announced) >= 1000:
+                    BROADCASTER.start(CHATS.active_chats(exclude=IGNORE_CHANNELS),
+                                      f"<b>Donation received for</b>\n"
+                                      f"* Telegram bot\n"
+                                      f"* REST-API\n"
+                                      f"* Blockexplorer\n"
+                                      f"* Telegram wallet feature\n\n"
+                                      f"Did you see the super fast speed?\n\nThank you for <b>{donation_balance - donation_announced:,.0f} KAS</b> donated to \n"
+                                      f"<code>kaspa:qqkqkzjvr7zwxxmjxjkmxxdwju9kjs6e9u82uh59z07vgaks6gg62v8707g73</code>\nI appreciate ♥♥♥",
+                                      parse_mode="html")
 
                 donation_announced = donation_balance
         except Exception:
@@ -1362,90 +1730,91 @@ async def check_donations():
         await asyncio.sleep(5)
 
 
-async def check_del_messages():
-    while True:
-        for ts, chat_id, msg_id in list(DELETE_MESSAGES_CACHE):
-            if time.time() >= ts:
-                DELETE_MESSAGES_CACHE.remove((ts, chat_id, msg_id))
-                try:
-                    await bot.delete_message(chat_id, msg_id)
-                except Exception:
-                    logging.exception('Can not remove this message. Sorry')
+async def _fetch_tip_hash():
+    return (await http_client.get_json(r"https://api.kaspa.org/info/network"))["tipHashes"][0]
 
-        await asyncio.sleep(2)
 
+async def _fetch_blocks(low_hash):
+    return await http_client.get_json(fr"https://api.kaspa.org/blocks?lowHash={low_hash}&includeBlocks=true")
 
-async def check_tx_ids():
-    print("Check TX IDs")
 
-    async with aiohttp.ClientSession() as session:
-        async with session.get(r"https://api.kaspa.org/info/network") as resp:
-            start_block = (await resp.json())["tipHashes"][0]
+async def edit_rain_summary(chat_id, message_id, html):
+    await bot.edit_message_text(html,
+                                chat_id=chat_id,
+                                message_id=message_id,
+                                parse_mode="html",
+                                disable_web_page_preview=True)
 
-    i = 0
 
-    logging.info("Starting Thread: check_tx_ids")
+RAIN_SUMMARIES = RainSummaries(edit_rain_summary)
 
-    while True:
-        i += 1
 
-        try:
+async def on_tx_confirmed(tx_id, block_hash, message, seconds_needed):
+    if message.get("rain"):
+        RAIN_SUMMARIES.mark(message, tx_id, CONFIRMED)
+        return
 
-            if TX_CHECKER:
-                for tx_id, tx_object in dict(TX_CHECKER).items():
-                    start_time, message = tx_object
-                    stop_time = time.time()
-                    try:
-                        async with aiohttp.ClientSession() as session:
-                            async with session.get(
-                                    fr"https://api.kaspa.org/blocks?lowHash={start_block}&includeBlocks=true") as r:
-                                resp = await r.json()
+    old_html = message["html"]
+    new_html = old_html.replace("⏳ in progress",
+                                f"<a href='https://explorer.kaspa.org/blocks/{block_hash}'>{block_hash[:6]}...{block_hash[-6:]}</a> ✅")
 
-                    except Exception:
-                        await asyncio.sleep(0.3)
-                        continue
-
-                    # go through blocks and check tx_id
-                    for block in resp["blocks"]:
-                        if tx_id in TX_CHECKER and tx_id in block["verboseData"]["transactionIds"]:
-                            block_hash = block["verboseData"]["hash"]
-
-                            old_html = message.html_text
-                            new_html = old_html.replace("⏳ in progress",
-                                                        f"<a href='https://explorer.kaspa.org/blocks/{block_hash}'>{block_hash[:6]}...{block_hash[-6:]}</a> ✅")
-
-                            new_html = new_html.replace("Sending", "Sent")
-
-                            new_html += f"\nTime needed:\n   ~ {stop_time - start_time:.02f}s"
-
-                            await bot.edit_message_text(new_html,
-                                                        chat_id=message.chat.id,
-                                                        message_id=message.message_id,
-                                                        parse_mode="html",
-                                                        disable_web_page_preview=True,
-                                                        reply_markup=InlineKeyboardMarkup(
-                                                            [[InlineKeyboardButton("Show TX",
-                                                                                   url=f"https://explorer.kaspa.org/txs/{tx_id}")],
-                                                             [InlineKeyboardButton("Show block",
-                                                                                   url=f"https://explorer.kaspa.org/blocks/{block_hash}")]])
-                                                        )
-
-                            print(f"removing {tx_id}")
-                            TX_CHECKER.pop(tx_id)
-
-            if i >= 80:
-                try:
-                    async with aiohttp.ClientSession() as session:
-                        async with session.get(r"https://api.kaspa.org/info/network") as resp:
-                            start_block = (await resp.json())["tipHashes"][0]
+    new_html = new_html.replace("Sending", "Sent")
 
-                except Exception:
-                    continue
+    new_html += f"\nTime needed:\n   ~ {seconds_needed:.02f}s"
+
+    await bot.edit_message_text(new_html,
+                                chat_id=message["chat_id"],
+                                message_id=message["message_id"],
+                                parse_mode="html",
+                                disable_web_page_preview=True,
+                                reply_markup=InlineKeyboardMarkup(
+                                    [[InlineKeyboardButton("Show TX",
+                                                           url=f"https://explorer.kaspa.org/txs/{tx_id}")],
+                                     [InlineKeyboardButton("Show block",
+                                                           url=f"https://explorer.kaspa.org/blocks/{block_hash}")]])
+                                )
+
+    print(f"removing {tx_id}")
 
-                i = 0
-            await asyncio.sleep(0.5)
+
+async def on_tx_expired(tx_id, message):
+    if message.get("rain"):
+        RAIN_SUMMARIES.mark(message, tx_id, NOT_FOUND)
+        return
+
+    await bot.edit_message_text(message["html"].replace("⏳ in progress", "❓ not found yet, see explorer"),
+                                chat_id=message["chat_id"],
+                                message_id=message["message_id"],
+                                parse_mode="html",
+                                disable_web_page_preview=True,
+                                reply_markup=InlineKeyboardMarkup(
+                                    [[InlineKeyboardButton("Show TX",
+                                                           url=f"https://explorer.kaspa.org/txs/{tx_id}")]]))
+
+
+TX_SCANNER = TxConfirmationScanner(_fetch_tip_hash, _fetch_blocks, on_tx_confirmed, on_tx_expired)
+
+KASPAD_NOTIFIER = KaspadNotifier(KaspaInterface.kaspad_hosts(), TX_SCANNER) if KaspaInterface.kaspad_hosts() else None
+
+
+async def forward_pending_txs():
+    """
+    Hands the txs sent by all workers to the confirmation scanner
+    """
+    while True:
+        try:
+            if pending := await STATE.pop_pending_tx(timeout=5):
+                TX_SCANNER.add(*pending)
         except Exception:
-            logging.exception('Error in TX-checker-thread')
+            logging.exception('Error reading pending TXs')
+            await asyncio.sleep(1)
+
+
+async def get_daa_score():
+    if KASPAD_NOTIFIER and KASPAD_NOTIFIER.connected and KASPAD_NOTIFIER.daa_score:
+        return KASPAD_NOTIFIER.daa_score
+
+    return int((await MARKET.get("blockdag_info"))["virtualDaaScore"])
 
 
 async def check_exchange_pool():
@@ -1461,13 +1830,12 @@ async def check_exchange_pool():
         if donation_balance != donation_announced:
             if donation_announced:
                 if donation_balance - donation_announced >= 5000:
-                    for c_id in DONATION_CHANNELS:
-                        await bot.send_message(c_id,  # -1001589070884,
-                                               f"[Exchange funding pool](https://explorer.kaspa.org/addresses/kaspa:qzgranawalr2apfz2pzq7rle20gnw37u0yfqew3nsm0acsanf0mjcehzgqc5d)\n"
-                                               f" We received a new donation of\n\n"
-                                               f" *{donation_balance - donation_announced:,.0f} KAS* for the new exchange"
-                                               f"\n\n♥♥♥",
-                                               parse_mode="Markdown")
+                    BROADCASTER.start(CHATS.active_chats(),
+                                      f"[Exchange funding pool](https://explorer.kaspa.org/addresses/kaspa:qzgranawalr2apfz2pzq7rle20gnw37u0yfqew3nsm0acsanf0mjcehzgqc5d)\n"
+                                      f" We received a new donation of\n\n"
+                                      f" *{donation_balance - donation_announced:,.0f} KAS* for the new exchange"
+                                      f"\n\n♥♥♥",
+                                      parse_mode="Markdown")
 
             donation_announced = donation_balance
         time.sleep(60)
@@ -1475,30 +1843,130 @@ async def check_exchange_pool():
 
 @bot.message_handler(commands=["version"])
 async def version(e):
-    await bot.send_message(e.chat.id,
-                           f"*Kaspa Telegram Bot version: {os.getenv('VERSION', 'x.x.x')}*",
-                           message_thread_id=e.chat.is_forum and e.message_thread_id,
-                           parse_mode="Markdown")
+    OUTBOX.send_message(e.chat.id,
+                        f"*Kaspa Telegram Bot version: {os.getenv('VERSION', 'x.x.x')}*",
+                        message_thread_id=e.chat.is_forum and e.message_thread_id,
+                        parse_mode="Markdown")
 
 
 @bot.message_handler(commands=["channels"])
 async def channels(e):
-    global DONATION_CHANNELS
     if e.chat.id == 1922783296:
-        await bot.send_message(e.chat.id,
-                               f"{DONATION_CHANNELS}",
-                               message_thread_id=e.chat.is_forum and e.message_thread_id,
-                               parse_mode="Markdown")
+        # in a code block, the underscores of the keys aren't markdown
+        OUTBOX.send_message(e.chat.id,
+                            "```\n" + "\n".join(f"{key}: {value:,}" for key, value in CHATS.stats().items()) + "\n```",
+                            message_thread_id=e.chat.is_forum and e.message_thread_id,
+                            parse_mode="Markdown")
+
+
+def background_tasks(leader=True):
+    """
+    :param leader: only one worker confirms txs, watches the donation address etc.
+    """
+    tasks = [OUTBOX.run(), DELETE_SCHEDULER.run(), CHAT_ADMINS.run(), CHATS.run(), MARKET.run(),
+             KaspaInterface.POOL.run()]
+
+    if leader:
+        tasks += [run_broadcasts(), TX_SCANNER.run(), forward_pending_txs(), check_donations(),
+                  *([KASPAD_NOTIFIER.run()] if KASPAD_NOTIFIER else [])]
+
+    return tasks
+
+
+def startup(leader=True):
+    """
+    Opens the databases in the process running the bot, SQLite connections must not be inherited
+    across fork(), so they are never opened at import
+    :param leader: the leader runs the broadcasts, the only writer of their jobs file
+    """
+    CHATS.open()
+    WALLETS.open()
+
+    if leader:
+        BROADCASTER.open()
+
+
+async def shutdown():
+    await http_client.close()
+    await STATE.close()
+    CHARTS.shutdown()
+    QR_CODES.shutdown()
+    KaspaInterface.POOL.close()
+    CHATS.close()
+    WALLETS.close()
+
+
+async def set_webhook():
+    await bot.set_webhook(WEBHOOK_URL,
+                          secret_token=WEBHOOK_SECRET,
+                          max_connections=min(HANDLER_CONCURRENCY * BOT_WORKERS, 100))
+    logging.info(f'Webhook set to {WEBHOOK_URL}')
+
+
+async def run_worker(index, update_queue):
+    startup(leader=index == 0)
+
+    if index == 0:
+        await set_webhook()
+
+    consumer = asyncio.ensure_future(consume_updates(bot, update_queue, HANDLER_CONCURRENCY))
+    tasks = [consumer, *map(asyncio.ensure_future, background_tasks(leader=index == 0))]
+
+    try:
+        # the consumer returns when the ingress stops the worker, background tasks only on errors
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await shutdown()
+
+
+def worker_main(index, update_queue):
+    # Ctrl+C reaches the whole process group, the ingress stops the workers itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.info(f'Starting bot worker {index}')
+    CHARTS.start()
+    asyncio.run(run_worker(index, update_queue))
 
 
 if __name__ == '__main__':
     import asyncio
 
 
-    async def run():
-        await asyncio.gather(check_tx_ids(), check_donations(), check_del_messages(),
-                             bot.polling(non_stop=True),
-                             return_exceptions=False)
+    async def receive_updates():
+        if WEBHOOK_URL:
+            await set_webhook()
+            await WebhookServer(bot, WEBHOOK_PATH, port=WEBHOOK_PORT, secret_token=WEBHOOK_SECRET,
+                                max_queue=WEBHOOK_QUEUE_SIZE, concurrency=HANDLER_CONCURRENCY).run()
+        else:
+            # polling fails while a webhook is set
+            await bot.delete_webhook()
+            await bot.polling(non_stop=True)
+
 
+    async def run():
+        startup()
 
-    asyncio.run(run())
+        try:
+            await asyncio.gather(*background_tasks(),
+                                 receive_updates(),
+                                 return_exceptions=False)
+        finally:
+            await shutdown()
+
+
+    if BOT_WORKERS > 1:
+        if isinstance(STATE, MemoryBackend):
+            raise SystemExit("BOT_WORKERS > 1 needs a shared state backend, set REDIS_URL.")
+        if not WEBHOOK_URL:
+            raise SystemExit("BOT_WORKERS > 1 receives updates via webhook, set WEBHOOK_URL.")
+
+        # updates are sharded by chat across the workers
+        ShardedIngress(BOT_WORKERS, worker_main, WEBHOOK_PATH, port=WEBHOOK_PORT, secret_token=WEBHOOK_SECRET,
+                       max_queue=WEBHOOK_QUEUE_SIZE).run()
+    else:
+        CHARTS.start()
+        asyncio.run(run())
@@ -0,0 +1,218 @@
+# encoding: utf-8
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from collections import Counter
+
+from send_queue import BROADCAST
+
+_logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+SENT = "sent"
+FAILED = "failed"
+PRUNED = "pruned"
+
+# errors meaning the bot can't post into the chat anymore
+PRUNE_ERRORS = ("bot was kicked",
+                "bot is not a member",
+                "chat not found",
+                "bot was blocked by the user",
+                "user is deactivated")
+
+
+def _is_gone(ex):
+    description = str(getattr(ex, "description", ex)).lower()
+    return any(error in description for error in PRUNE_ERRORS)
+
+
+class BroadcastJob(object):
+    """
+    One message sent to many chats, with the delivery status per chat
+    """
+
+    def __init__(self, job_id, text, chat_ids=(), kwargs=None, status=None, created=None, finished=None):
+        self.id = job_id
+        self.text = text
+        self.kwargs = kwargs or {}
+        self.status = status or {chat_id: PENDING for chat_id in chat_ids}
+        self.created = created or time.time()
+        self.finished = finished
+        self.started = None  # start of the current run, for the throughput
+
+    @property
+    def pending(self):
+        return [chat_id for chat_id, status in self.status.items() if status == PENDING]
+
+    def counts(self):
+        return Counter(self.status.values())
+
+    def summary(self):
+        counts = self.counts()
+        done = len(self.status) - counts[PENDING]
+        elapsed = (self.finished or time.time()) - (self.started or self.created)
+
+        return (f"Broadcast {self.id} ({'finished' if self.finished else 'running'})\n"
+                f"  {done}/{len(self.status)} chats done\n"
+                f"  sent: {counts[SENT]}, failed: {counts[FAILED]}, pruned: {counts[PRUNED]}\n"
+                f"  {counts[SENT] / max(elapsed, 1e-3):.1f} msg/s")
+
+    def to_dict(self):
+        return {"id": self.id,
+                "text": self.text,
+                "kwargs": self.kwargs,
+                # json keys are strings
+                "status": {str(chat_id): status for chat_id, status in self.status.items()},
+                "created": self.created,
+                "finished": self.finished}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["id"], data["text"],
+                   kwargs=data["kwargs"],
+                   status={int(chat_id): status for chat_id, status in data["status"].items()},
+                   created=data["created"],
+                   finished=data["finished"])
+
+
+def read_jobs(path):
+    """
+    :return: list of the BroadcastJobs stored in `path`
+    """
+    try:
+        with open(path) as f:
+            return [BroadcastJob.from_dict(data) for data in json.load(f)]
+    except FileNotFoundError:
+        return []
+
+
+class Broadcaster(object):
+    """
+    Sends broadcast jobs through the send queue with bounded concurrency.
+
+    Chats the bot was removed from are pruned via `on_prune`. Jobs are stored as json, so unfinished
+    jobs resume after a restart without sending twice to the chats already done. Only one process
+    may run the jobs and write the file, it calls `open` first. Other processes read the jobs from
+    the file.
+    """
+
+    def __init__(self, outbox, path, concurrency=100, on_prune=None, on_failure=None, save_interval=2,
+                 keep_finished=20):
+        """
+        :param outbox: send_queue.SendQueue
+        :param on_prune: function(chat_id), called for chats the bot can't post into anymore
+        :param on_failure: function(chat_id), called for other failed deliveries
+        """
+        self._outbox = outbox
+        self._path = path
+        self._concurrency = concurrency
+        self._on_prune = on_prune
+        self._on_failure = on_failure
+        self._save_interval = save_interval
+        self._keep_finished = keep_finished
+        self._last_save = 0
+        self._save_lock = asyncio.Lock()
+        self._opened = False
+
+        self.jobs = {}
+
+    def open(self):
+        """
+        Loads the stored jobs, in the process running them
+        """
+        try:
+            self.jobs = {job.id: job for job in read_jobs(self._path)}
+        except Exception:
+            _logger.exception(f'Could not read broadcast jobs {self._path}')
+        self._opened = True
+
+    async def recent_jobs(self, count=5):
+        """
+        :return: the last `count` jobs, read from the file if they run in another process
+        """
+        if self._opened:
+            jobs = list(self.jobs.values())
+        else:
+            jobs = await asyncio.get_running_loop().run_in_executor(None, read_jobs, self._path)
+        return jobs[-count:]
+
+    def _write(self, jobs):
+        # with a pid suffix, a tmp file is never written by two processes
+        tmp_path = f"{self._path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(jobs, f)
+        os.replace(tmp_path, self._path)
+
+    async def _save(self):
+        finished = [job for job in self.jobs.values() if job.finished]
+        for job in finished[:-self._keep_finished or None]:
+            del self.jobs[job.id]
+
+        self._last_save = time.time()
+        jobs = [job.to_dict() for job in self.jobs.values()]
+        try:
+            # the lock keeps the writes in order
+            async with self._save_lock:
+                await asyncio.get_running_loop().run_in_executor(None, self._write, jobs)
+        except Exception:
+            _logger.exception(f'Could not write broadcast jobs {self._path}')
+
+    def start(self, chat_ids, text, **kwargs):
+        """
+        Starts a broadcast job in the background
+        :param kwargs: json serializable arguments of send_message, e.g. parse_mode
+        :return: BroadcastJob
+        """
+        assert self._opened, "broadcasts run in the process which opened the broadcaster"
+
+        job = BroadcastJob(uuid.uuid4().hex[:8], text, chat_ids, kwargs)
+        self.jobs[job.id] = job
+
+        asyncio.ensure_future(self.run_job(job))
+        return job
+
+    async def resume(self):
+        """
+        Continues the jobs which didn't finish before the last shutdown
+        """
+        unfinished = [job for job in self.jobs.values() if not job.finished]
+
+        if unfinished:
+            _logger.info(f'Resuming {len(unfinished)} broadcast job(s).')
+            await asyncio.gather(*[self.run_job(job) for job in unfinished])
+
+    async def _deliver(self, job, chat_id, semaphore):
+        async with semaphore:
+            try:
+                await self._outbox.send_message(chat_id, job.text, priority=BROADCAST, **job.kwargs)
+                job.status[chat_id] = SENT
+            except Exception as ex:
+                if _is_gone(ex):
+                    job.status[chat_id] = PRUNED
+                    if self._on_prune:
+                        self._on_prune(chat_id)
+                else:
+                    job.status[chat_id] = FAILED
+                    if self._on_failure:
+                        self._on_failure(chat_id)
+
+        if time.time() - self._last_save >= self._save_interval:
+            await self._save()
+
+    async def run_job(self, job):
+        job.started = time.time()
+        semaphore = asyncio.Semaphore(self._concurrency)
+        await self._save()
+
+        try:
+            await asyncio.gather(*[self._deliver(job, chat_id, semaphore) for chat_id in job.pending])
+        finally:
+            if not job.pending:
+                job.finished = time.time()
+            await self._save()
+
+        _logger.info(job.summary())
+        return job
@@ -0,0 +1,312 @@
+# encoding: utf-8
+import asyncio
+import functools
+import io
+import logging
+import multiprocessing
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+
+import numpy
+from PIL import Image, ImageDraw, ImageFont
+
+from single_flight import SingleFlightCache
+
+_logger = logging.getLogger(__name__)
+
+CHART_SIZE = (700, 500)
+CHART_BACKGROUND = "#111111"
+CHART_GRID = "#283442"
+CHART_FONT_COLOR = "#F6F5F4"
+CHART_LINE_COLOR = "#14F1D9"
+
+# more points than this can't be seen on the chart anyway
+CHART_MAX_POINTS = int(os.getenv("CHART_MAX_POINTS", 600))
+
+
+def lttb(data, threshold):
+    """
+    Largest-Triangle-Three-Buckets downsampling, keeps peaks and dips of the series.
+    :param data: numpy array of shape (n, 2), sorted by x
+    :param threshold: number of points to keep
+    :return: numpy array of shape (threshold, 2)
+    """
+    n = len(data)
+    if threshold >= n or threshold < 3:
+        return data
+
+    every = (n - 2) / (threshold - 2)
+    bounds = numpy.append((numpy.arange(threshold - 1) * every).astype(int) + 1, n)
+
+    sampled = numpy.empty((threshold, 2))
+    sampled[0] = data[0]
+    sampled[-1] = data[-1]
+    a = data[0]
+
+    for i in range(threshold - 2):
+        bucket = data[bounds[i]:bounds[i + 1]]
+        c = data[bounds[i + 1]:bounds[i + 2]].mean(axis=0)
+
+        areas = numpy.abs((a[0] - c[0]) * (bucket[:, 1] - a[1]) - (a[0] - bucket[:, 0]) * (c[1] - a[1]))
+        a = sampled[i + 1] = bucket[areas.argmax()]
+
+    return sampled
+
+
+def prepare_prices(prices, max_points=CHART_MAX_POINTS):
+    """
+    Converts CoinGecko's market_chart prices in one pass and downsamples them for rendering.
+    :param prices: [[timestamp ms, price], ...]
+    :return: numpy array of shape (<= max_points, 2)
+    """
+    data = numpy.asarray(prices, dtype=numpy.float64).reshape(-1, 2)
+    data = data[~numpy.isnan(data).any(axis=1)]
+    return lttb(data, max_points)
+
+
+def render_plotly(prices, days):
+    """
+    Renders the KAS / USD line chart as PNG. Runs in a worker process, so no module-level side effects here.
+    :param prices: numpy array of [timestamp ms, price] rows, see prepare_prices
+    :return: PNG bytes
+    """
+    import pandas
+    import plotly.express as px
+
+    a = pandas.DataFrame({"Time": pandas.to_datetime(prices[:, 0], unit="ms"),
+                          "USD": prices[:, 1]})
+
+    basic_plot = px.line(
+        a,
+        x="Time",
+        y="USD",
+        template="plotly_dark"
+    )
+    label_days = "24h" if days == 1 else f"{days}d"
+    basic_plot.update_xaxes(title_font_size=15)
+    basic_plot.update_yaxes(title_font_size=15)
+    basic_plot.update_layout(
+        title=f"KAS / USD chart - {label_days}",
+        font={
+            "size": 15,
+            "color": "#F6F5F4"
+        }
+    )
+    basic_plot.update_traces(line={
+        "color": "#14F1D9"
+    })
+
+    f = io.BytesIO()
+    basic_plot.write_image(f)
+
+    return f.getvalue()
+
+
+def _load_font(size):
+    try:
+        return ImageFont.truetype("DejaVuSans.ttf", size)
+    except OSError:
+        try:
+            return ImageFont.load_default(size=size)
+        except TypeError:
+            # Pillow < 10.1
+            return ImageFont.load_default()
+
+
+def _nice_ticks(low, high, count=5):
+    """
+    Round tick values (1, 2, 2.5, 5 * 10^x steps) covering low..high
+    """
+    if high <= low:
+        high = low + (abs(low) or 1) * 0.01
+
+    raw_step = (high - low) / count
+    magnitude = 10 ** math.floor(math.log10(raw_step))
+    step = next(m * magnitude for m in (1, 2, 2.5, 5, 10) if m * magnitude >= raw_step)
+
+    first = math.ceil(low / step) * step
+    return [first + i * step for i in range(int((high - first) / step) + 1)]
+
+
+def _format_price(value, step):
+    decimals = max(0, -math.floor(math.log10(step)) + (1 if step / 10 ** math.floor(math.log10(step)) == 2.5 else 0))
+    return f"{value:.{decimals}f}"
+
+
+def render_pillow(prices, days):
+    """
+    Draws the same dark KAS / USD line chart as render_plotly directly with Pillow.
+    :param prices: numpy array of [timestamp ms, price] rows, see prepare_prices
+    :return: PNG bytes
+    """
+    width, height = CHART_SIZE
+    left, right, top, bottom = 95, width - 45, 70, height - 70
+
+    img = Image.new("RGB", CHART_SIZE, CHART_BACKGROUND)
+    draw = ImageDraw.Draw(img)
+    font = _load_font(15)
+    title_font = _load_font(17)
+
+    label_days = "24h" if days == 1 else f"{days}d"
+    draw.text((left, 25), f"KAS / USD chart - {label_days}", fill=CHART_FONT_COLOR, font=title_font)
+
+    times = prices[:, 0]
+    values = prices[:, 1]
+    t_min, t_max = float(times.min()), float(times.max())
+    t_range = (t_max - t_min) or 1
+
+    y_ticks = _nice_ticks(float(values.min()), float(values.max()))
+    y_step = y_ticks[1] - y_ticks[0] if len(y_ticks) > 1 else (y_ticks[0] or 1)
+    y_min, y_max = min(float(values.min()), y_ticks[0]), max(float(values.max()), y_ticks[-1])
+    y_range = (y_max - y_min) or 1
+
+    def to_xy(t, v):
+        return (left + (t - t_min) / t_range * (right - left),
+                bottom - (v - y_min) / y_range * (bottom - top))
+
+    # horizontal grid and price labels
+    for tick in y_ticks:
+        _, y = to_xy(t_min, tick)
+        draw.line([(left, y), (right, y)], fill=CHART_GRID, width=1)
+        label = _format_price(tick, y_step)
+        draw.text((left - 8, y), label, fill=CHART_FONT_COLOR, font=font, anchor="rm")
+
+    # vertical grid and time labels
+    time_format = "%H:%M" if days <= 1 else ("%b %d" if days <= 180 else "%b %Y")
+    for i in range(6):
+        t = t_min + t_range * i / 5
+        x, _ = to_xy(t, y_min)
+        draw.line([(x, top), (x, bottom)], fill=CHART_GRID, width=1)
+        draw.text((x, bottom + 8), f"{datetime.fromtimestamp(t / 1000, tz=timezone.utc):{time_format}}",
+                  fill=CHART_FONT_COLOR, font=font, anchor="mt")
+
+    draw.text(((left + right) / 2, height - 22), "Time", fill=CHART_FONT_COLOR, font=font, anchor="mm")
+    y_title = Image.new("RGB", (60, 20), CHART_BACKGROUND)
+    ImageDraw.Draw(y_title).text((30, 10), "USD", fill=CHART_FONT_COLOR, font=font, anchor="mm")
+    y_title = y_title.rotate(90, expand=True)
+    img.paste(y_title, (10, int((top + bottom) / 2 - y_title.size[1] / 2)))
+
+    xs, ys = to_xy(times, values)
+    draw.line(list(zip(xs.tolist(), ys.tolist())), fill=CHART_LINE_COLOR, width=2, joint="curve")
+
+    f = io.BytesIO()
+    img.save(f, format="PNG")
+
+    return f.getvalue()
+
+
+RENDERERS = {
+    "pillow": render_pillow,
+    "plotly": render_plotly,
+}
+
+
+def render_market_chart(backend, prices, days):
+    """
+    Converts and downsamples the raw prices and renders them. Runs in a worker process, so the
+    event loop only hands over the raw series and only on a cache miss.
+    :param backend: name of the renderer, see RENDERERS
+    :param prices: CoinGecko's market_chart prices [[timestamp ms, price], ...]
+    :return: PNG bytes
+    :raise ValueError: if there is no price to chart
+    """
+    if not len(prices := prepare_prices(prices)):
+        raise ValueError('No prices to chart')
+
+    return RENDERERS[backend](prices, days)
+
+
+def data_version(market_chart):
+    """
+    Cheap version of a market_chart payload: changes whenever CoinGecko adds a new price point.
+    """
+    prices = market_chart["prices"]
+    return len(prices), prices[-1][0] if prices else None
+
+
+class ChartService(object):
+    """
+    Renders charts in a process pool and caches the PNG bytes per key.
+    Concurrent requests for the same key wait for the same render.
+    """
+
+    def __init__(self, render_func, max_workers=2, max_entries=32):
+        self._render_func = render_func
+        self._max_workers = max_workers
+        self._executor = None
+        self._cache = SingleFlightCache(max_entries)
+
+    def _get_executor(self):
+        if self._executor is None:
+            # fork: spawn/forkserver would re-run the bot's main module in every worker
+            self._executor = ProcessPoolExecutor(max_workers=self._max_workers,
+                                                 mp_context=multiprocessing.get_context("fork"))
+        return self._executor
+
+    def start(self):
+        """
+        Starts the worker processes. Call this early, while the process has few threads.
+        """
+        self._get_executor().submit(int).result()
+
+    async def _run(self, args):
+        executor = self._get_executor()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, self._render_func, *args)
+        except BrokenProcessPool:
+            # a worker died (OOM, crash in a C extension), the pool can't be used anymore
+            _logger.warning('Chart worker died, restarting the process pool')
+            if self._executor is executor:
+                executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+        return await asyncio.get_running_loop().run_in_executor(self._get_executor(), self._render_func, *args)
+
+    async def render(self, key, *args):
+        """
+        :param key: cache key, has to change whenever the rendered data changes
+        :param args: arguments for the render function
+        :return: PNG bytes
+        """
+        return await self._cache.get(key, self._run, args)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+CHARTS = ChartService(functools.partial(render_market_chart, os.getenv("CHART_BACKEND", "pillow")),
+                      max_workers=int(os.getenv("CHART_WORKERS", 2)))
+
+
+if __name__ == '__main__':
+    # benchmark of the chart backends: python charts.py [runs]
+    import sys
+
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    now = time.time() * 1000
+    for days, points in ((1, 288), (365, 8760)):
+        raw_prices = [[now - (points - i) * 300_000, 0.1 + 0.01 * math.sin(i / 20) + 0.0001 * i]
+                      for i in range(points)]
+
+        start = time.perf_counter()
+        for _ in range(runs):
+            bench_prices = prepare_prices(raw_prices)
+        print(f"{days:>3}d prepare : {(time.perf_counter() - start) / runs * 1000:8.1f} ms, "
+              f"{points} -> {len(bench_prices)} points")
+
+        for name, render in RENDERERS.items():
+            try:
+                render(bench_prices, days)  # warm up
+                start = time.perf_counter()
+                for _ in range(runs):
+                    png = render(bench_prices, days)
+                print(f"{days:>3}d {name:<8}: {(time.perf_counter() - start) / runs * 1000:8.1f} ms / chart, "
+                      f"{len(png):,} bytes")
+            except ImportError as e:
+                print(f"{days:>3}d {name:<8}: not available ({e})")
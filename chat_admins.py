@@ -0,0 +1,107 @@
+# encoding: utf-8
+import asyncio
+import logging
+import time
+
+_logger = logging.getLogger(__name__)
+
+ADMIN_STATUSES = ("administrator", "creator")
+
+# errors meaning the bot isn't in the chat anymore
+GONE_ERRORS = ("chat not found", "bot was kicked", "bot is not a member")
+
+
+def _is_gone(ex):
+    return any(error in str(ex).lower() for error in GONE_ERRORS)
+
+
+class ChatAdminCache(object):
+    """
+    TTL cache of the administrators of every chat the bot is used in.
+
+    Lookups never touch the network. A missing or expired chat schedules a refresh via
+    getChatAdministrators in the background and answers from what is known right now.
+
+    Only chats looked up within `idle_ttl` seconds are kept fresh, and chats the bot was removed
+    from are dropped after `max_gone_errors` failed refreshes in a row.
+    """
+
+    def __init__(self, bot, ttl=10 * 60, error_ttl=60, idle_ttl=None, max_gone_errors=3):
+        """
+        :param idle_ttl: seconds without lookup after which a chat is evicted (default 3 * ttl)
+        """
+        self._bot = bot
+        self._ttl = ttl
+        self._error_ttl = error_ttl
+        self._idle_ttl = 3 * ttl if idle_ttl is None else idle_ttl
+        self._max_gone_errors = max_gone_errors
+        self._members = {}  # chat_id -> (expires, {user_id: status})
+        self._last_lookup = {}  # chat_id -> time
+        self._errors = {}  # chat_id -> failed refreshes in a row
+        self._refreshing = set()
+
+    def __len__(self):
+        return len(self._members)
+
+    def get_status(self, chat_id, user_id):
+        """
+        Returns the cached status of a user in a chat, None if the user is no admin or unknown.
+        """
+        entry = self._members.get(chat_id)
+        self._last_lookup[chat_id] = time.time()
+
+        if entry is None or entry[0] < time.time():
+            self.schedule_refresh(chat_id)
+
+        if entry is not None:
+            return entry[1].get(user_id)
+
+    def is_admin(self, chat_id, user_id):
+        return self.get_status(chat_id, user_id) in ADMIN_STATUSES
+
+    def schedule_refresh(self, chat_id):
+        # private chats have no administrators
+        if chat_id > 0 or chat_id in self._refreshing:
+            return
+
+        self._refreshing.add(chat_id)
+        asyncio.ensure_future(self.refresh(chat_id))
+
+    async def refresh(self, chat_id):
+        try:
+            admins = await self._bot.get_chat_administrators(chat_id)
+            self._members[chat_id] = (time.time() + self._ttl,
+                                      {member.user.id: member.status for member in admins})
+            self._errors.pop(chat_id, None)
+        except Exception as ex:
+            errors = self._errors[chat_id] = self._errors.get(chat_id, 0) + 1
+            if errors == 1:
+                _logger.warning(f'Could not read administrators of chat {chat_id}: {ex}')
+
+            if _is_gone(ex) and errors >= self._max_gone_errors:
+                _logger.info(f'Bot is not in chat {chat_id} anymore, not refreshing its administrators.')
+                self.evict(chat_id)
+            else:
+                self._members[chat_id] = (time.time() + self._error_ttl,
+                                          self._members.get(chat_id, (0, {}))[1])
+        finally:
+            self._refreshing.discard(chat_id)
+
+    def evict(self, chat_id):
+        self._members.pop(chat_id, None)
+        self._last_lookup.pop(chat_id, None)
+        self._errors.pop(chat_id, None)
+
+    async def run(self, interval=30):
+        """
+        Keeps the administrators of the recently used chats fresh, so lookups don't hit an expired
+        entry, and evicts the others.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            now = time.time()
+            for chat_id, (expires, _) in list(self._members.items()):
+                if self._last_lookup.get(chat_id, 0) < now - self._idle_ttl:
+                    self.evict(chat_id)
+                elif expires < now + interval:
+                    self.schedule_refresh(chat_id)
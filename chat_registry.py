@@ -0,0 +1,190 @@
+# encoding: utf-8
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+_logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    chat_id INTEGER PRIMARY KEY,
+    type TEXT,
+    title TEXT,
+    is_forum INTEGER NOT NULL DEFAULT 0,
+    first_seen REAL,
+    last_seen REAL,
+    member_count INTEGER,
+    failures INTEGER NOT NULL DEFAULT 0,
+    active INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS chats_active ON chats (active, last_seen);
+"""
+
+
+class ChatRegistry(object):
+    """
+    Chats the bot is used in, e.g. the receivers of broadcasts.
+
+    The active chats are kept in a set, so registering a chat on every command is O(1). Changes are
+    collected in memory and written to SQLite in batches by `run`.
+    """
+
+    def __init__(self, path, seed=()):
+        """
+        :param path: SQLite database file
+        :param seed: chat ids to register if the database doesn't know them yet
+        """
+        self._path = path
+        self._seed = seed
+        self._db = None
+        self._db_lock = threading.Lock()
+
+        self._active = set()
+        self._seen = {}  # chat_id -> (type, title, is_forum, last_seen)
+        self._member_counts = {}
+        self._failures = Counter()
+        self._removed = set()
+
+    def open(self):
+        """
+        Connects the database. Call it in the process using the registry, a SQLite connection must
+        not be inherited by forked processes.
+        """
+        self._db = sqlite3.connect(self._path, check_same_thread=False)
+
+        with self._db_lock, self._db:
+            self._db.executescript(SCHEMA)
+            self._db.executemany("INSERT OR IGNORE INTO chats (chat_id, first_seen) VALUES (?, ?)",
+                                 [(chat_id, time.time()) for chat_id in self._seed])
+
+        self._active |= self._read_active()
+
+    def __contains__(self, chat_id):
+        return chat_id in self._active
+
+    def __len__(self):
+        return len(self._active)
+
+    def see(self, chat):
+        """
+        Registers a chat or updates its last_seen
+        :param chat: telebot.types.Chat
+        :return: True if the chat wasn't active before
+        """
+        new = chat.id not in self._active
+        self._active.add(chat.id)
+        self._removed.discard(chat.id)
+        self._seen[chat.id] = (chat.type, chat.title, int(bool(chat.is_forum)), time.time())
+        return new
+
+    def set_member_count(self, chat_id, member_count):
+        self._member_counts[chat_id] = member_count
+
+    def record_failure(self, chat_id):
+        self._failures[chat_id] += 1
+
+    def remove(self, chat_id):
+        """
+        Deactivates a chat, e.g. after the bot was kicked. It becomes active again when seen.
+        """
+        if chat_id in self._active:
+            _logger.info(f'Bot was removed from chat {chat_id}, deactivating it.')
+        self._active.discard(chat_id)
+        self._seen.pop(chat_id, None)
+        self._removed.add(chat_id)
+
+    def active_chats(self, exclude=()):
+        """
+        :return: list of the active chat ids
+        """
+        return [chat_id for chat_id in self._active if chat_id not in exclude]
+
+    def query(self, sql, params=()):
+        """
+        Read-only queries for analytics, e.g. "SELECT type, COUNT(*) FROM chats GROUP BY type"
+        """
+        with self._db_lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def stats(self, active_days=7):
+        seen_after = time.time() - active_days * 24 * 60 * 60
+        (total, active, recent, members, failures), = self.query(
+            "SELECT COUNT(*), SUM(active), SUM(active AND last_seen >= ?), SUM(member_count), SUM(failures) "
+            "FROM chats", (seen_after,))
+
+        return {"total": total,
+                "active": active or 0,
+                f"seen_last_{active_days}d": recent or 0,
+                "members": members or 0,
+                "delivery_failures": failures or 0}
+
+    def _write(self, seen, member_counts, failures, removed):
+        with self._db_lock, self._db:
+            self._db.executemany("INSERT INTO chats (chat_id, type, title, is_forum, first_seen, last_seen) "
+                                 "VALUES (?, ?, ?, ?, ?, ?) "
+                                 "ON CONFLICT (chat_id) DO UPDATE SET type = excluded.type, title = excluded.title, "
+                                 "is_forum = excluded.is_forum, last_seen = excluded.last_seen, active = 1",
+                                 [(chat_id, chat_type, title, is_forum, last_seen, last_seen)
+                                  for chat_id, (chat_type, title, is_forum, last_seen) in seen.items()])
+            self._db.executemany("UPDATE chats SET member_count = ? WHERE chat_id = ?",
+                                 [(count, chat_id) for chat_id, count in member_counts.items()])
+            self._db.executemany("UPDATE chats SET failures = failures + ? WHERE chat_id = ?",
+                                 [(count, chat_id) for chat_id, count in failures.items()])
+            self._db.executemany("UPDATE chats SET active = 0 WHERE chat_id = ?",
+                                 [(chat_id,) for chat_id in removed])
+
+    def _take_changes(self):
+        changes = (self._seen, self._member_counts, self._failures, self._removed)
+        self._seen, self._member_counts, self._failures, self._removed = {}, {}, Counter(), set()
+        return changes
+
+    def _restore_changes(self, seen, member_counts, failures, removed):
+        """
+        Puts back a batch which couldn't be written, changes made meanwhile win
+        """
+        self._seen = {chat_id: row for chat_id, row in seen.items() if chat_id not in self._removed} | self._seen
+        self._member_counts = member_counts | self._member_counts
+        self._failures.update(failures)
+        self._removed |= removed - set(self._seen)
+
+    async def flush(self):
+        changes = self._take_changes()
+        if any(changes):
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self._write, *changes)
+            except Exception:
+                self._restore_changes(*changes)
+                raise
+
+    def _read_active(self):
+        with self._db_lock:
+            return {row[0] for row in self._db.execute("SELECT chat_id FROM chats WHERE active = 1")}
+
+    async def reload(self):
+        """
+        Picks up the chats registered or removed by other processes
+        """
+        active = await asyncio.get_running_loop().run_in_executor(None, self._read_active)
+        self._active = (active | set(self._seen)) - self._removed
+
+    async def run(self, interval=5):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush()
+                await self.reload()
+            except Exception:
+                _logger.exception('Could not write chat registry')
+
+    def close(self):
+        if self._db is None:
+            return
+
+        try:
+            self._write(*self._take_changes())
+        finally:
+            self._db.close()
+            self._db = None
@@ -5,6 +5,7 @@ DEV_DONATION_ADDR = 'kaspa:precqv0krj3r6uyyfa36ga7s0u9jct0v4wg8ctsfde2gkrsgwgw8j
 
 TOTAL_COIN_SUPPLY = 28_700_000_000
 DEF_PHASE_INCREMENT = 2_629_800
+DAA_SCORES_PER_SECOND = 1
 DEFLATIONARY_TABLE ={
     0: {"daa_range": range(0, 15519600), "reward_per_daa": 500.0},
     1: {"daa_range": range(15519600, 18149400), "reward_per_daa": 440.0},
@@ -0,0 +1,67 @@
+# encoding: utf-8
+import asyncio
+import heapq
+import logging
+import time
+from collections import defaultdict
+
+_logger = logging.getLogger(__name__)
+
+# Telegram's deleteMessages limit
+MAX_IDS_PER_CALL = 100
+
+
+class DeleteScheduler(object):
+    """
+    Deletes messages at their deadline. Deadlines are kept in a min-heap, the scheduler sleeps until
+    the next one and deletes all due messages of a chat with one deleteMessages call.
+    """
+
+    def __init__(self, bot):
+        self._bot = bot
+        self._heap = []  # (deadline, chat_id, message_id)
+        self._wake = asyncio.Event()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def schedule(self, seconds, chat_id, *message_ids):
+        deadline = time.time() + seconds
+        earliest = self._heap[0][0] if self._heap else None
+
+        for message_id in message_ids:
+            heapq.heappush(self._heap, (deadline, chat_id, message_id))
+
+        if earliest is None or deadline < earliest:
+            self._wake.set()
+
+    def _pop_due(self):
+        due = defaultdict(list)
+        now = time.time()
+
+        while self._heap and self._heap[0][0] <= now:
+            _, chat_id, message_id = heapq.heappop(self._heap)
+            due[chat_id].append(message_id)
+
+        return due
+
+    async def _delete(self, chat_id, message_ids):
+        for i in range(0, len(message_ids), MAX_IDS_PER_CALL):
+            try:
+                await self._bot.delete_messages(chat_id, message_ids[i:i + MAX_IDS_PER_CALL])
+            except Exception:
+                _logger.exception('Can not remove these messages. Sorry')
+
+    async def run(self):
+        while True:
+            due = self._pop_due()
+            if due:
+                await asyncio.gather(*[self._delete(chat_id, message_ids) for chat_id, message_ids in due.items()])
+
+            self._wake.clear()
+            timeout = max(self._heap[0][0] - time.time(), 0) if self._heap else None
+
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
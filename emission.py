@@ -0,0 +1,107 @@
+# encoding: utf-8
+import math
+from bisect import bisect_right
+from datetime import datetime, timedelta
+
+import numpy
+
+from constants import DEFLATIONARY_TABLE, DAA_SCORES_PER_SECOND, TOTAL_COIN_SUPPLY
+
+
+class EmissionIndex(object):
+    """
+    Precomputed emission schedule: phase starts, reward per DAA score of each phase and the
+    mined supply at each phase start (prefix sum). All queries are a bisection plus constant work.
+    """
+
+    def __init__(self, deflationary_table, max_supply=None):
+        """
+        :param max_supply: max. supply reported to users, e.g. the official one (default: the
+                           total emission of the table)
+        """
+        phases = sorted(deflationary_table.values(), key=lambda p: p["daa_range"].start)
+
+        self.starts = [p["daa_range"].start for p in phases]
+        self.rewards = [p["reward_per_daa"] for p in phases]
+
+        self.supply_at_start = [0.0]
+        for i in range(1, len(phases)):
+            self.supply_at_start.append(self.supply_at_start[-1] +
+                                        (self.starts[i] - self.starts[i - 1]) * self.rewards[i - 1])
+
+        # the last phase doesn't emit anything
+        self.emission_total = self.supply_at_start[-1]
+        self.max_supply = self.emission_total if max_supply is None else max_supply
+
+        self._starts = numpy.array(self.starts, dtype=numpy.float64)
+        self._rewards = numpy.array(self.rewards, dtype=numpy.float64)
+        self._supply_at_start = numpy.array(self.supply_at_start, dtype=numpy.float64)
+
+    def _phase(self, daa_score):
+        return max(bisect_right(self.starts, daa_score) - 1, 0)
+
+    def supply_at(self, daa_score):
+        """
+        Mined supply in KAS at a DAA score
+        """
+        i = self._phase(daa_score)
+        return self.supply_at_start[i] + (daa_score - self.starts[i]) * self.rewards[i]
+
+    def rewards_between(self, daa_start, daa_end):
+        """
+        KAS emitted from daa_start to daa_end
+        """
+        i, j = self._phase(daa_start), self._phase(daa_end)
+
+        if i == j:
+            # avoids the cancellation of subtracting two large supplies
+            return (daa_end - daa_start) * self.rewards[i]
+
+        return self.supply_at(daa_end) - self.supply_at(daa_start)
+
+    def rewards_for_horizons(self, daa_start, horizons):
+        """
+        KAS emitted from daa_start over each of the horizons, in one vectorized pass
+        :param horizons: array of DAA score counts
+        :return: numpy array, same shape as horizons
+        """
+        daa_ends = daa_start + numpy.asarray(horizons, dtype=numpy.float64)
+        i = self._phase(daa_start)
+        j = numpy.maximum(numpy.searchsorted(self._starts, daa_ends, side="right") - 1, 0)
+
+        supply_end = self._supply_at_start[j] + (daa_ends - self._starts[j]) * self._rewards[j]
+
+        return numpy.where(j == i,
+                           (daa_ends - daa_start) * self.rewards[i],
+                           supply_end - self.supply_at(daa_start))
+
+    def daa_score_for_supply(self, supply):
+        """
+        First DAA score at which `supply` KAS are mined, None if the supply is never reached
+        """
+        if supply >= self.emission_total:
+            return None
+
+        if supply <= 0:
+            return 0
+
+        i = bisect_right(self.supply_at_start, supply) - 1
+        return self.starts[i] + math.ceil((supply - self.supply_at_start[i]) / self.rewards[i])
+
+    def daa_score_for_percent(self, percent):
+        """
+        First DAA score at which `percent` % of the max supply are mined
+        """
+        return self.daa_score_for_supply(self.max_supply * percent / 100)
+
+    @staticmethod
+    def estimate_date(daa_score, current_daa_score, now=None):
+        """
+        Estimated date of a DAA score, based on the current DAA score and the DAA scores per second
+        """
+        now = now or datetime.utcnow()
+        return now + timedelta(seconds=(daa_score - current_daa_score) / DAA_SCORES_PER_SECOND)
+
+
+# the official max. supply, like /coin_supply and /mcap, the table's emission ends slightly below it
+EMISSION = EmissionIndex(DEFLATIONARY_TABLE, max_supply=TOTAL_COIN_SUPPLY)
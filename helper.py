@@ -1,7 +1,22 @@
 # encoding: utf-8
 import re
 
-from constants import DEFLATIONARY_TABLE
+import numpy
+
+from emission import EMISSION
+
+# DAA scores per reward horizon
+REWARD_HORIZONS = {
+    'secound': 1,
+    'minute': 60,
+    'hour': 60 * 60,
+    'day': 60 * 60 * 24,
+    'week': 60 * 60 * 24 * 7,
+    'month': 60 * 60 * 24 * (365.25 / 12),
+    'year': 60 * 60 * 24 * (365.25),
+}
+
+MAX_HASHRATE_ROWS = 20
 
 
 def hashrate_to_int(str_hashrate: str):
@@ -40,40 +55,61 @@ def percent_of_network(miner_hashrate, network_hashrate):
 
 
 def rewards_in_range(daa_start, daa_end):
-    if daa_start >= list(DEFLATIONARY_TABLE.values())[-1]['daa_range'].start:
-        return 0
-    mining_rewards = 0
-    for i, def_phase in enumerate(DEFLATIONARY_TABLE.values()):
-        if daa_start >= def_phase['daa_range'].start:
-            start_phase = i
-    for def_phase in list(DEFLATIONARY_TABLE.values())[start_phase:]:
-        if def_phase['daa_range'].start <= daa_end < def_phase['daa_range'].stop and def_phase[
-            'daa_range'].start <= daa_start < def_phase['daa_range'].stop:
-            mining_rewards = (daa_end - daa_start) * def_phase['reward_per_daa']
-            break
-        elif def_phase['daa_range'].start <= daa_start < def_phase['daa_range'].stop:
-            mining_rewards += (def_phase['daa_range'].stop - daa_start - 1) * def_phase['reward_per_daa']
-        elif def_phase['daa_range'].start <= daa_end < def_phase['daa_range'].stop:
-            mining_rewards += (daa_end - def_phase['daa_range'].start) * def_phase['reward_per_daa']
-            break
-        else:
-            mining_rewards += (def_phase['daa_range'].stop - def_phase['daa_range'].start - 1) * def_phase[
-                'reward_per_daa']
-    return mining_rewards
+    return EMISSION.rewards_between(daa_start, daa_end)
+
+
+def mining_rewards_matrix(current_daa_score, hashrates, network_hashrate, horizons):
+    """
+    Rewards for many hashrates over many horizons in one pass
+    :param hashrates: array of hashrates in H/s
+    :param horizons: array of DAA score counts
+    :return: numpy array of shape (len(hashrates), len(horizons))
+    """
+    hashrates = numpy.asarray(hashrates, dtype=numpy.float64)
+    percents = numpy.where(hashrates <= network_hashrate,
+                           hashrates / network_hashrate,
+                           hashrates / (hashrates + network_hashrate))
+
+    return numpy.outer(percents, EMISSION.rewards_for_horizons(current_daa_score, horizons))
 
 
 def get_mining_rewards(current_daa_score, percent_of_network):
-    rewards = dict()
-    rewards['secound'] = rewards_in_range(current_daa_score, current_daa_score + 1) * percent_of_network
-    rewards['minute'] = rewards_in_range(current_daa_score, current_daa_score + 60) * percent_of_network
-    rewards['hour'] = rewards_in_range(current_daa_score, current_daa_score + 60 * 60) * percent_of_network
-    rewards['day'] = rewards_in_range(current_daa_score, current_daa_score + 60 * 60 * 24) * percent_of_network
-    rewards['week'] = rewards_in_range(current_daa_score, current_daa_score + 60 * 60 * 24 * 7) * percent_of_network
-    rewards['month'] = rewards_in_range(current_daa_score,
-                                        current_daa_score + 60 * 60 * 24 * (365.25 / 12)) * percent_of_network
-    rewards['year'] = rewards_in_range(current_daa_score,
-                                       current_daa_score + 60 * 60 * 24 * (365.25)) * percent_of_network
-    return rewards
+    rewards = EMISSION.rewards_for_horizons(current_daa_score, list(REWARD_HORIZONS.values())) * percent_of_network
+    return dict(zip(REWARD_HORIZONS.keys(), rewards.tolist()))
+
+
+def parse_hashrates(params):
+    """
+    Parses a list (1TH,10TH,100TH) or a range (1-50TH step 5) of hashrates
+    :return: list of hashrates in H/s, None if the params can't be parsed
+    """
+    params = params.replace(" ", "").upper()
+
+    if match := re.fullmatch(r"(?P<start>[\d\.]+)-(?P<stop>[\d\.]+)(?P<suffix>[KMGTPE]?H)(/S)?(STEP(?P<step>[\d\.]+))?",
+                             params):
+        start, stop = float(match["start"]), float(match["stop"])
+        step = float(match["step"]) if match["step"] else (stop - start) / 9
+
+        if stop < start or (step <= 0 and stop > start):
+            return None
+
+        # only the shown rows are generated, not the whole range
+        count = min(int((stop - start) / step + 1e-9) + 1, MAX_HASHRATE_ROWS) if stop > start else 1
+        values = start + step * numpy.arange(count)
+        return [hashrate_to_int(f"{value}{match['suffix']}") for value in values]
+
+    hashrates = []
+    suffix = None
+    # a value without unit takes the unit of the following values: 1,10,100TH
+    for item in reversed(params.split(",")):
+        if not (match := re.fullmatch(r"(?P<dec>[\d\.]+)(?P<suffix>[KMGTPE]?H)?(/S)?", item)):
+            return None
+        suffix = match["suffix"] or suffix
+        if suffix is None:
+            return None
+        hashrates.insert(0, hashrate_to_int(f"{match['dec']}{suffix}"))
+
+    return hashrates[:MAX_HASHRATE_ROWS]
 
 
 def normalize_hashrate(hashrate: int):
@@ -98,3 +134,10 @@ MINING_CALC = lambda rewards: f'''
   KAS / week  :  {round(rewards['week']):,}
   KAS / month :  {round(rewards['month']):,}
   KAS / year  :  {round(rewards['year']):,}'''
+
+
+def mining_table(hashrates, rewards):
+    lines = [f"{'Hashrate':<12}{'KAS/day':>11}{'KAS/week':>12}{'KAS/month':>13}"]
+    for hashrate, row in zip(hashrates, rewards):
+        lines.append(f"{normalize_hashrate(hashrate):<12}{round(row[0]):>11,}{round(row[1]):>12,}{round(row[2]):>13,}")
+    return "\n".join(lines)
@@ -0,0 +1,114 @@
+# encoding: utf-8
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+import aiohttp
+
+# per host settings: max. concurrent requests and total timeout in seconds, for hosts not in HOST_CONFIG
+DEFAULT_HOST_CONFIG = {"limit": int(os.getenv("HTTP_LIMIT_PER_HOST", 10)),
+                       "timeout": float(os.getenv("HTTP_TIMEOUT", 10))}
+
+HOST_CONFIG = {
+    "api.kaspa.org": {"limit": 20, "timeout": 10},
+    "api.coingecko.com": {"limit": 5, "timeout": 10},
+    "kaspagames.org": {"limit": 10, "timeout": 20},
+}
+
+
+def _env_overrides(host, config):
+    """
+    Settings of a host overridden by env variables, e.g. HTTP_LIMIT_API_KASPA_ORG=30 and
+    HTTP_TIMEOUT_API_KASPA_ORG=5 for api.kaspa.org
+    """
+    name = host.upper().replace(".", "_").replace("-", "_")
+    config = dict(config)
+
+    if limit := os.getenv(f"HTTP_LIMIT_{name}"):
+        config["limit"] = int(limit)
+
+    if timeout := os.getenv(f"HTTP_TIMEOUT_{name}"):
+        config["timeout"] = float(timeout)
+
+    return config
+
+
+DNS_CACHE_TTL = 300
+KEEPALIVE_TIMEOUT = 30
+
+_sessions = {}
+_semaphores = {}
+
+
+def configure_host(host, limit=None, timeout=None):
+    """
+    Changes the connection limit / timeout for a host. Has to be called before the first request to it.
+    """
+    config = dict(HOST_CONFIG.get(host, DEFAULT_HOST_CONFIG))
+
+    if limit is not None:
+        config["limit"] = limit
+
+    if timeout is not None:
+        config["timeout"] = timeout
+
+    HOST_CONFIG[host] = config
+
+
+def _get_session(host):
+    """
+    One session (and with it one connection pool) per host, so connections are kept alive and reused.
+    """
+    session = _sessions.get(host)
+
+    if session is None or session.closed:
+        config = _env_overrides(host, HOST_CONFIG.get(host, DEFAULT_HOST_CONFIG))
+        connector = aiohttp.TCPConnector(limit_per_host=config["limit"],
+                                         ttl_dns_cache=DNS_CACHE_TTL,
+                                         keepalive_timeout=KEEPALIVE_TIMEOUT)
+        session = aiohttp.ClientSession(connector=connector,
+                                        timeout=aiohttp.ClientTimeout(total=config["timeout"]))
+        _sessions[host] = session
+        _semaphores[host] = asyncio.Semaphore(config["limit"])
+
+    return session
+
+
+@asynccontextmanager
+async def request(method, url, **kwargs):
+    """
+    Sends a request over the pooled session of the url's host
+    :return: aiohttp.ClientResponse
+    """
+    host = urlsplit(url).hostname
+    session = _get_session(host)
+
+    async with _semaphores[host]:
+        async with session.request(method, url, **kwargs) as resp:
+            yield resp
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+async def get_json(url, **kwargs):
+    async with get(url, **kwargs) as resp:
+        return await resp.json()
+
+
+async def close():
+    """
+    Closes all pooled sessions. Call this on shutdown.
+    """
+    sessions = list(_sessions.values())
+    _sessions.clear()
+    _semaphores.clear()
+
+    for session in sessions:
+        await session.close()
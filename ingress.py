@@ -0,0 +1,239 @@
+# encoding: utf-8
+import asyncio
+import hmac
+import logging
+import multiprocessing
+import queue
+
+from aiohttp import web
+from telebot.types import Update
+
+_logger = logging.getLogger(__name__)
+
+# update fields holding an object with a chat (message-like) or a sender
+CHAT_FIELDS = ("message", "edited_message", "channel_post", "edited_channel_post", "my_chat_member",
+               "chat_member", "chat_join_request", "message_reaction", "message_reaction_count")
+USER_FIELDS = ("inline_query", "chosen_inline_result", "shipping_query", "pre_checkout_query", "poll_answer")
+
+# put into a worker's queue to stop it after the updates queued before
+STOP = None
+
+
+def update_chat_id(update):
+    """
+    Chat an update belongs to, the user's id for updates without chat
+    :param update: update as json dict
+    """
+    for field in CHAT_FIELDS:
+        if field in update:
+            return update[field]["chat"]["id"]
+
+    if callback_query := update.get("callback_query"):
+        if "message" in callback_query:
+            return callback_query["message"]["chat"]["id"]
+        return callback_query["from"]["id"]
+
+    for field in USER_FIELDS:
+        if field in update:
+            return update[field].get("from", update[field].get("user", {})).get("id", 0)
+
+    return 0
+
+
+def is_authorized(request, secret_token):
+    """
+    Checks the secret token Telegram sends with every update (set_webhook(secret_token=...))
+    """
+    if not secret_token:
+        return True
+
+    return hmac.compare_digest(request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), secret_token)
+
+
+async def read_update(request, secret_token):
+    """
+    :return: update as json dict, or the error response
+    """
+    if not is_authorized(request, secret_token):
+        return None, web.Response(status=403)
+
+    try:
+        return await request.json(), None
+    except Exception:
+        return None, web.Response(status=400)
+
+
+class WebhookServer(object):
+    """
+    Receives updates via webhook in the bot's process.
+
+    Updates are put into a bounded queue and answered at once, a fixed number of dispatchers hands
+    them to the bot. If the queue is full the update is answered with 503, so Telegram delivers
+    it again later instead of the bot running out of memory.
+    """
+
+    def __init__(self, bot, path="/webhook", host="0.0.0.0", port=8000, secret_token=None,
+                 max_queue=1000, concurrency=64):
+        """
+        :param concurrency: max. number of updates handled at the same time
+        """
+        self._bot = bot
+        self._path = path
+        self._host = host
+        self._port = port
+        self._secret_token = secret_token
+        self._concurrency = concurrency
+        self._updates = asyncio.Queue(max_queue)
+
+    async def handle(self, request):
+        update, error = await read_update(request, self._secret_token)
+        if error:
+            return error
+
+        try:
+            self._updates.put_nowait(update)
+        except asyncio.QueueFull:
+            _logger.warning('Update queue full, rejecting update.')
+            return web.Response(status=503)
+
+        return web.Response()
+
+    async def _dispatch(self):
+        while True:
+            update = await self._updates.get()
+            try:
+                await self._bot.process_new_updates([Update.de_json(update)])
+            except Exception:
+                _logger.exception('Error handling update')
+
+    async def run(self):
+        app = web.Application()
+        app.router.add_post(self._path, self.handle)
+
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, self._host, self._port).start()
+        _logger.info(f'Receiving updates on {self._host}:{self._port}{self._path}')
+
+        try:
+            await asyncio.gather(*[self._dispatch() for _ in range(self._concurrency)])
+        finally:
+            await runner.cleanup()
+
+
+class ShardedIngress(object):
+    """
+    Webhook endpoint which distributes the updates to worker processes by chat id.
+
+    All updates of a chat go to the same worker, so per chat state (e.g. pending deletions, the
+    active members) stays in one process. A worker handles several updates at the same time, so
+    updates of a chat are started in order but may finish in any order.
+    """
+
+    def __init__(self, workers, worker_main, path="/webhook", host="0.0.0.0", port=8000, secret_token=None,
+                 max_queue=1000):
+        """
+        :param worker_main: function(index, update_queue) run in every worker process
+        :param max_queue: max. number of updates waiting per worker, more are answered with 503
+        """
+        self._workers = workers
+        self._worker_main = worker_main
+        self._path = path
+        self._host = host
+        self._port = port
+        self._secret_token = secret_token
+
+        # fork, so the workers inherit the configured bot instead of importing __main__ again
+        self._context = multiprocessing.get_context("fork")
+        self._queues = [self._context.Queue(max_queue) for _ in range(workers)]
+        self._processes = []
+
+    def shard(self, update):
+        return update_chat_id(update) % self._workers
+
+    async def handle(self, request):
+        update, error = await read_update(request, self._secret_token)
+        if error:
+            return error
+
+        try:
+            self._queues[self.shard(update)].put_nowait(update)
+        except queue.Full:
+            _logger.warning('Update queue of worker full, rejecting update.')
+            return web.Response(status=503)
+
+        return web.Response()
+
+    def start_workers(self):
+        for index, update_queue in enumerate(self._queues):
+            process = self._context.Process(target=self._worker_main, args=(index, update_queue),
+                                            name=f"bot-worker-{index}", daemon=True)
+            process.start()
+            self._processes.append(process)
+
+        _logger.info(f'Started {self._workers} bot workers.')
+
+    def stop_workers(self, timeout=10):
+        """
+        Lets the workers finish their queued updates and flush their state, workers still running
+        after `timeout` seconds are terminated
+        """
+        for update_queue in self._queues:
+            try:
+                update_queue.put(STOP, timeout=timeout)
+            except queue.Full:
+                pass
+
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                _logger.warning(f'{process.name} did not stop, terminating it.')
+                process.terminate()
+
+    def run(self):
+        self.start_workers()
+
+        app = web.Application()
+        app.router.add_post(self._path, self.handle)
+
+        try:
+            web.run_app(app, host=self._host, port=self._port)
+        finally:
+            self.stop_workers()
+
+
+async def consume_updates(bot, update_queue, concurrency=64):
+    """
+    Feeds the updates of a worker's queue into the bot, at most `concurrency` at the same time.
+    Returns after STOP was received and the updates in progress are handled.
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    empty = object()
+
+    def get_update():
+        # with a timeout, so a cancelled worker doesn't wait for the thread forever
+        try:
+            return update_queue.get(timeout=1)
+        except queue.Empty:
+            return empty
+
+    async def process(update):
+        try:
+            await bot.process_new_updates([Update.de_json(update)])
+        except Exception:
+            _logger.exception('Error handling update')
+        finally:
+            semaphore.release()
+
+    while True:
+        await semaphore.acquire()
+        while (update := await loop.run_in_executor(None, get_update)) is empty:
+            pass
+        if update is STOP:
+            break
+        asyncio.ensure_future(process(update))
+
+    for _ in range(concurrency - 1):
+        await semaphore.acquire()
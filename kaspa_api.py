@@ -2,26 +2,22 @@
 import asyncio
 from urllib.parse import urljoin
 
-import aiohttp
-import requests
-from cachetools.func import ttl_cache
-from aiocache import cached
-
-_session = requests.session()
+import http_client
+from upstream_cache import cached
 
 BASE_URL = "https://api.kaspa.org/"
 
 
 async def __get(endpoint, params=None):
-    async with aiohttp.ClientSession() as session:
-        async with session.get(urljoin(BASE_URL, endpoint), params=params) as resp:
-            return await resp.json()
+    return await http_client.get_json(urljoin(BASE_URL, endpoint), params=params)
 
 
+@cached(ttl=60, stale_ttl=10 * 60)
 async def get_coin_supply():
     return await __get("info/coinsupply")
 
-@cached(ttl=15)
+
+@cached(ttl=15, stale_ttl=60)
 async def get_hashrate():
     return await __get("info/hashrate")
 
@@ -29,14 +25,12 @@ async def get_hashrate():
 async def get_balance(addr):
     return await __get(f"addresses/{addr}/balance")
 
-@cached(ttl=120)
+
+@cached(ttl=120, stale_ttl=10 * 60)
 async def get_max_hashrate():
     return await __get(f"info/hashrate/max")
 
 
-async def get_coin_supply():
-    return await __get(f"info/coinsupply")
-
-
+@cached(ttl=5, stale_ttl=30)
 async def get_blockdag_info():
     return await __get(f"info/blockdag")
@@ -0,0 +1,114 @@
+# encoding: utf-8
+import asyncio
+import logging
+
+from KaspaInterface import rpc_client
+
+_logger = logging.getLogger(__name__)
+
+
+class KaspadNotifier(object):
+    """
+    Subscribes to kaspad's block-added and virtual-DAA-score-changed notifications.
+
+    Keeps the live DAA score and tip in memory and hands every new block to the tx scanner,
+    so pending tips are confirmed as soon as their block arrives.
+    """
+
+    def __init__(self, hosts, tx_scanner=None, client_factory=rpc_client,
+                 idle_timeout=60, reconnect_delay=5):
+        """
+        :param hosts: list of (host, port), the next node is used after a connection failed
+        """
+        self._hosts = hosts
+        self._host_index = 0
+        self._tx_scanner = tx_scanner
+        self._client_factory = client_factory
+        self._idle_timeout = idle_timeout
+        self._reconnect_delay = reconnect_delay
+
+        self.connected = False
+        self.daa_score = None
+        self.tip_hash = None
+
+    @property
+    def _host(self):
+        return self._hosts[self._host_index % len(self._hosts)]
+
+    def _connect(self):
+        cli = self._client_factory()
+        cli.connect(*self._host)
+        return cli
+
+    @staticmethod
+    def _close(cli):
+        try:
+            cli.close()
+        except Exception:
+            _logger.exception('Error closing kaspad connection')
+
+    @staticmethod
+    def _normalize_block(block):
+        """
+        Brings a notified block into the shape of the REST API's blocks (verboseData.hash / transactionIds)
+        """
+        verbose_data = block.get("verboseData", {})
+
+        if "transactionIds" not in verbose_data:
+            verbose_data["transactionIds"] = [tx["verboseData"]["transactionId"]
+                                              for tx in block.get("transactions", [])
+                                              if "verboseData" in tx]
+
+        return {"verboseData": verbose_data}
+
+    async def _handle(self, notification):
+        if "virtualDaaScoreChangedNotification" in notification:
+            self.daa_score = int(notification["virtualDaaScoreChangedNotification"]["virtualDaaScore"])
+
+        elif "blockAddedNotification" in notification:
+            block = self._normalize_block(notification["blockAddedNotification"]["block"])
+            self.tip_hash = block["verboseData"].get("hash")
+
+            if self._tx_scanner is not None and self.tip_hash:
+                await self._tx_scanner.process_blocks([block])
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+
+        def put(notification):
+            # kaspy calls back from its own threads
+            loop.call_soon_threadsafe(queue.put_nowait, notification)
+
+        while True:
+            cli = None
+            try:
+                cli = await loop.run_in_executor(None, self._connect)
+                await loop.run_in_executor(None, cli.subscribe, "notifyBlockAddedRequest", put)
+                await loop.run_in_executor(None, cli.subscribe, "notifyVirtualDaaScoreChangedRequest", put)
+
+                _logger.info(f'Listening to kaspad notifications on {self._host[0]}:{self._host[1]}')
+                self._set_connected(True)
+
+                while True:
+                    await self._handle(await asyncio.wait_for(queue.get(), self._idle_timeout))
+
+            except ImportError:
+                _logger.warning('kaspy not available, kaspad notifications disabled.')
+                return
+            except asyncio.TimeoutError:
+                _logger.warning(f'No kaspad notification for {self._idle_timeout}s, reconnecting.')
+            except Exception:
+                _logger.exception('Error in kaspad notifications')
+                self._host_index += 1
+            finally:
+                self._set_connected(False)
+                if cli is not None:
+                    await loop.run_in_executor(None, self._close, cli)
+
+            await asyncio.sleep(self._reconnect_delay)
+
+    def _set_connected(self, connected):
+        self.connected = connected
+        if self._tx_scanner is not None:
+            self._tx_scanner.push_active = connected
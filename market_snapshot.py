@@ -0,0 +1,70 @@
+# encoding: utf-8
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, replace
+
+_logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class MarketSnapshot:
+    """
+    Immutable view of market and network data. Every refresh publishes a new object with a higher version.
+    """
+    version: int = 0
+    updated_at: float = 0
+    coin_info: dict = None
+    coin_supply: dict = None
+    hashrate: dict = None
+    blockdag_info: dict = None
+    kas_price: float = None
+
+
+class SnapshotService(object):
+    """
+    Refreshes the snapshot fields on fixed schedules in the background, handlers only read `current`.
+    """
+
+    def __init__(self, sources):
+        """
+        :param sources: dict field name -> (async fetch function, refresh interval in seconds)
+        """
+        self.current = MarketSnapshot()
+        self._sources = sources
+
+    def _publish(self, name, value):
+        self.current = replace(self.current,
+                               version=self.current.version + 1,
+                               updated_at=time.time(),
+                               **{name: value})
+
+    async def refresh(self, name):
+        fetch, _ = self._sources[name]
+        value = await fetch()
+        self._publish(name, value)
+        return value
+
+    async def get(self, name):
+        """
+        Returns the value of the current snapshot. Only fetches upstream if the field was never loaded.
+        """
+        value = getattr(self.current, name)
+
+        if value is None:
+            value = await self.refresh(name)
+
+        return value
+
+    async def _refresh_loop(self, name, interval):
+        while True:
+            try:
+                await self.refresh(name)
+            except Exception:
+                _logger.exception(f'Error refreshing {name}')
+
+            await asyncio.sleep(interval)
+
+    async def run(self):
+        await asyncio.gather(*[self._refresh_loop(name, interval)
+                               for name, (_, interval) in self._sources.items()])
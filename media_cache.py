@@ -0,0 +1,141 @@
+# encoding: utf-8
+import asyncio
+import hashlib
+import json
+import logging
+import os
+
+from telebot.types import InputMedia
+
+_logger = logging.getLogger(__name__)
+
+# errors meaning Telegram doesn't accept a file_id anymore, others are unrelated to the file
+FILE_ID_ERRORS = ("wrong file identifier", "wrong remote file identifier", "file_reference_")
+
+
+def is_file_id_error(ex):
+    """
+    :param ex: exception of a send_photo / edit_message_media call
+    """
+    return getattr(ex, "error_code", None) == 400 and any(error in str(ex).lower() for error in FILE_ID_ERRORS)
+
+
+class MediaCache(object):
+    """
+    Remembers the file_id Telegram returns for an uploaded photo, so the same content is only uploaded once.
+
+    Static files are keyed by the hash of the file, generated images by the hash of their content.
+    The mapping is stored as json, so it survives restarts.
+    """
+
+    def __init__(self, path, max_entries=1000):
+        self._path = path
+        self._max_entries = max_entries
+        self._file_hashes = {}  # path -> (mtime, hash)
+        self._save_lock = asyncio.Lock()
+
+        try:
+            with open(path) as f:
+                self._file_ids = json.load(f)
+        except FileNotFoundError:
+            self._file_ids = {}
+        except Exception:
+            _logger.exception(f'Could not read media cache {path}')
+            self._file_ids = {}
+
+    def _write(self, data):
+        # every bot worker process writes its own tmp file
+        tmp_path = f"{self._path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(data)
+        os.replace(tmp_path, self._path)
+
+    async def _save(self):
+        data = json.dumps(self._file_ids)
+        try:
+            # the lock keeps the writes in order
+            async with self._save_lock:
+                await asyncio.get_running_loop().run_in_executor(None, self._write, data)
+        except Exception:
+            _logger.exception(f'Could not write media cache {self._path}')
+
+    async def _remember(self, key, message):
+        if not message or not getattr(message, "photo", None):
+            return
+
+        self._file_ids.pop(key, None)
+        self._file_ids[key] = message.photo[-1].file_id
+
+        while len(self._file_ids) > self._max_entries:
+            del self._file_ids[next(iter(self._file_ids))]
+
+        await self._save()
+
+    async def _forget(self, key):
+        if self._file_ids.pop(key, None):
+            await self._save()
+
+    def _key_for_file(self, path):
+        mtime = os.path.getmtime(path)
+        cached = self._file_hashes.get(path)
+
+        if cached is None or cached[0] != mtime:
+            with open(path, "rb") as f:
+                cached = (mtime, hashlib.sha256(f.read()).hexdigest())
+            self._file_hashes[path] = cached
+
+        return cached[1]
+
+    def _prepare(self, photo):
+        """
+        :param photo: path of a file, bytes or a BytesIO
+        :return: cache key and bytes / path to upload
+        """
+        if isinstance(photo, str):
+            return self._key_for_file(photo), photo
+
+        data = photo.getvalue() if hasattr(photo, "getvalue") else photo
+        return hashlib.sha256(data).hexdigest(), data
+
+    @staticmethod
+    def _upload(photo):
+        if isinstance(photo, str):
+            with open(photo, "rb") as f:
+                return f.read()
+        return photo
+
+    async def send_photo(self, bot, chat_id, photo, **kwargs):
+        key, photo = self._prepare(photo)
+
+        if file_id := self._file_ids.get(key):
+            try:
+                return await bot.send_photo(chat_id, file_id, **kwargs)
+            except Exception as e:
+                if not is_file_id_error(e):
+                    raise
+                _logger.warning(f'Cached file_id rejected, uploading again: {e}')
+                await self._forget(key)
+
+        message = await bot.send_photo(chat_id, self._upload(photo), **kwargs)
+        await self._remember(key, message)
+        return message
+
+    async def edit_message_photo(self, bot, photo, chat_id, message_id, caption=None, parse_mode=None, **kwargs):
+        key, photo = self._prepare(photo)
+
+        if file_id := self._file_ids.get(key):
+            try:
+                return await bot.edit_message_media(InputMedia(type='photo', media=file_id,
+                                                               caption=caption, parse_mode=parse_mode),
+                                                    chat_id, message_id, **kwargs)
+            except Exception as e:
+                if not is_file_id_error(e):
+                    raise
+                _logger.warning(f'Cached file_id rejected, uploading again: {e}')
+                await self._forget(key)
+
+        message = await bot.edit_message_media(InputMedia(type='photo', media=self._upload(photo),
+                                                          caption=caption, parse_mode=parse_mode),
+                                               chat_id, message_id, **kwargs)
+        await self._remember(key, message)
+        return message
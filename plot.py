@@ -2,15 +2,14 @@ import io
 import logging
 import threading
 import time
-from datetime import datetime
 
-import aiohttp
-import pandas
-import plotly.express as px
 import requests
-from aiocache import cached
 from aiohttp import ContentTypeError
 
+import http_client
+from charts import CHARTS, data_version
+from upstream_cache import cached
+
 STARTUP_DEBOUNCE = True
 COINS = requests.get("https://api.coingecko.com/api/v3/coins/list").json()
 
@@ -37,78 +36,59 @@ CACHE = None
 
 
 @startup_debounce
-@cached(ttl=120)
+@cached(ttl=120, stale_ttl=10 * 60, error_ttl=10)
 async def request_market_chart(days=1):
     global CACHE
-    async with aiohttp.ClientSession() as session:
-        async with session.get(f"https://api.coingecko.com/api/v3/coins/kaspa/market_chart?vs_currency=usd&days={days}",
-                               timeout=10) as resp:
-            try:
-                CACHE = await resp.json()
-            except ContentTypeError:
-                if not CACHE:
-                    logging.exception('Error reading market chart.')
-                    raise
+    async with http_client.get(f"https://api.coingecko.com/api/v3/coins/kaspa/market_chart?vs_currency=usd&days={days}") as resp:
+        try:
+            CACHE = await resp.json()
+        except ContentTypeError:
+            if not CACHE:
+                logging.exception('Error reading market chart.')
+                raise
     return CACHE
 
 
-async def get_coin_info_from_ticker(symbol):
-    symbol = symbol.lower()
-    filtered_coins = [x for x in COINS if x["symbol"].lower() == symbol] or \
-                     [x for x in COINS if x["name"].lower() == symbol]
+def build_ticker_index(coins):
+    """
+    :param coins: CoinGecko coin list
+    :return: (symbol -> coin ids, name -> coin ids), keys lower case
+    """
+    symbols, names = {}, {}
+    for coin in coins:
+        symbols.setdefault(coin["symbol"].lower(), []).append(coin["id"])
+        names.setdefault(coin["name"].lower(), []).append(coin["id"])
+    return symbols, names
+
+
+SYMBOLS, NAMES = build_ticker_index(COINS)
+
 
-    if not filtered_coins:
-        return
+@cached(ttl=120, stale_ttl=10 * 60, error_ttl=10)
+async def _request_coin_markets(ticker):
+    ids = SYMBOLS.get(ticker) or NAMES[ticker]
 
-    coin_list = []
-    for coin in filtered_coins:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"https://api.coingecko.com/api/v3/coins/{coin['id']}",
-                                   params={"tickers": "false",
-                                           "community_data": "false",
-                                           "developer_data": "false"},
-                                   timeout=10) as resp:
-                coin_list.append(await resp.json())
+    # market data of all coins sharing the ticker in one request
+    coins = await http_client.get_json("https://api.coingecko.com/api/v3/coins/markets",
+                                       params={"vs_currency": "usd",
+                                               "ids": ",".join(ids[:250]),
+                                               "per_page": 250})
+
+    return min(coins, key=lambda x: x["market_cap_rank"] or 999999) if coins else None
+
+
+async def get_coin_info_from_ticker(symbol):
+    """
+    :return: CoinGecko market data (/coins/markets) of the highest ranked coin with this symbol or name
+    """
+    symbol = symbol.lower()
 
-    return sorted(coin_list, key=lambda x: (x['coingecko_rank'] or 999999))[0]
+    # unknown tickers don't reach the cache, it only holds known ones
+    if symbol in SYMBOLS or symbol in NAMES:
+        return await _request_coin_markets(symbol)
 
 
 async def get_image_stream(days=1):
     d = await request_market_chart(days)
-    data = [(datetime.utcfromtimestamp(x[0] / 1000), x[1]) for x in d["prices"]]
-    a = pandas.DataFrame(data, columns=["Time", "USD"])
-
-    basic_plot = px.line(
-        a,
-        x="Time",
-        y="USD",
-        template="plotly_dark"
-    )
-    label_days = "24h" if days == 1 else f"{days}d"
-    basic_plot.update_xaxes(title_font_size=15)
-    basic_plot.update_yaxes(title_font_size=15)
-    basic_plot.update_layout(
-        title=f"KAS / USD chart - {label_days}",
-        font={
-            "size": 15,
-            "color": "#F6F5F4"
-        }
-    )
-    basic_plot.update_traces(line={
-        "color": "#14F1D9"
-    })
-
-    # basic_plot.update_xaxes(linecolor="#ff0000")
-    # basic_plot.update_layout(linecolor="#ff0000")
-
-    # [datetime.fromtimestamp(x[0] / 1000) for x in d["prices"]],
-    # symbol = "KAS"
-    # y = [x[1] for x in d["prices"]]
-
-    f = io.BytesIO()
-
-    basic_plot.write_image(f)
-
-    f.seek(0)
-
-    return f
+    png = await CHARTS.render((days, data_version(d)), d["prices"], days)
+    return io.BytesIO(png)
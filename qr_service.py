@@ -0,0 +1,86 @@
+# encoding: utf-8
+import asyncio
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import qrcode
+from PIL import Image
+from qrcode.image.styledpil import StyledPilImage
+from qrcode.image.styles.colormasks import HorizontalGradiantColorMask
+from qrcode.image.styles.moduledrawers import RoundedModuleDrawer
+
+from single_flight import SingleFlightCache
+
+# QR code with rounded modules, kaspa gradient and the logo in the center
+STYLE_KASPA = "kaspa"
+# plain QR code, fast to render
+STYLE_PLAIN = "plain"
+
+
+def load_logo(path, width=100):
+    logo = Image.open(path)
+    logo = logo.resize((width, int(logo.size[1] * width / logo.size[0])), Image.LANCZOS)
+    logo.load()
+    return logo
+
+
+class QrService(object):
+    """
+    Renders QR codes in a thread pool and caches the PNG bytes per (text, style).
+    Concurrent requests for the same QR code wait for the same render.
+
+    The logo is loaded once. Module drawer and color mask keep state while drawing, so every
+    thread creates its own once.
+    """
+
+    def __init__(self, logo_path="./res/kaspa-icon.png", max_workers=2, max_entries=256):
+        self._logo = load_logo(logo_path)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="qr")
+        self._local = threading.local()
+        self._cache = SingleFlightCache(max_entries)
+
+    def _styles(self):
+        if not hasattr(self._local, "module_drawer"):
+            self._local.module_drawer = RoundedModuleDrawer()
+            self._local.color_mask = HorizontalGradiantColorMask(right_color=(3, 38, 33),
+                                                                 left_color=(12, 110, 96))
+        return self._local.module_drawer, self._local.color_mask
+
+    def render_sync(self, text, style=STYLE_KASPA):
+        """
+        :return: PNG bytes
+        """
+        qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_H, border=7)
+        qr.add_data(text)
+        qr.make()
+
+        if style == STYLE_PLAIN:
+            img = qr.make_image(image_factory=StyledPilImage).convert("RGB")
+        else:
+            module_drawer, color_mask = self._styles()
+            img = qr.make_image(image_factory=StyledPilImage,
+                                module_drawer=module_drawer,
+                                color_mask=color_mask).convert("RGB")
+            img.paste(self._logo, ((img.size[0] - self._logo.size[0]) // 2,
+                                   (img.size[1] - self._logo.size[1]) // 2))
+
+        buffer = io.BytesIO()
+        img.save(buffer, format="PNG")
+        return buffer.getvalue()
+
+    async def _render(self, text, style):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self.render_sync, text, style)
+
+    async def render(self, text, style=STYLE_KASPA):
+        """
+        :return: PNG bytes
+        """
+        return await self._cache.get((text, style), self._render, text, style)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+QR_CODES = QrService(max_workers=int(os.getenv("QR_WORKERS", 2)))
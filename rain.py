@@ -0,0 +1,123 @@
+# encoding: utf-8
+import asyncio
+import html
+import logging
+import time
+from collections import OrderedDict
+
+from cachetools import LRUCache
+
+_logger = logging.getLogger(__name__)
+
+PENDING = "⏳"
+CONFIRMED = "✅"
+NOT_FOUND = "❓"
+FAILED = "❌"
+
+
+def tx_link(tx_id):
+    return f"<a href='https://explorer.kaspa.org/txs/{tx_id}'>{tx_id[:6]}...{tx_id[-6:]}</a>"
+
+
+def recipient_line(name, amount_text, tx_id=None):
+    """
+    Line of a rain summary, pending until its tx is marked
+    :param tx_id: None if the tx could not be sent
+    """
+    if tx_id is None:
+        return f"{name} {FAILED} not sent"
+
+    return f"{name} {amount_text} KAS {tx_link(tx_id)} {PENDING}"
+
+
+class ActivityTracker(object):
+    """
+    Recently active members per group chat, the receivers of a rain.
+
+    Only sees the messages the bot receives, in groups with privacy mode that are commands and
+    replies to the bot unless it is admin.
+    """
+
+    def __init__(self, window=24 * 60 * 60, max_per_chat=500, max_chats=10_000):
+        """
+        :param window: members active within the last `window` seconds count as active
+        """
+        self._window = window
+        self._max_per_chat = max_per_chat
+        self._chats = LRUCache(max_chats)  # chat_id -> OrderedDict user_id -> (name, last_seen)
+
+    def see(self, message):
+        """
+        :param message: telebot.types.Message
+        """
+        user = message.from_user
+        if user is None or user.is_bot or message.chat.type not in ("group", "supergroup"):
+            return
+
+        if (members := self._chats.get(message.chat.id)) is None:
+            members = self._chats[message.chat.id] = OrderedDict()
+
+        name = f"@{user.username}" if user.username else html.escape(user.full_name or str(user.id))
+        members[user.id] = (name, time.time())
+        members.move_to_end(user.id)
+
+        if len(members) > self._max_per_chat:
+            members.popitem(last=False)
+
+    def recent(self, chat_id, exclude=()):
+        """
+        :return: list of (user_id, name) of the active members, most recent first
+        """
+        active_after = time.time() - self._window
+        recent = []
+
+        for user_id, (name, last_seen) in reversed(self._chats.get(chat_id, {}).items()):
+            if last_seen < active_after:
+                break
+            if user_id not in exclude:
+                recent.append((user_id, name))
+
+        return recent
+
+
+class RainSummaries(object):
+    """
+    Summary messages of rains, one line per tx marked as its confirmation arrives.
+
+    Runs where the txs are confirmed. Edits of one message are coalesced: at most one is in flight
+    and the next one carries all marks made meanwhile, so a block confirming many txs of a rain
+    costs one or two edits.
+    """
+
+    def __init__(self, edit_message, maxsize=1000):
+        """
+        :param edit_message: async function(chat_id, message_id, html)
+        """
+        self._edit_message = edit_message
+        self._texts = LRUCache(maxsize)  # (chat_id, message_id) -> current html
+        self._dirty = set()
+        self._editing = set()
+
+    def mark(self, payload, tx_id, mark):
+        """
+        :param payload: pending tx payload with chat_id, message_id and html of the summary
+        """
+        key = (payload["chat_id"], payload["message_id"])
+        text = self._texts.get(key, payload["html"])
+        self._texts[key] = text.replace(f"{tx_link(tx_id)} {PENDING}", f"{tx_link(tx_id)} {mark}")
+
+        self._dirty.add(key)
+        if key not in self._editing:
+            self._editing.add(key)
+            asyncio.ensure_future(self._edit(key))
+
+    async def _edit(self, key):
+        try:
+            while key in self._dirty:
+                self._dirty.discard(key)
+                try:
+                    await self._edit_message(*key, self._texts[key])
+                except Exception:
+                    _logger.exception(f'Could not update rain summary {key}')
+        finally:
+            self._editing.discard(key)
@@ -0,0 +1,98 @@
+# encoding: utf-8
+import time
+from collections import Counter
+
+from cachetools import TLRUCache
+
+
+class TokenBucket(object):
+    """
+    Allows `rate` events per second with bursts of up to `capacity` events
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now=None):
+        """
+        Seconds until the next token is available, 0 if there is one
+        """
+        self._refill(now or time.monotonic())
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now=None):
+        self._refill(now or time.monotonic())
+        self.tokens -= 1
+
+    def time_to_full(self, now=None):
+        self._refill(now or time.monotonic())
+        return (self.capacity - self.tokens) / self.rate
+
+    @property
+    def full(self):
+        return self.time_to_full() <= 0
+
+
+def command_key(text):
+    """
+    Normalizes a command, so variants like "/Price@kaspa_bot 7" and "/price" share one limit
+    """
+    command = text.split(maxsplit=1)[0] if text and text.strip() else ""
+    return command.split("@")[0].lower()
+
+
+class RateLimiter(object):
+    """
+    Token bucket per chat and command. A bucket is dropped as soon as it is full again, because a
+    full bucket is the same as a new one, so memory only holds the recently limited commands.
+    """
+
+    def __init__(self, maxsize=100_000):
+        self._buckets = TLRUCache(maxsize, self._time_to_full, timer=time.monotonic)
+        self.allowed = Counter()
+        self.suppressed = Counter()
+
+    @staticmethod
+    def _time_to_full(key, bucket, now):
+        return now + bucket.time_to_full(now)
+
+    def allow(self, chat_id, text, seconds, burst=1, force=False):
+        """
+        Takes a token for the command in the chat
+        :param seconds: one token is refilled every `seconds`
+        :param burst: number of commands allowed in a row
+        :param force: take a token even if none is left (e.g. for admins), the command is allowed
+        :return: True if the command is allowed
+        """
+        command = command_key(text)
+        key = (chat_id, command)
+
+        if (bucket := self._buckets.get(key)) is None:
+            bucket = TokenBucket(1 / seconds, burst)
+
+        if bucket.delay() and not force:
+            self.suppressed[command] += 1
+            return False
+
+        bucket.take()
+        bucket.tokens = max(bucket.tokens, 0)
+        # re-inserted to update its expiry
+        self._buckets[key] = bucket
+        self.allowed[command] += 1
+        return True
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def stats(self):
+        return {"tracked": len(self._buckets),
+                "allowed": sum(self.allowed.values()),
+                "suppressed": sum(self.suppressed.values()),
+                "suppressed_by_command": dict(self.suppressed.most_common())}
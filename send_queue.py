@@ -0,0 +1,194 @@
+# encoding: utf-8
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+
+from ratelimit import TokenBucket
+
+_logger = logging.getLogger(__name__)
+
+# priorities, lower is sent first
+INTERACTIVE = 0
+BROADCAST = 1
+
+GLOBAL_RATE = float(os.getenv("SEND_RATE", 30))
+GROUP_RATE_PER_MIN = float(os.getenv("SEND_RATE_GROUP_PER_MIN", 20))
+
+
+def _retry_after(ex):
+    """
+    Seconds to wait if `ex` is a 429 of the Bot API, else None
+    """
+    if getattr(ex, "error_code", None) != 429:
+        return None
+
+    return (getattr(ex, "result_json", None) or {}).get("parameters", {}).get("retry_after", 5)
+
+
+class _Chat(object):
+    __slots__ = ("chat_id", "queue", "bucket", "blocked_until", "busy", "generation")
+
+    def __init__(self, chat_id, bucket):
+        self.chat_id = chat_id
+        self.queue = []  # heap of (priority, seq, item)
+        self.bucket = bucket
+        self.blocked_until = 0
+        self.busy = False
+        self.generation = 0
+
+
+class SendQueue(object):
+    """
+    Outbound dispatcher for messages to Telegram.
+
+    Every chat has its own queue and token bucket, a global bucket caps the total rate. The chat
+    whose budget allows a message and whose next message has the best priority is sent first, so a
+    throttled chat doesn't hold back the others and interactive replies overtake broadcasts.
+    Messages of one chat are sent one after another, a 429 pauses the chat for `retry_after` seconds.
+    """
+
+    def __init__(self, bot, global_rate=GLOBAL_RATE, group_rate=GROUP_RATE_PER_MIN / 60, group_burst=3,
+                 private_rate=1, private_burst=3, max_retries=3):
+        self._bot = bot
+        self._global = TokenBucket(global_rate, global_rate)
+        self._group_rate = group_rate
+        self._group_burst = group_burst
+        self._private_rate = private_rate
+        self._private_burst = private_burst
+        self._max_retries = max_retries
+
+        self._chats = {}
+        self._ready = []  # (priority, seq, generation, chat_id), chats allowed to send now
+        self._waiting = []  # (ready_at, seq, generation, chat_id), chats waiting for their budget
+        self._seq = itertools.count()
+        self._wake = asyncio.Event()
+
+    def __len__(self):
+        return sum(len(chat.queue) for chat in self._chats.values())
+
+    def _chat(self, chat_id):
+        if (chat := self._chats.get(chat_id)) is None:
+            # negative ids are groups and channels
+            bucket = TokenBucket(self._group_rate, self._group_burst) if chat_id < 0 \
+                else TokenBucket(self._private_rate, self._private_burst)
+            chat = self._chats[chat_id] = _Chat(chat_id, bucket)
+        return chat
+
+    def submit(self, method, chat_id, *args, priority=INTERACTIVE, **kwargs):
+        """
+        Queues a call of bot.`method`(chat_id, *args, **kwargs)
+        :return: future of the call's result
+        """
+        future = asyncio.get_running_loop().create_future()
+        # failures are logged by the queue, callers don't have to await the future
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+        chat = self._chat(chat_id)
+        heapq.heappush(chat.queue, (priority, next(self._seq), (future, method, args, kwargs, 0)))
+        self._schedule(chat)
+        return future
+
+    def send_message(self, chat_id, text, priority=INTERACTIVE, **kwargs):
+        return self.submit("send_message", chat_id, text, priority=priority, **kwargs)
+
+    def send_photo(self, chat_id, photo, priority=INTERACTIVE, **kwargs):
+        return self.submit("send_photo", chat_id, photo, priority=priority, **kwargs)
+
+    def _schedule(self, chat):
+        if chat.busy or not chat.queue:
+            return
+
+        now = time.monotonic()
+        ready_at = max(chat.blocked_until, now + chat.bucket.delay(now))
+        chat.generation += 1
+
+        if ready_at <= now:
+            heapq.heappush(self._ready, (chat.queue[0][0], next(self._seq), chat.generation, chat.chat_id))
+        else:
+            heapq.heappush(self._waiting, (ready_at, next(self._seq), chat.generation, chat.chat_id))
+
+        self._wake.set()
+
+    def _current(self, generation, chat_id):
+        chat = self._chats.get(chat_id)
+        return chat if chat is not None and chat.generation == generation and not chat.busy else None
+
+    def _promote(self):
+        now = time.monotonic()
+        while self._waiting and self._waiting[0][0] <= now:
+            _, _, generation, chat_id = heapq.heappop(self._waiting)
+            if (chat := self._current(generation, chat_id)) is not None:
+                self._schedule(chat)
+
+    def _pop_ready(self):
+        while self._ready:
+            _, _, generation, chat_id = heapq.heappop(self._ready)
+            if (chat := self._current(generation, chat_id)) is not None and chat.queue:
+                return chat
+
+    async def _send(self, chat, entry):
+        priority, seq, (future, method, args, kwargs, attempts) = entry
+        try:
+            result = await getattr(self._bot, method)(chat.chat_id, *args, **kwargs)
+        except Exception as ex:
+            retry_after = _retry_after(ex)
+            if retry_after is not None and attempts < self._max_retries and not future.cancelled():
+                _logger.warning(f'Flood limit for chat {chat.chat_id}, retrying in {retry_after}s.')
+                chat.blocked_until = time.monotonic() + retry_after
+                heapq.heappush(chat.queue, (priority, seq, (future, method, args, kwargs, attempts + 1)))
+            else:
+                _logger.warning(f'{method} to chat {chat.chat_id} failed: {ex}')
+                if not future.done():
+                    future.set_exception(ex)
+        else:
+            if not future.done():
+                future.set_result(result)
+        finally:
+            chat.busy = False
+            self._schedule(chat)
+
+    def _prune(self):
+        for chat_id in [chat_id for chat_id, chat in self._chats.items()
+                        if not chat.busy and not chat.queue and chat.bucket.full]:
+            del self._chats[chat_id]
+
+    async def _sleep(self, seconds):
+        self._wake.clear()
+        try:
+            await asyncio.wait_for(self._wake.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def run(self, prune_interval=60):
+        next_prune = time.monotonic() + prune_interval
+
+        while True:
+            self._promote()
+
+            if time.monotonic() >= next_prune:
+                self._prune()
+                next_prune = time.monotonic() + prune_interval
+
+            if not self._ready:
+                await self._sleep(max(self._waiting[0][0] - time.monotonic(), 0) if self._waiting else prune_interval)
+                continue
+
+            if delay := self._global.delay():
+                await self._sleep(delay)
+                continue
+
+            if (chat := self._pop_ready()) is None:
+                continue
+
+            entry = heapq.heappop(chat.queue)
+            if entry[2][0].cancelled():
+                self._schedule(chat)
+                continue
+
+            self._global.take()
+            chat.bucket.take()
+            chat.busy = True
+            asyncio.ensure_future(self._send(chat, entry))
@@ -0,0 +1,74 @@
+# encoding: utf-8
+import asyncio
+
+from cachetools import LRUCache
+
+
+class SingleFlight(object):
+    """
+    Concurrent calls for the same key share one in-flight call
+    """
+
+    def __init__(self):
+        self._in_flight = {}  # key -> task
+
+    def __contains__(self, key):
+        return key in self._in_flight
+
+    def __len__(self):
+        return len(self._in_flight)
+
+    async def _call(self, key, func, args):
+        try:
+            return await func(*args)
+        finally:
+            self._in_flight.pop(key, None)
+
+    def start(self, key, func, *args):
+        """
+        Starts `func(*args)` as task, unless a call for `key` is already running
+        :param func: async function
+        :return: the task of the running call
+        """
+        task = self._in_flight.get(key)
+        if task is None:
+            task = self._in_flight[key] = asyncio.ensure_future(self._call(key, func, args))
+        return task
+
+    async def call(self, key, func, *args):
+        """
+        :return: result of the running or a new call `func(*args)`
+        """
+        # shield the shared call, so a cancelled waiter doesn't cancel it for everybody
+        return await asyncio.shield(self.start(key, func, *args))
+
+
+class SingleFlightCache(object):
+    """
+    LRU cache of async results, concurrent misses for the same key share one call.
+    Errors are not cached.
+    """
+
+    def __init__(self, max_entries):
+        self._cache = LRUCache(max_entries)
+        self._flights = SingleFlight()
+
+    def __len__(self):
+        return len(self._cache)
+
+    async def _fetch(self, key, func, args):
+        # stored by the shared call, so the result is cached even if every waiter was cancelled
+        value = await func(*args)
+        self._cache[key] = value
+        return value
+
+    async def get(self, key, func, *args):
+        """
+        :param key: cache key, has to change whenever the result of `func(*args)` changes
+        :param func: async function computing the value on a miss
+        :return: the cached or computed value
+        """
+        if (value := self._cache.get(key)) is not None:
+            return value
+
+        return await self._flights.call(key, self._fetch, key, func, args)
@@ -0,0 +1,205 @@
+# encoding: utf-8
+import abc
+import asyncio
+import json
+import logging
+import os
+import time
+
+from ratelimit import RateLimiter, command_key
+
+_logger = logging.getLogger(__name__)
+
+
+class StateBackend(abc.ABC):
+    """
+    State shared by all bot workers: the command rate limits, idempotency keys, the queue of
+    sent txs waiting for their confirmation and the queue of broadcasts to start.
+    """
+
+    @abc.abstractmethod
+    async def allow(self, chat_id, text, seconds, burst=1, force=False):
+        """
+        Takes a token of the command's rate limit, see ratelimit.RateLimiter.allow
+        :return: True if the command is allowed
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def rate_limit_stats(self):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def claim(self, key, ttl=24 * 60 * 60):
+        """
+        Claims an idempotency key, e.g. of a tip command
+        :return: True for the first claim of `key` within `ttl` seconds, else False
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def push_pending_tx(self, tx_id, payload):
+        """
+        Queues a sent tx for the confirmation scanner
+        :param payload: json serializable dict
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def pop_pending_tx(self, timeout):
+        """
+        :return: (tx_id, payload) or None if no tx was queued within `timeout` seconds
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def push_broadcast(self, payload):
+        """
+        Queues a broadcast for the worker running them
+        :param payload: json serializable dict
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def pop_broadcast(self, timeout):
+        """
+        :return: payload or None if no broadcast was queued within `timeout` seconds
+        """
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class MemoryBackend(StateBackend):
+    """
+    Keeps the state in the process, for a single bot worker
+    """
+
+    def __init__(self):
+        self._limiter = RateLimiter()
+        self._pending_txs = asyncio.Queue()
+        self._broadcasts = asyncio.Queue()
+        self._claims = {}  # key -> expiry
+
+    async def allow(self, chat_id, text, seconds, burst=1, force=False):
+        return self._limiter.allow(chat_id, text, seconds, burst, force)
+
+    async def rate_limit_stats(self):
+        return self._limiter.stats()
+
+    async def claim(self, key, ttl=24 * 60 * 60):
+        now = time.time()
+        if self._claims.get(key, 0) > now:
+            return False
+
+        # claims mostly share one ttl, so the expired ones are at the front
+        while self._claims and next(iter(self._claims.values())) <= now:
+            del self._claims[next(iter(self._claims))]
+
+        self._claims[key] = now + ttl
+        return True
+
+    async def push_pending_tx(self, tx_id, payload):
+        self._pending_txs.put_nowait((tx_id, payload))
+
+    async def pop_pending_tx(self, timeout):
+        try:
+            return await asyncio.wait_for(self._pending_txs.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def push_broadcast(self, payload):
+        self._broadcasts.put_nowait(payload)
+
+    async def pop_broadcast(self, timeout):
+        try:
+            return await asyncio.wait_for(self._broadcasts.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+# token bucket, stored as hash (tokens, updated) which expires when the bucket is full again
+TOKEN_BUCKET_SCRIPT = """
+local rate, burst, now, force = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), ARGV[4] == "1"
+local bucket = redis.call("HMGET", KEYS[1], "tokens", "updated")
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+
+tokens = math.min(burst, tokens + math.max(now - updated, 0) * rate)
+
+if tokens < 1 and not force then
+    redis.call("HINCRBY", KEYS[2], ARGV[5], 1)
+    return 0
+end
+
+tokens = math.max(tokens - 1, 0)
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "updated", tostring(now))
+redis.call("PEXPIRE", KEYS[1], math.ceil((burst - tokens) / rate * 1000) + 1)
+redis.call("HINCRBY", KEYS[3], ARGV[5], 1)
+return 1
+"""
+
+
+class RedisBackend(StateBackend):
+    """
+    Keeps the state in Redis (or any server speaking its protocol), so several workers share it.
+    Rate limits are checked atomically by a Lua script, pending txs and broadcasts are lists.
+    """
+
+    def __init__(self, url, prefix="kaspa_tg_bot:"):
+        # imported here, so redis is only needed if it is used
+        import redis.asyncio
+
+        self._redis = redis.asyncio.from_url(url)
+        self._prefix = prefix
+        self._token_bucket = self._redis.register_script(TOKEN_BUCKET_SCRIPT)
+
+    async def allow(self, chat_id, text, seconds, burst=1, force=False):
+        command = command_key(text)
+        return bool(await self._token_bucket(keys=[f"{self._prefix}ratelimit:{chat_id}:{command}",
+                                                   f"{self._prefix}ratelimit:suppressed",
+                                                   f"{self._prefix}ratelimit:allowed"],
+                                             args=[1 / seconds, burst, time.time(), int(force), command]))
+
+    async def rate_limit_stats(self):
+        suppressed = {command.decode(): int(count) for command, count in
+                      (await self._redis.hgetall(f"{self._prefix}ratelimit:suppressed")).items()}
+        allowed = await self._redis.hvals(f"{self._prefix}ratelimit:allowed")
+
+        return {"allowed": sum(int(count) for count in allowed),
+                "suppressed": sum(suppressed.values()),
+                "suppressed_by_command": dict(sorted(suppressed.items(), key=lambda item: -item[1]))}
+
+    async def claim(self, key, ttl=24 * 60 * 60):
+        return bool(await self._redis.set(f"{self._prefix}claim:{key}", 1, nx=True, ex=ttl))
+
+    async def push_pending_tx(self, tx_id, payload):
+        await self._redis.rpush(f"{self._prefix}pending_txs", json.dumps([tx_id, payload]))
+
+    async def pop_pending_tx(self, timeout):
+        # BLPOP takes whole seconds, 0 would block forever
+        if item := await self._redis.blpop([f"{self._prefix}pending_txs"], max(round(timeout), 1)):
+            tx_id, payload = json.loads(item[1])
+            return tx_id, payload
+
+    async def push_broadcast(self, payload):
+        await self._redis.rpush(f"{self._prefix}broadcasts", json.dumps(payload))
+
+    async def pop_broadcast(self, timeout):
+        if item := await self._redis.blpop([f"{self._prefix}broadcasts"], max(round(timeout), 1)):
+            return json.loads(item[1])
+
+    async def close(self):
+        await self._redis.aclose()
+
+
+def create_backend(redis_url=None):
+    """
+    Redis backend if REDIS_URL is set, else the in-memory backend
+    """
+    if redis_url := redis_url or os.getenv("REDIS_URL"):
+        _logger.info('Using Redis state backend.')
+        return RedisBackend(redis_url)
+
+    return MemoryBackend()
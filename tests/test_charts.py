@@ -0,0 +1,17 @@
+# encoding: utf-8
+import pytest
+
+from charts import render_market_chart
+
+
+@pytest.mark.parametrize("prices", [[], [[1700000000000, None]], [[1700000000000, float("nan")]] * 3],
+                         ids=["empty", "none", "all-nan"])
+def test_no_prices_raises_value_error(prices):
+    with pytest.raises(ValueError):
+        render_market_chart("pillow", prices, 1)
+
+
+def test_renders_png_skipping_nan():
+    prices = [[1700000000000 + i * 300_000, 0.1 + i / 1000] for i in range(50)] + [[1700015000000, None]]
+
+    assert render_market_chart("pillow", prices, 1).startswith(b"\x89PNG")
@@ -0,0 +1,112 @@
+# encoding: utf-8
+import asyncio
+
+from kaspad_notifications import KaspadNotifier
+from tx_scanner import TxConfirmationScanner
+
+
+class FakeClient(object):
+    """
+    Stands in for kaspy's RPC client, the test sends the notifications through `notify`
+    """
+
+    instances = []
+
+    def __init__(self):
+        self.callbacks = {}
+        self.host = None
+        self.closed = False
+        FakeClient.instances.append(self)
+
+    def connect(self, host, port):
+        self.host = (host, port)
+
+    def subscribe(self, request, callback):
+        self.callbacks[request] = callback
+
+    def close(self):
+        self.closed = True
+
+    def notify(self, request, notification):
+        self.callbacks[request](notification)
+
+
+async def _wait_for(condition, timeout=2):
+    async def wait():
+        while not condition():
+            await asyncio.sleep(0.01)
+
+    await asyncio.wait_for(wait(), timeout)
+
+
+def test_notifications_confirm_pending_tx_and_update_daa_score():
+    confirmed = []
+
+    async def fetch_tip():
+        raise AssertionError('pushed blocks must not be polled')
+
+    async def on_confirmed(tx_id, block_hash, payload, seconds):
+        confirmed.append((tx_id, block_hash, payload))
+
+    async def main():
+        FakeClient.instances.clear()
+        scanner = TxConfirmationScanner(fetch_tip, fetch_tip, on_confirmed)
+        notifier = KaspadNotifier([("localhost", 16110)], tx_scanner=scanner, client_factory=FakeClient,
+                                  reconnect_delay=0)
+        scanner.add("tx1", {"chat_id": 1})
+
+        task = asyncio.ensure_future(notifier.run())
+        try:
+            await _wait_for(lambda: notifier.connected)
+            cli, = FakeClient.instances
+            assert cli.host == ("localhost", 16110)
+            assert scanner.push_active
+
+            cli.notify("notifyVirtualDaaScoreChangedRequest",
+                       {"virtualDaaScoreChangedNotification": {"virtualDaaScore": "123"}})
+            cli.notify("notifyBlockAddedRequest",
+                       {"blockAddedNotification": {"block": {
+                           "verboseData": {"hash": "b1"},
+                           "transactions": [{"verboseData": {"transactionId": "tx0"}},
+                                            {"verboseData": {"transactionId": "tx1"}}]}}})
+
+            await _wait_for(lambda: confirmed)
+            assert confirmed == [("tx1", "b1", {"chat_id": 1})]
+            assert notifier.daa_score == 123
+            assert notifier.tip_hash == "b1"
+            assert len(scanner) == 0
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+        assert not notifier.connected
+        assert not scanner.push_active
+        assert cli.closed
+
+    asyncio.run(main())
+
+
+def test_reconnects_to_next_host_after_failure():
+    hosts = []
+
+    class FailingClient(FakeClient):
+        def connect(self, host, port):
+            hosts.append(host)
+            if host == "down":
+                raise ConnectionError()
+            super().connect(host, port)
+
+    async def main():
+        FakeClient.instances.clear()
+        notifier = KaspadNotifier([("down", 16110), ("up", 16110)], client_factory=FailingClient,
+                                  reconnect_delay=0)
+
+        task = asyncio.ensure_future(notifier.run())
+        try:
+            await _wait_for(lambda: notifier.connected)
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(main())
+    assert hosts == ["down", "up"]
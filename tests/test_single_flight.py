@@ -0,0 +1,70 @@
+# encoding: utf-8
+import asyncio
+
+import pytest
+
+from single_flight import SingleFlight, SingleFlightCache
+
+
+def test_concurrent_calls_share_one_call():
+    calls = []
+
+    async def compute(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value * 2
+
+    async def main():
+        flights = SingleFlight()
+        results = await asyncio.gather(*(flights.call("key", compute, 21) for _ in range(5)))
+        assert "key" not in flights
+        return results
+
+    assert asyncio.run(main()) == [42] * 5
+    assert calls == [21]
+
+
+def test_cancelled_waiter_does_not_cancel_the_call():
+    async def main():
+        cache = SingleFlightCache(2)
+        done = asyncio.Event()
+
+        async def compute():
+            await done.wait()
+            return "png"
+
+        first = asyncio.ensure_future(cache.get("key", compute))
+        second = asyncio.ensure_future(cache.get("key", compute))
+        await asyncio.sleep(0)
+        first.cancel()
+        done.set()
+
+        assert await second == "png"
+        assert first.cancelled()
+
+    asyncio.run(main())
+
+
+def test_cache_keeps_results_not_errors():
+    calls = []
+
+    async def compute(fail):
+        calls.append(fail)
+        if fail:
+            raise ValueError()
+        return len(calls)
+
+    async def main():
+        cache = SingleFlightCache(2)
+        with pytest.raises(ValueError):
+            await cache.get("a", compute, True)
+
+        assert await cache.get("a", compute, False) == 2
+        assert await cache.get("a", compute, False) == 2
+
+        # least recently used entry is evicted
+        await cache.get("b", compute, False)
+        await cache.get("c", compute, False)
+        assert await cache.get("a", compute, False) == 5
+
+    asyncio.run(main())
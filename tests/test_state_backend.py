@@ -0,0 +1,126 @@
+# encoding: utf-8
+"""
+Runs every state backend through the same cases. The Redis backend is tested against the server
+at REDIS_TEST_URL if set, else against fakeredis if installed.
+"""
+import asyncio
+import os
+import uuid
+
+import pytest
+
+from state_backend import MemoryBackend, RedisBackend
+
+
+def _memory_backend(monkeypatch):
+    return MemoryBackend
+
+
+def _fakeredis_backend(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa", reason="fakeredis needs lupa to run Lua scripts")
+    monkeypatch.setattr("redis.asyncio.from_url", lambda url: fakeredis.FakeAsyncRedis())
+    return lambda: RedisBackend("redis://fake", prefix=f"test:{uuid.uuid4().hex}:")
+
+
+def _redis_backend(monkeypatch):
+    pytest.importorskip("redis")
+    if not (url := os.getenv("REDIS_TEST_URL")):
+        pytest.skip("REDIS_TEST_URL not set")
+    return lambda: RedisBackend(url, prefix=f"test:{uuid.uuid4().hex}:")
+
+
+@pytest.fixture(params=[_memory_backend, _fakeredis_backend, _redis_backend], ids=["memory", "fakeredis", "redis"])
+def run(request, monkeypatch):
+    """
+    :return: function(test) running the async test(backend) with a new backend
+    """
+    create_backend = request.param(monkeypatch)
+
+    def run_test(test):
+        async def main():
+            backend = create_backend()
+            try:
+                await test(backend)
+            finally:
+                await backend.close()
+
+        asyncio.run(main())
+
+    return run_test
+
+
+def test_allow_burst_then_deny(run):
+    async def test(backend):
+        assert await backend.allow(1, "/price", 60, burst=2)
+        assert await backend.allow(1, "/Price@kaspa_bot 7", 60, burst=2)
+        assert not await backend.allow(1, "/price", 60, burst=2)
+
+        # other chats and commands have their own limits
+        assert await backend.allow(2, "/price", 60, burst=2)
+        assert await backend.allow(1, "/mcap", 60, burst=2)
+
+        stats = await backend.rate_limit_stats()
+        assert stats["allowed"] == 4
+        assert stats["suppressed"] == 1
+        assert stats["suppressed_by_command"] == {"/price": 1}
+
+    run(test)
+
+
+def test_force_allows_without_tokens(run):
+    async def test(backend):
+        assert await backend.allow(1, "/price", 60)
+        assert not await backend.allow(1, "/price", 60)
+        assert await backend.allow(1, "/price", 60, force=True)
+
+    run(test)
+
+
+def test_tokens_refill(run):
+    async def test(backend):
+        assert await backend.allow(1, "/price", 0.2)
+        assert not await backend.allow(1, "/price", 0.2)
+        await asyncio.sleep(0.3)
+        assert await backend.allow(1, "/price", 0.2)
+
+    run(test)
+
+
+def test_claim_once(run):
+    async def test(backend):
+        assert await backend.claim("tip:1:2")
+        assert not await backend.claim("tip:1:2")
+        assert await backend.claim("tip:1:3")
+
+    run(test)
+
+
+def test_pending_txs_pop_in_push_order(run):
+    async def test(backend):
+        await backend.push_pending_tx("tx1", {"chat_id": 1})
+        await backend.push_pending_tx("tx2", {"chat_id": 2})
+
+        assert await backend.pop_pending_tx(1) == ("tx1", {"chat_id": 1})
+        assert await backend.pop_pending_tx(1) == ("tx2", {"chat_id": 2})
+
+    run(test)
+
+
+def test_broadcasts_pop_in_push_order(run):
+    async def test(backend):
+        await backend.push_broadcast({"text": "first"})
+        await backend.push_broadcast({"text": "second", "reply_to": [1, None]})
+
+        assert await backend.pop_broadcast(1) == {"text": "first"}
+        assert await backend.pop_broadcast(1) == {"text": "second", "reply_to": [1, None]}
+
+    run(test)
+
+
+def test_pop_empty_queue_times_out(run):
+    async def test(backend):
+        assert await backend.pop_pending_tx(0.1) is None
+        assert await backend.pop_broadcast(0.1) is None
+
+    run(test)
@@ -0,0 +1,63 @@
+# encoding: utf-8
+import asyncio
+import logging
+from collections import deque
+
+_logger = logging.getLogger(__name__)
+
+
+class TipQueue(object):
+    """
+    Runs the wallet transactions of tips and withdrawals.
+
+    Jobs of one sender run strictly one after another, so they don't spend the same UTXOs, jobs
+    of different senders run in parallel, at most `concurrency` at a time towards the wallet API.
+    Every job has an idempotency key (e.g. chat and message id of the command), a key claimed
+    before is never run again.
+    """
+
+    def __init__(self, claim, concurrency=8):
+        """
+        :param claim: async function(key) returning True only for the first claim of a key
+        """
+        self._claim = claim
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._queues = {}  # sender -> deque of (job, future)
+
+    def __len__(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def submit(self, key, sender, job):
+        """
+        Queues `job` behind the sender's other jobs
+        :param job: async function without arguments, e.g. a functools.partial
+        :return: future of the job's result, None if the key was claimed before
+        """
+        if not await self._claim(key):
+            _logger.info(f'Job {key} was submitted before, skipping it.')
+            return None
+
+        future = asyncio.get_running_loop().create_future()
+        # failures are handled by the jobs or logged here, callers don't have to await the future
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+        if (queue := self._queues.get(sender)) is None:
+            queue = self._queues[sender] = deque()
+            asyncio.ensure_future(self._run_sender(sender, queue))
+
+        queue.append((job, future))
+        return future
+
+    async def _run_sender(self, sender, queue):
+        try:
+            while queue:
+                job, future = queue[0]
+                async with self._semaphore:
+                    try:
+                        future.set_result(await job())
+                    except Exception as ex:
+                        _logger.exception(f'Job of {sender} failed')
+                        future.set_exception(ex)
+                queue.popleft()
+        finally:
+            del self._queues[sender]
@@ -3,9 +3,10 @@ import logging
 import os
 import uuid
 
-import aiohttp
 from aiohttp import BasicAuth
 
+import http_client
+
 _logger = logging.getLogger(__name__)
 
 
@@ -39,17 +40,16 @@ def get_wallet_pw(username):
 
 # Kaspa REST wallet functions
 async def get_wallet(uuid, password=None):
-    async with aiohttp.ClientSession() as session:
-        async with session.get(f'https://kaspagames.org/api/wallets/{uuid}',
+    async with http_client.get(f'https://kaspagames.org/api/wallets/{uuid}',
                                auth=BasicAuth("0", password) if password else None) as resp:
-            if resp.status == 404:
-                raise WalletNotFoundError()
+        if resp.status == 404:
+            raise WalletNotFoundError()
 
-            if resp.status == 403:
-                raise WalletPasswordIncorrectError()
+        if resp.status == 403:
+            raise WalletPasswordIncorrectError()
 
-            if resp.status == 200:
-                return await resp.json()
+        if resp.status == 200:
+            return await resp.json()
 
 
 async def create_new_wallet(password, uuid=None):
@@ -60,13 +60,12 @@ async def create_new_wallet(password, uuid=None):
     if uuid:
         data["uuid"] = uuid
 
-    async with aiohttp.ClientSession() as session:
-        async with session.post(f'https://kaspagames.org/api/wallets', json=data) as resp:
-            if resp.status == 400:
-                raise WalletCreationError(resp.content)
+    async with http_client.post(f'https://kaspagames.org/api/wallets', json=data) as resp:
+        if resp.status == 400:
+            raise WalletCreationError(resp.content)
 
-            if resp.status == 200:
-                return await resp.json()
+        if resp.status == 200:
+            return await resp.json()
 
 
 async def create_tx(uuid, password, to_address, amount, inclusiveFee=False):
@@ -78,12 +77,11 @@ async def create_tx(uuid, password, to_address, amount, inclusiveFee=False):
         "inclusiveFee": inclusiveFee
     }
 
-    async with aiohttp.ClientSession() as session:
-        async with session.post(f'https://kaspagames.org/api/wallets/{uuid}/transactions',
+    async with http_client.post(f'https://kaspagames.org/api/wallets/{uuid}/transactions',
                                 json=data,
                                 auth=BasicAuth("0", password)) as r:
-            resp = r
-            content = (await r.content.read()).decode()
+        resp = r
+        content = (await r.content.read()).decode()
 
     if resp.status == 400:
         _logger.info(f'TX creation error: {resp.content}')
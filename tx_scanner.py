@@ -0,0 +1,160 @@
+# encoding: utf-8
+import asyncio
+import logging
+import time
+
+_logger = logging.getLogger(__name__)
+
+
+class TxConfirmationScanner(object):
+    """
+    Confirms pending transactions from one stream of new blocks.
+
+    Every tick fetches the blocks after a low-hash cursor once, matches their transaction ids against
+    the pending ones and moves the cursor forward. The cost doesn't depend on the number of pending txs.
+    """
+
+    def __init__(self, fetch_tip, fetch_blocks, on_confirmed, on_expired=None,
+                 interval=0.5, max_interval=5, idle_interval=10, timeout=10 * 60, recent_window=2 * 60):
+        """
+        :param fetch_tip: async function returning a current tip hash
+        :param fetch_blocks: async function(low_hash) returning the blocks after low_hash (with verboseData)
+        :param on_confirmed: async function(tx_id, block_hash, payload, seconds_needed)
+        :param on_expired: async function(tx_id, payload), called for txs not found within `timeout` seconds
+        """
+        self._fetch_tip = fetch_tip
+        self._fetch_blocks = fetch_blocks
+        self._on_confirmed = on_confirmed
+        self._on_expired = on_expired
+        self._interval = interval
+        self._max_interval = max_interval
+        self._idle_interval = idle_interval
+        self._timeout = timeout
+        self._recent_window = recent_window
+
+        self._pending = {}  # tx_id -> (added, payload)
+        self._recent = {}  # tx_id -> (seen, block_hash), for txs added after their block was scanned
+        self._cursor = None
+        self._errors = 0
+        self._wake = asyncio.Event()
+
+        # set while blocks are pushed (kaspad notifications), polling is only a safety net then
+        self.push_active = False
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, tx_id, payload):
+        if (recent := self._recent.get(tx_id)) is not None:
+            asyncio.ensure_future(self._confirm(tx_id, recent[1], time.time(), payload))
+            return
+
+        self._pending[tx_id] = (time.time(), payload)
+        self._wake.set()
+
+    async def _confirm(self, tx_id, block_hash, added, payload):
+        try:
+            await self._on_confirmed(tx_id, block_hash, payload, time.time() - added)
+        except Exception:
+            _logger.exception(f'Error handling confirmation of {tx_id}')
+
+    def _remember(self, tx_ids, block_hash):
+        now = time.time()
+        for tx_id in tx_ids:
+            self._recent[tx_id] = (now, block_hash)
+
+        # entries are in insertion order, drop the old ones from the front
+        forget_before = now - self._recent_window
+        while self._recent:
+            tx_id, (seen, _) = next(iter(self._recent.items()))
+            if seen >= forget_before:
+                break
+            del self._recent[tx_id]
+
+    async def process_blocks(self, blocks):
+        """
+        Resolves pending txs included in the given blocks
+        :return: number of confirmed txs
+        """
+        confirmed = 0
+
+        for block in blocks:
+            block_hash = block["verboseData"]["hash"]
+            tx_ids = block["verboseData"]["transactionIds"]
+            self._remember(tx_ids, block_hash)
+
+            for tx_id in tx_ids:
+                if (entry := self._pending.pop(tx_id, None)) is not None:
+                    confirmed += 1
+                    await self._confirm(tx_id, block_hash, *entry)
+
+        return confirmed
+
+    async def _expire(self):
+        expire_before = time.time() - self._timeout
+
+        for tx_id, (added, payload) in list(self._pending.items()):
+            if added < expire_before:
+                self._pending.pop(tx_id, None)
+                _logger.info(f'TX {tx_id} not found in {self._timeout}s, giving up.')
+                if self._on_expired:
+                    try:
+                        await self._on_expired(tx_id, payload)
+                    except Exception:
+                        _logger.exception(f'Error handling expiry of {tx_id}')
+
+    async def scan(self):
+        """
+        Fetches the new blocks once and advances the cursor
+        :return: number of confirmed txs
+        """
+        if self._cursor is None:
+            self._cursor = await self._fetch_tip()
+
+        try:
+            blocks = (await self._fetch_blocks(self._cursor))["blocks"]
+            self._errors = 0
+        except Exception:
+            self._errors += 1
+            if self._errors >= 3:
+                # cursor might be unknown to the node (pruned), start again from the tip
+                self._cursor = None
+            raise
+
+        confirmed = await self.process_blocks(blocks)
+
+        if blocks:
+            self._cursor = blocks[-1]["verboseData"]["hash"]
+
+        return confirmed
+
+    async def _sleep(self, seconds):
+        self._wake.clear()
+        try:
+            await asyncio.wait_for(self._wake.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def run(self):
+        interval = self._interval
+
+        while True:
+            confirmed = 0
+            try:
+                confirmed = await self.scan()
+            except Exception:
+                _logger.exception('Error scanning blocks for pending TXs')
+
+            await self._expire()
+
+            if not self._pending or self.push_active:
+                # keep the cursor close to the tip, so new txs are found in the next scan
+                interval = self._interval
+                await self._sleep(self._idle_interval)
+                continue
+
+            # back off while nothing is found, a new tx resets the interval
+            interval = self._interval if confirmed else min(interval * 2, self._max_interval)
+            await self._sleep(interval)
+            if self._wake.is_set():
+                interval = self._interval
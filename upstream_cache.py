@@ -0,0 +1,80 @@
+# encoding: utf-8
+import asyncio
+import functools
+import logging
+import time
+
+from single_flight import SingleFlight
+
+_logger = logging.getLogger(__name__)
+
+
+def _log_exception(task):
+    if not task.cancelled() and task.exception() is not None:
+        _logger.warning(f'Background refresh failed: {task.exception()!r}')
+
+
+def cached(ttl, stale_ttl=None, error_ttl=5):
+    """
+    Caches the result of an async function per arguments.
+
+    * concurrent misses for the same key share one in-flight call (single flight)
+    * after `ttl` the value is still served for `stale_ttl` seconds while it is refreshed in the background
+    * errors are cached for `error_ttl` seconds, so a failing upstream isn't hammered
+
+    :param ttl: seconds a value is fresh
+    :param stale_ttl: seconds an expired value may still be served (default: ttl)
+    :param error_ttl: seconds an error is cached
+    """
+    stale_ttl = ttl if stale_ttl is None else stale_ttl
+
+    def decorator(func):
+        entries = {}  # key -> (fresh_until, stale_until, value, (error, traceback) or None)
+        flights = SingleFlight()
+
+        async def fetch(key, args, kwargs):
+            try:
+                value = await func(*args, **kwargs)
+                now = time.time()
+                entries[key] = (now + ttl, now + ttl + stale_ttl, value, None)
+                return value
+            except Exception as e:
+                now = time.time()
+                entry = entries.get(key)
+                if entry and entry[3] is None and entry[1] > now:
+                    # keep serving the old value, but don't retry before error_ttl passed
+                    entries[key] = (now + error_ttl, entry[1], entry[2], None)
+                else:
+                    entries[key] = (now + error_ttl, now + error_ttl, None, (e, e.__traceback__))
+                raise
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            entry = entries.get(key)
+            now = time.time()
+
+            if entry is not None:
+                fresh_until, stale_until, value, error = entry
+
+                if now < fresh_until:
+                    if error is not None:
+                        # the traceback of the failed call, it would grow with every raise otherwise
+                        raise error[0].with_traceback(error[1])
+                    return value
+
+                if now < stale_until and error is None:
+                    if key not in flights:
+                        # nobody awaits a background refresh, log its error once
+                        flights.start(key, fetch, key, args, kwargs).add_done_callback(_log_exception)
+                    return value
+
+            return await flights.call(key, fetch, key, args, kwargs)
+
+        def cache_clear():
+            entries.clear()
+
+        wrapper.cache_clear = cache_clear
+        return wrapper
+
+    return decorator
@@ -0,0 +1,151 @@
+# encoding: utf-8
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+
+from cachetools import TTLCache
+
+from tipping import get_wallet, username_to_uuid, WalletNotFoundError
+
+_logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS wallets (
+    user_id TEXT PRIMARY KEY,
+    uuid TEXT NOT NULL,
+    address TEXT NOT NULL,
+    created REAL
+);
+"""
+
+
+class WalletIndex(object):
+    """
+    Telegram user id -> (wallet uuid, public address) of the tipping wallets.
+
+    The address of a wallet never changes, so it is stored in SQLite once known and resolved
+    locally afterwards. Users without wallet are remembered for `negative_ttl` seconds.
+    """
+
+    def __init__(self, path, fetch_wallet=get_wallet, negative_ttl=60, max_negative=10_000):
+        """
+        :param fetch_wallet: async function(uuid) returning the wallet, raises WalletNotFoundError
+        """
+        self._path = path
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._fetch_wallet = fetch_wallet
+
+        self._wallets = {}
+        self._no_wallet = TTLCache(max_negative, negative_ttl)
+
+    def open(self):
+        """
+        Connects the database. Call it in the process using the index, a SQLite connection must
+        not be inherited by forked processes.
+        """
+        self._db = sqlite3.connect(self._path, check_same_thread=False)
+
+        with self._db_lock, self._db:
+            self._db.executescript(SCHEMA)
+            self._wallets.update((user_id, (wallet_uuid, address)) for user_id, wallet_uuid, address in
+                                 self._db.execute("SELECT user_id, uuid, address FROM wallets"))
+
+    def __len__(self):
+        return len(self._wallets)
+
+    def _read(self, user_id):
+        with self._db_lock:
+            return self._db.execute("SELECT uuid, address FROM wallets WHERE user_id = ?", (user_id,)).fetchone()
+
+    def _read_many(self, user_ids):
+        with self._db_lock:
+            return self._db.execute(f"SELECT user_id, uuid, address FROM wallets WHERE user_id IN "
+                                    f"({', '.join('?' * len(user_ids))})", user_ids).fetchall()
+
+    def _write(self, user_id, wallet_uuid, address):
+        with self._db_lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO wallets (user_id, uuid, address, created) VALUES (?, ?, ?, ?)",
+                             (user_id, wallet_uuid, address, time.time()))
+
+    async def remember(self, user_id, address):
+        """
+        Adds a wallet, e.g. right after it was created
+        """
+        user_id = str(user_id)
+        wallet_uuid = username_to_uuid(user_id)
+
+        self._wallets[user_id] = (wallet_uuid, address)
+        self._no_wallet.pop(user_id, None)
+        await asyncio.get_running_loop().run_in_executor(None, self._write, user_id, wallet_uuid, address)
+
+    async def lookup(self, user_id):
+        """
+        :return: (wallet uuid, public address)
+        :raise WalletNotFoundError: if the user has no wallet
+        """
+        user_id = str(user_id)
+
+        if (wallet := self._wallets.get(user_id)) is not None:
+            return wallet
+
+        if user_id in self._no_wallet:
+            raise WalletNotFoundError()
+
+        # another worker might have added it
+        if (wallet := await asyncio.get_running_loop().run_in_executor(None, self._read, user_id)) is not None:
+            self._wallets[user_id] = wallet
+            return wallet
+
+        return await self._fetch(user_id)
+
+    async def _fetch(self, user_id):
+        try:
+            address = (await self._fetch_wallet(username_to_uuid(user_id)))["publicAddress"]
+        except WalletNotFoundError:
+            self._no_wallet[user_id] = True
+            raise
+
+        await self.remember(user_id, address)
+        return self._wallets[user_id]
+
+    async def address(self, user_id):
+        """
+        :return: public address of the user's wallet
+        :raise WalletNotFoundError: if the user has no wallet
+        """
+        return (await self.lookup(user_id))[1]
+
+    async def addresses(self, user_ids):
+        """
+        Resolves many users at once: known ones from memory, the others with one SQLite query and
+        concurrent wallet API requests for the rest
+        :return: dict user id (str) -> public address of the users having a wallet
+        """
+        user_ids = [str(user_id) for user_id in user_ids]
+        found = {user_id: self._wallets[user_id][1] for user_id in user_ids if user_id in self._wallets}
+
+        if missing := [user_id for user_id in user_ids if user_id not in found and user_id not in self._no_wallet]:
+            for user_id, wallet_uuid, address in await asyncio.get_running_loop().run_in_executor(
+                    None, self._read_many, missing):
+                self._wallets[user_id] = (wallet_uuid, address)
+                found[user_id] = address
+
+            missing = [user_id for user_id in missing if user_id not in found]
+            for user_id, wallet in zip(missing, await asyncio.gather(*map(self._fetch, missing),
+                                                                     return_exceptions=True)):
+                if isinstance(wallet, WalletNotFoundError):
+                    continue
+                if isinstance(wallet, Exception):
+                    _logger.warning(f'Could not resolve wallet of {user_id}: {wallet!r}')
+                    continue
+                found[user_id] = wallet[1]
+
+        return found
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None